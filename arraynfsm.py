@@ -0,0 +1,222 @@
+#!/bin/env python3
+
+"""
+arraynfsm.py - NumPy backed chain engine.
+
+The regex is expanded into chains exactly like nfsm.NFSM does, but the
+surviving chains are stored as one 2-D array of alphabet bitmasks, with a
+row per chain and a column per slot. Constraining, peeking and matching are
+then a few vectorized operations over a column or the whole array, instead
+of Python loops over the chains.
+
+Requires NumPy. Alphabets of more than 64 characters don't fit in a column
+of uint64 bitmasks and raise nfsm.UnsupportedSyntax.
+"""
+
+import numpy as np
+
+from nfsm import NFSM, Charsets, UnsupportedSyntax
+
+class ArrayNFSM:
+    """Matches strings of a fixed length against a regex, like nfsm.NFSM,
+    with the chains held in a NumPy array.
+
+    self._masks is an array of shape (number of chains, length) holding the
+    bitmask of each slot of each surviving chain. Backreferences are kept in
+    self._roots, an array of the same shape: for each chain and slot, the
+    first slot of that chain that must hold the same character. Slots that
+    aren't linked to anything are their own root.
+
+    Both arrays are never modified in place. Every change builds new arrays
+    and drops the chains that died, so copies can share them and
+    checkpoint() only has to remember the arrays in use.
+
+    Slots are bitmasks internally whatever the mode, and are converted at
+    the edges: with bitmask false, peek_slot() returns frozensets like NFSM
+    does.
+
+    """
+    def __init__(self, regex, length, alphabet, bitmask=False):
+        self._load(NFSM(regex, length, alphabet, bitmask=True), bitmask)
+
+    @classmethod
+    def from_nfsm(cls, nfsm, bitmask=False):
+        """Builds an object from the surviving chains of an already compiled
+        NFSM, with slots in set or bitmask mode as given
+
+        """
+        self = cls.__new__(cls)
+        self._load(nfsm, bitmask)
+        return self
+
+    def _load(self, nfsm, bitmask):
+        """Fills in this object from the surviving chains of the given NFSM"""
+        self.length = length = nfsm.length
+        self.charsets = Charsets(nfsm.alphabet, bitmask)
+        self.alphabet = self.charsets.alphabet
+        self._bits = Charsets(nfsm.alphabet, bitmask=True)
+        if len(self._bits.bits) > 64:
+            raise UnsupportedSyntax("Alphabets of more than 64 characters are "
+                    "not supported by this engine")
+        if not nfsm.charsets.bitmask:
+            nfsm = NFSM.loads(nfsm.dumps(), bitmask=True)
+
+        chains = nfsm.chains
+        self._masks = np.array(chains, dtype=np.uint64).reshape(
+                len(chains), length)
+        roots = np.tile(np.arange(length, dtype=np.intp), (len(chains), 1))
+        for row, links in enumerate(nfsm.links):
+            if links is not None:
+                for group in links.values():
+                    roots[row, list(group)] = min(group)
+        self._roots = roots
+        self._linked = any(links is not None for links in nfsm.links)
+        self._trail = None
+
+    @property
+    def chains(self):
+        """The list of surviving chains, as lists of slot values"""
+        if self.charsets.bitmask:
+            return [[int(mask) for mask in row] for row in self._masks]
+        decode = self._bits.decode
+        return [[frozenset(decode(int(mask))) for mask in row]
+                for row in self._masks]
+
+    @property
+    def links(self):
+        """The links of each surviving chain, in the same order as chains. See
+        NFSM.
+
+        """
+        out = []
+        for row in self._roots:
+            groups = {}
+            for i, root in enumerate(row):
+                groups.setdefault(int(root), []).append(i)
+            links = None
+            for group in groups.values():
+                if len(group) > 1:
+                    if links is None:
+                        links = {}
+                    group = tuple(group)
+                    for i in group:
+                        links[i] = group
+            out.append(links)
+        return out
+
+    def encode(self, chars):
+        """Returns the slot value for the given collection of characters"""
+        return self.charsets.encode(chars)
+
+    def decode(self, value):
+        """Returns the set of characters for the given slot value"""
+        return self.charsets.decode(value)
+
+    def constrain_slot(self, index, charset):
+        """Narrows the given slot to the given set of characters. See
+        NFSM.constrain_slot()
+
+        """
+        mask = np.uint64(self._bits.encode(charset))
+        masks = self._masks
+        column = masks[:, index] & mask
+        if np.array_equal(column, masks[:, index]):
+            return
+
+        alive = column != 0
+        roots = self._roots
+        if self._trail is not None:
+            self._trail.append((masks, roots))
+        if alive.all():
+            masks = masks.copy()
+        else:
+            masks = masks[alive]
+            roots = roots[alive]
+            column = column[alive]
+        masks[:, index] = column
+
+        if self._linked:
+            # Narrow every slot that is a reference to this one
+            linked = roots == roots[:, index, None]
+            linked[:, index] = False
+            masks[linked] &= mask
+
+        self._masks = masks
+        self._roots = roots
+
+    def checkpoint(self):
+        """Starts logging changes, and returns a mark that can be passed to
+        rollback() to undo every change made after this call
+
+        """
+        if self._trail is None:
+            self._trail = []
+        return len(self._trail)
+
+    def rollback(self, mark):
+        """Undoes every change made since the checkpoint() call that returned
+        mark. Only has to put back the arrays that were in use then.
+
+        """
+        trail = self._trail
+        if len(trail) > mark:
+            self._masks, self._roots = trail[mark]
+            del trail[mark:]
+
+    def peek_slot(self, index):
+        """Returns the characters that are still possible in the given slot.
+        See NFSM.peek_slot()
+
+        """
+        value = int(np.bitwise_or.reduce(self._masks[:, index]))
+        if self.charsets.bitmask:
+            return value
+        return frozenset(self._bits.decode(value))
+
+    def match(self, matchstr):
+        """Returns True if the given string matches this regex and the
+        constraints placed on it. Doesn't change any state.
+
+        """
+        if len(matchstr) != self.length:
+            return False
+        keys = self._bits.keys
+        if not all(c in keys for c in matchstr):
+            return False
+        strkeys = np.array([keys[c] for c in matchstr], dtype=np.uint64)
+
+        # Every slot of a matching chain allows its character, and every
+        # slot holds the same character as its root
+        matches = ((self._masks & strkeys) != 0).all(axis=1)
+        if self._linked:
+            matches &= (strkeys[self._roots] == strkeys).all(axis=1)
+        return bool(matches.any())
+
+    def match_many(self, strings):
+        """Returns an iterator of True or False for each of the given strings,
+        like calling match() on each
+
+        """
+        for matchstr in strings:
+            yield self.match(matchstr)
+
+    def copy(self):
+        """Makes a copy of this object, including any constraints already
+        applied
+
+        """
+        newobj = self.__class__.__new__(self.__class__)
+        newobj.__dict__.update(self.__dict__)
+        # The arrays are never modified in place, so they can be shared. The
+        # copy starts without a trail, so it can't roll back past this point.
+        newobj._trail = None
+        return newobj
+
+    def __str__(self):
+        """Return normalized string representing this regex object. See
+        NFSM.__str__()
+
+        """
+        format = self._bits.format
+        return "|\n".join("".join(format(int(mask)) for mask in row)
+                for row in self._masks)
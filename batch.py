@@ -0,0 +1,260 @@
+#!/bin/env python3
+
+"""
+batch.py - Solves many puzzles from a JSONL file across a pool of processes.
+
+Each input line is a JSON object describing one puzzle:
+
+    {"id": "any JSON value", "alphabet": "ABC...",
+     "topology": {"shape": "hex", "sidelen": 7, "regexes": [...]}}
+
+See topology.Topology.from_dict() for the shapes. The alphabet defaults to
+the uppercase letters. Each puzzle gets a JSON object back, on a line of its
+own:
+
+    {"index": 0, "id": ..., "solutions": [[cell letters], ...]}
+
+where index is the line number of the puzzle in the input, counting puzzles
+only, and each solution has the letter of every cell, or null for cells no
+line covers. A puzzle that can't be read, compiled or solved gets an "error"
+instead of "solutions".
+
+Run "python batch.py puzzles.jsonl" to solve a file, or pipe puzzles into
+"python batch.py" to read them from stdin.
+"""
+
+import argparse
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import json
+import os
+import string
+import sys
+import time
+
+from nfsm import NFSM, Charsets, UnsupportedSyntax
+from topology import Topology
+import regexcrossword
+
+# How much memory the compiled regex objects kept around for the next
+# puzzles may take in each process, as estimated by estimated_bytes()
+CACHE_BYTES = regexcrossword.DEFAULT_MEMORY_LIMIT
+
+def _compile(regexstr, length, alphabet, engine="auto"):
+    """Returns the regex object for the given regex, line length and
+    alphabet, built with the named engine (see regexcrossword.engines) or
+    picked by regexcrossword.choose_engine() for "auto", falling back to the
+    chain engine for regexes the engine can't handle.
+
+    """
+    if engine == "auto":
+        engine = regexcrossword.choose_engine(regexstr, length, alphabet)[0]
+    try:
+        return regexcrossword.engines[engine](regexstr, length, alphabet,
+                bitmask=True)
+    except UnsupportedSyntax:
+        return NFSM(regexstr, length, alphabet, bitmask=True)
+
+def estimated_bytes(regex):
+    """Returns a rough guess at the memory a compiled regex object takes, at
+    regexcrossword.CHAIN_SLOT_BYTES for each slot of each chain, or each node
+    of the engines with layers of nodes
+
+    """
+    chains = getattr(regex, "_chains", getattr(regex, "_masks", None))
+    if chains is not None:
+        slots = len(chains) * regex.length
+    else:
+        slots = sum(len(layer) for layer in regex.layers)
+        linked = getattr(regex, "_linked", None)
+        if linked is not None:
+            slots += len(linked._chains) * linked.length
+    return slots * regexcrossword.CHAIN_SLOT_BYTES
+
+class CompiledCache:
+    """Compiled regex objects by (regex, length, alphabet, engine), shared
+    by every puzzle solved in this process. The least recently used are
+    dropped once their estimated_bytes() add up to more than max_bytes, and
+    objects bigger than that on their own are never kept.
+
+    The objects are shared, so never constrain one directly, only a copy().
+
+    self.stats counts hits, misses and evictions.
+
+    """
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self.stats = {
+                "hits": 0,
+                "misses": 0,
+                "evictions": 0,
+                }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, regexstr, length, alphabet, engine="auto"):
+        """Returns the regex object for the given regex, compiling it with
+        _compile() on a miss
+
+        """
+        key = (regexstr, length, alphabet, engine)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+        self.stats["misses"] += 1
+        regex = _compile(regexstr, length, alphabet, engine)
+        size = estimated_bytes(regex)
+        if size <= self.max_bytes:
+            self._entries[key] = (regex, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.stats["evictions"] += 1
+        return regex
+
+cache = CompiledCache()
+
+def set_cache_size(max_bytes):
+    """Replaces the cache with an empty one holding up to max_bytes"""
+    global cache
+    cache = CompiledCache(max_bytes)
+
+def solve_puzzle(puzzle, engine="auto", limit=1, timeout=None):
+    """Solves one puzzle, given as a dict like an input line, and returns
+    its result dict without the index. Errors in the puzzle are returned as
+    an "error" entry rather than raised.
+
+    If timeout is given, a search still going that many seconds after the
+    call is abandoned with a "timeout" error.
+
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    result = {"id": puzzle.get("id") if isinstance(puzzle, dict) else None}
+    try:
+        if not isinstance(puzzle, dict):
+            raise ValueError("Puzzle must be a JSON object")
+        alphabet = puzzle.get("alphabet", string.ascii_uppercase)
+        charsets = Charsets(alphabet, bitmask=True)
+        topology = Topology.from_dict(puzzle.get("topology"))
+        regexes = [cache.get(regexstr, length, alphabet, engine).copy()
+                for regexstr, length in topology.sizes()]
+    except (ValueError, TypeError) as e:
+        result["error"] = str(e)
+        return result
+
+    covered = [False] * topology.ncells
+    for _, cells in topology.lines:
+        for cell in cells:
+            covered[cell] = True
+    try:
+        solutions = regexcrossword.solve(topology, regexes, charsets, limit,
+                deadline)
+    except TimeoutError:
+        result["error"] = "timeout"
+        return result
+    result["solutions"] = [
+            ["".join(charsets.decode(value)) if covering else None
+                for value, covering in zip(solution, covered)]
+            for solution in solutions]
+    return result
+
+def _solve_job(index, line, engine, limit, timeout):
+    """Runs in a worker process. Parses and solves one input line. Any
+    exception is reported in the result, so one bad puzzle doesn't stop the
+    rest of the batch.
+
+    """
+    try:
+        puzzle = json.loads(line)
+    except ValueError as e:
+        return {"index": index, "id": None, "error": str(e)}
+    result = {"index": index}
+    try:
+        result.update(solve_puzzle(puzzle, engine, limit, timeout))
+    except Exception as e:
+        # A bug or a resource limit, not a problem with the puzzle
+        result["id"] = puzzle.get("id") if isinstance(puzzle, dict) else None
+        result["error"] = "{0}: {1}".format(type(e).__name__, e)
+    return result
+
+def solve_all(lines, workers=None, ordered=True, engine="auto", limit=1,
+        timeout=None):
+    """Solves the puzzle on each of the given JSON lines, skipping blank
+    ones, and yields a result dict for each, in input order if ordered is
+    true and as soon as each is done otherwise. See solve_puzzle() for
+    timeout.
+
+    The puzzles are spread over a process pool of the given number of
+    workers, defaulting to one per CPU. Only a few puzzles per worker are
+    read ahead, so lines can come from a stream. With one worker,
+    everything is solved in this process.
+
+    """
+    jobs = ((index, line) for index, line in
+            enumerate(line for line in lines if line.strip()))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for index, line in jobs:
+            yield _solve_job(index, line, engine, limit, timeout)
+        return
+
+    window = 4 * workers
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque() if ordered else set()
+        for index, line in jobs:
+            future = pool.submit(_solve_job, index, line, engine, limit,
+                    timeout)
+            if ordered:
+                pending.append(future)
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            else:
+                pending.add(future)
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+        if ordered:
+            for future in pending:
+                yield future.result()
+        else:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="Solves regex crosswords from a JSONL file")
+    parser.add_argument("input", nargs="?", default="-",
+            help="file with one puzzle per line, - for stdin (the default)")
+    parser.add_argument("-o", "--output", default="-",
+            help="where to write the results, - for stdout (the default)")
+    parser.add_argument("--engine", choices=sorted(regexcrossword.engines)
+            + ["auto"], default="auto")
+    parser.add_argument("--workers", type=int, default=None,
+            help="number of processes to solve with")
+    parser.add_argument("--unordered", action="store_true",
+            help="write results as soon as they are done instead of in "
+            "input order")
+    parser.add_argument("--limit", type=int, default=1,
+            help="maximum number of solutions per puzzle, 0 for all of them")
+    parser.add_argument("--timeout", type=float, default=None,
+            help="seconds a puzzle may take to solve")
+    args = parser.parse_args()
+
+    infile = sys.stdin if args.input == "-" else open(args.input)
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w")
+    with infile, outfile:
+        for result in solve_all(infile, args.workers, not args.unordered,
+                args.engine, args.limit or None, args.timeout):
+            outfile.write(json.dumps(result) + "\n")
+            outfile.flush()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+
+"""
+benchmark.py - Timings and peak memory for the compile, propagate and match
+hot paths, written out as JSON so runs can be compared between engines and
+commits.
+
+Run "python benchmark.py -o results.json" to benchmark, and
+"python benchmark.py --compare old.json new.json" to compare two runs.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import string
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from nfsm import Charsets, UnsupportedSyntax
+from hexgrid import HexGrid
+from topology import Topology, Board
+from propagate import Propagator
+from search import Search
+import regexcrossword
+
+ALPHABET = string.ascii_uppercase
+
+# Patterns for the synthetic compile benchmark, in the style of the puzzle
+# definitions. Each is compiled for every line length in SYNTHETIC_LENGTHS.
+SYNTHETIC = [
+        ".*H.*H.*",
+        "(RR|HHH)*.?",
+        "(O|RHH|MM)*",
+        "[^C]*[^R]*III.*",
+        "N.*X.X.X.*E",
+        ".*(.)C\\1X\\1.*",
+        ]
+SYNTHETIC_LENGTHS = range(7, 31)
+
+def measure(func, setup=None, repeat=5):
+    """Calls func repeat times and returns a dict with the fastest and median
+    time in seconds, plus the peak memory allocated by one more call, traced
+    separately so the tracing doesn't slow down the timed calls.
+
+    If setup is given, it is called before each call of func, untimed, and
+    func is passed its return value.
+
+    """
+    def call():
+        if setup is None:
+            start = time.perf_counter()
+            func()
+        else:
+            arg = setup()
+            start = time.perf_counter()
+            func(arg)
+        return time.perf_counter() - start
+
+    times = [call() for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+            "min": min(times),
+            "median": statistics.median(times),
+            "peak_bytes": peak,
+            }
+
+def _build(regex, length, engine):
+    return regexcrossword.engines[engine](regex, length, ALPHABET, bitmask=True)
+
+def _bundled_lengths():
+    return [length for _, length in
+            Topology.hex(7, regexcrossword.definitions).sizes()]
+
+def bench_compile(engines, repeat):
+    """Compiles every regex in regexcrossword.definitions"""
+    results = []
+    for engine in engines:
+        for regex, length in zip(regexcrossword.definitions, _bundled_lengths()):
+            record = {"benchmark": "compile", "engine": engine,
+                    "name": regex, "length": length}
+            try:
+                record.update(measure(lambda: _build(regex, length, engine),
+                    repeat=repeat))
+            except UnsupportedSyntax:
+                record["skipped"] = "unsupported"
+            results.append(record)
+    return results
+
+def bench_synthetic(engines, repeat, budget):
+    """Compiles the SYNTHETIC patterns for growing line lengths. Once a
+    pattern takes more than budget seconds at some length, the longer lengths
+    are skipped for that engine.
+
+    """
+    results = []
+    for engine in engines:
+        for regex in SYNTHETIC:
+            skip = None
+            for length in SYNTHETIC_LENGTHS:
+                record = {"benchmark": "synthetic", "engine": engine,
+                        "name": regex, "length": length}
+                results.append(record)
+                if skip is not None:
+                    record["skipped"] = skip
+                    continue
+                try:
+                    # A single untimed call first, so we don't sit through
+                    # several repeats of something way over budget
+                    start = time.perf_counter()
+                    _build(regex, length, engine)
+                    if time.perf_counter() - start > budget:
+                        skip = "over budget"
+                        record["skipped"] = skip
+                        continue
+                    record.update(measure(lambda: _build(regex, length, engine),
+                        repeat=repeat))
+                except UnsupportedSyntax:
+                    skip = "unsupported"
+                    record["skipped"] = skip
+    return results
+
+def _solution():
+    """Returns the solved string of each line of the bundled puzzle"""
+    lines, solution = solve(7, regexcrossword.definitions, "unrolled")
+    return ["".join(solution[cell] for cell in cells) for _, cells in lines]
+
+def bench_constrain_peek(engines, repeat, solution):
+    """For each line of the bundled puzzle, narrows the slots one at a time
+    to the solution letter plus a few others, peeking every slot after each
+    step
+
+    """
+    results = []
+    rng = random.Random(0)
+    for engine in engines:
+        for regex, answer in zip(regexcrossword.definitions, solution):
+            length = len(answer)
+            record = {"benchmark": "constrain_peek", "engine": engine,
+                    "name": regex, "length": length}
+            results.append(record)
+            try:
+                base = _build(regex, length, engine)
+            except UnsupportedSyntax:
+                record["skipped"] = "unsupported"
+                continue
+            steps = [(i, set(answer[i]) | set(rng.sample(ALPHABET, 3)))
+                    for i in rng.sample(range(length), length)]
+
+            def run(r):
+                for i, charset in steps:
+                    r.constrain_slot(i, charset)
+                    for j in range(length):
+                        r.peek_slot(j)
+            record.update(measure(run, setup=base.copy, repeat=repeat))
+    return results
+
+def bench_match(engines, repeat, solution, count):
+    """Matches count strings against each line of the bundled puzzle, with
+    match() one at a time and with match_many(). About half of the strings
+    are the solution with one letter changed, the rest are random.
+
+    """
+    results = []
+    rng = random.Random(0)
+    for engine in engines:
+        for regex, answer in zip(regexcrossword.definitions, solution):
+            length = len(answer)
+            try:
+                r = _build(regex, length, engine)
+            except UnsupportedSyntax:
+                for method in ("match", "match_many"):
+                    results.append({"benchmark": method, "engine": engine,
+                        "name": regex, "length": length,
+                        "skipped": "unsupported"})
+                continue
+
+            strings = []
+            for n in range(count):
+                if n % 2:
+                    s = list(answer)
+                    s[rng.randrange(length)] = rng.choice(ALPHABET)
+                    strings.append("".join(s))
+                else:
+                    strings.append("".join(rng.choice(ALPHABET)
+                        for _ in range(length)))
+
+            for method, func in (
+                    ("match", lambda: [r.match(s) for s in strings]),
+                    ("match_many", lambda: list(r.match_many(strings))),
+                    ):
+                record = {"benchmark": method, "engine": engine,
+                        "name": regex, "length": length}
+                record.update(measure(func, repeat=repeat))
+                record["strings_per_second"] = count / record["min"]
+                results.append(record)
+    return results
+
+def synthetic_definitions(sidelen, seed=0):
+    """Makes up a solvable puzzle for a hex grid of the given side length.
+
+    A random board over a few letters is generated, and each line gets a
+    regex in the style of the bundled definitions that its part of the board
+    matches.
+
+    """
+    rng = random.Random(seed)
+    letters = "ACEHMORX"
+    grid = HexGrid(sidelen, lambda: rng.choice(letters))
+    definitions = []
+    n = 2*sidelen - 1
+    for traverse in (grid.traverse_l2r, grid.traverse_ur2ll, grid.traverse_lr2ul):
+        for i in range(n):
+            s = "".join(traverse(i))
+            kind = rng.randrange(4)
+            if kind == 0:
+                j = rng.randrange(len(s)-1)
+                definitions.append(".*{0}.*".format(s[j:j+2]))
+            elif kind == 1:
+                definitions.append("[{0}]*".format("".join(sorted(set(s)))))
+            elif kind == 2:
+                definitions.append("{0}.*{1}".format(s[0], s[-1]))
+            else:
+                missing = sorted(set(letters) - set(s))[:3]
+                if missing:
+                    definitions.append("[^{0}]*".format("".join(missing)))
+                else:
+                    definitions.append(".*")
+    return definitions
+
+def solve(sidelen, definitions, engine):
+    """Solves a hex puzzle by propagation, then search if needed, compiling
+    in this process without a cache. Returns the (regexstr, cells) lines and
+    a dict mapping each cell index to its letter in the first solution.
+
+    """
+    charsets = Charsets(ALPHABET, bitmask=True)
+    topology = Topology.hex(sidelen, definitions)
+    board = Board([charsets.full] * topology.ncells)
+    lines = topology.lines
+    compiled = regexcrossword.compile_lines(topology.sizes(),
+            ALPHABET, engine, workers=1)
+    propagator = Propagator([(r, cells) for r, (_, cells) in zip(compiled, lines)],
+            board)
+    search = Search(propagator, board, charsets)
+    solutions = search.solve(1)
+    if not solutions:
+        raise ValueError("No solution")
+    return lines, {cell: "".join(charsets.decode(value))
+            for cell, value in zip(search.cells, solutions[0])}
+
+def bench_solve(engines, repeat, sidelens):
+    """Solves the bundled puzzle, and made up puzzles of the given side
+    lengths, from scratch
+
+    """
+    puzzles = [("bundled", 7, regexcrossword.definitions)]
+    for sidelen in sidelens:
+        puzzles.append(("synthetic", sidelen, synthetic_definitions(sidelen)))
+
+    results = []
+    for engine in engines:
+        for name, sidelen, definitions in puzzles:
+            record = {"benchmark": "solve", "engine": engine, "name": name,
+                    "length": sidelen}
+            record.update(measure(lambda: solve(sidelen, definitions, engine),
+                repeat=repeat))
+            results.append(record)
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(engines, repeat=5, budget=1.0, match_count=2000, sidelens=(3, 5, 9)):
+    """Runs every benchmark and returns the results as a JSON-able dict"""
+    solution = _solution()
+    results = []
+    results += bench_compile(engines, repeat)
+    results += bench_synthetic(engines, repeat, budget)
+    results += bench_constrain_peek(engines, repeat, solution)
+    results += bench_match(engines, repeat, solution, match_count)
+    results += bench_solve(engines, repeat, sidelens)
+    return {
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": repeat,
+                },
+            "results": results,
+            }
+
+def _key(record):
+    return (record["benchmark"], record["engine"], record["name"],
+            record["length"])
+
+def compare(old, new, threshold=0.1):
+    """Compares the fastest times of the records two runs have in common.
+    Returns a list of (key, old time, new time, ratio) tuples for the
+    records that got slower by more than threshold (a fraction).
+
+    """
+    oldrecords = {_key(r): r for r in old["results"] if "min" in r}
+    regressions = []
+    for record in new["results"]:
+        key = _key(record)
+        if "min" not in record or key not in oldrecords:
+            continue
+        ratio = record["min"] / oldrecords[key]["min"]
+        if ratio > 1 + threshold:
+            regressions.append((key, oldrecords[key]["min"], record["min"], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the solver")
+    parser.add_argument("-o", "--output", default=None,
+            help="file to write the JSON results to, instead of stdout")
+    parser.add_argument("--engine", action="append",
+            choices=sorted(regexcrossword.engines),
+            help="engine to benchmark, may be repeated (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0,
+            help="seconds a synthetic compile may take before longer lines "
+            "are skipped")
+    parser.add_argument("--quick", action="store_true",
+            help="fewer repeats and smaller inputs")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+            help="compare two result files instead of benchmarking")
+    parser.add_argument("--threshold", type=float, default=0.1,
+            help="slowdown that counts as a regression with --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        for key, oldtime, newtime, ratio in regressions:
+            print("{0:15} {1:9} {2:30} {3:3}  {4:.6f}s -> {5:.6f}s  x{6:.2f}".format(
+                *(key + (oldtime, newtime, ratio))))
+        print("{0} regression(s)".format(len(regressions)))
+        sys.exit(1 if regressions else 0)
+
+    engines = args.engine or sorted(regexcrossword.engines)
+    if args.quick:
+        results = run(engines, repeat=1, budget=min(args.budget, 0.2),
+                match_count=200, sidelens=(3,))
+    else:
+        results = run(engines, repeat=args.repeat, budget=args.budget)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/bin/env python3
+
+"""
+cache.py - Persistent on-disk cache of compiled NFSM objects.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+
+from nfsm import NFSM
+
+def default_directory():
+    """Returns the directory the cache uses when none is given"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "regexcrossword")
+
+class CompileCache:
+    """Caches compiled NFSM objects on disk, so a regex only has to be
+    compiled once for a given line length and alphabet.
+
+    Each entry is a file named after a hash of (regex, length, alphabet).
+    The file starts with the magic bytes and a header holding the cache
+    format version and the length of the key, then the key itself so hash
+    collisions can be detected, then the NFSM serialized with NFSM.dumps().
+
+    An entry that is corrupt, was written by a different version, or
+    belongs to a different key counts as a miss: the regex is recompiled and
+    the entry rewritten. Bump VERSION whenever a change to the compiler would
+    change its output.
+
+    Entries are evicted least recently used first once the total size of the
+    directory goes over max_bytes. A file's modification time is its last
+    use.
+
+    self.stats counts hits, misses, bad entries and evictions.
+
+    """
+    MAGIC = b"RXCC"
+    VERSION = 7
+    HEADER = struct.Struct("<BI")
+    SUFFIX = ".nfsm"
+
+    def __init__(self, directory=None, max_bytes=64*1024*1024):
+        self.directory = directory if directory is not None else default_directory()
+        self.max_bytes = max_bytes
+        self.stats = {
+                "hits": 0,
+                "misses": 0,
+                "bad entries": 0,
+                "evictions": 0,
+                }
+
+    @staticmethod
+    def key(regex, length, alphabet):
+        """Returns the bytes identifying a compiled regex"""
+        return repr((regex, length, "".join(sorted(set(alphabet))))).encode("utf-8")
+
+    def path(self, key):
+        """Returns the path of the cache file for the given key"""
+        return os.path.join(self.directory,
+                hashlib.sha256(key).hexdigest() + self.SUFFIX)
+
+    def get(self, regex, length, alphabet, bitmask=False):
+        """Returns an NFSM for the given regex, from the cache if possible.
+        On a miss the regex is compiled and stored.
+
+        """
+        result = self.lookup(regex, length, alphabet, bitmask)
+        if result is None:
+            result = NFSM(regex, length, alphabet, bitmask=bitmask)
+            self.put(regex, length, alphabet, result)
+        return result
+
+    def lookup(self, regex, length, alphabet, bitmask=False):
+        """Returns the cached NFSM for the given regex, or None on a miss"""
+        key = self.key(regex, length, alphabet)
+        result = self._load(key, self.path(key), bitmask)
+        self.stats["hits" if result is not None else "misses"] += 1
+        return result
+
+    def put(self, regex, length, alphabet, result):
+        """Stores a freshly compiled NFSM for the given regex"""
+        key = self.key(regex, length, alphabet)
+        self._store(key, self.path(key), result)
+
+    def _load(self, key, path, bitmask):
+        """Returns the cached NFSM, or None if there isn't a usable one"""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            if data[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError("Bad magic")
+            pos = len(self.MAGIC)
+            version, keylen = self.HEADER.unpack_from(data, pos)
+            pos += self.HEADER.size
+            if version != self.VERSION:
+                raise ValueError("Stale cache version")
+            if data[pos:pos+keylen] != key:
+                raise ValueError("Key mismatch")
+            result = NFSM.loads(data[pos+keylen:], bitmask)
+        except (ValueError, struct.error):
+            self.stats["bad entries"] += 1
+            return None
+
+        # Mark it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def _store(self, key, path, result):
+        data = b"".join([self.MAGIC, self.HEADER.pack(self.VERSION, len(key)),
+            key, result.dumps()])
+        # Write to a temporary file and move it into place, so other
+        # processes never see a partial entry. The cache is an optimization
+        # only, so give up quietly on errors.
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmppath, path)
+        except OSError:
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in
+        max_bytes
+
+        """
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, path, st.st_size))
+            total += st.st_size
+
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats["evictions"] += 1
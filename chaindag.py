@@ -0,0 +1,209 @@
+#!/bin/env python3
+
+"""
+chaindag.py - Chain engine with the chains stored as a DAG.
+
+The chains of an nfsm.NFSM often share long prefixes and suffixes: every
+chain of N.*X.X.X.*E starts with N and ends with E. Here the chains are
+stored as a trie with identical subtries merged, which makes a layered DAG
+with one layer per slot, and each node holding one slot value. Every chain
+is a path from the first layer to the last.
+
+Since a node always sits at the same slot, constraining a slot narrows the
+nodes of one layer whichever chains go through them, and the DAG is pruned
+just like the layers of an unrolled.UnrolledNFA, which this reuses.
+"""
+
+from nfsm import NFSM
+from unrolled import UnrolledNFA
+
+class ChainDAG(UnrolledNFA):
+    """Matches strings of a fixed length against a regex, like nfsm.NFSM,
+    with the chains stored as a DAG of shared slot values.
+
+    Nodes are numbered, and self.layers maps the surviving nodes of each
+    layer to their slot values, as in UnrolledNFA. Chains with links (see
+    NFSM) can't share their slots with other chains, so they are kept apart
+    in an NFSM of their own, self._linked, or None if there are none. The
+    two parts are constrained together and their results combined.
+
+    Copies share the node structure and only copy the layer dicts.
+
+    """
+    def __init__(self, regex, length, alphabet, bitmask=False):
+        self._load(NFSM(regex, length, alphabet, bitmask=bitmask), bitmask)
+
+    @classmethod
+    def from_nfsm(cls, nfsm, bitmask=False):
+        """Builds an object from the surviving chains of an already compiled
+        NFSM, with slots in set or bitmask mode as given
+
+        """
+        self = cls.__new__(cls)
+        self._load(nfsm, bitmask)
+        return self
+
+    def _load(self, nfsm, bitmask):
+        """Fills in this object from the surviving chains of the given NFSM"""
+        if nfsm.charsets.bitmask != bitmask:
+            nfsm = NFSM.loads(nfsm.dumps(), bitmask)
+        self.length = length = nfsm.length
+        self.charsets = nfsm.charsets
+        self.alphabet = nfsm.alphabet
+
+        chains = []
+        linked = []
+        for chain, links in zip(nfsm.chains, nfsm.links):
+            if links is None:
+                chains.append(chain)
+            else:
+                linked.append((chain, links))
+        self._linked = NFSM.from_chains([chain for chain, _ in linked],
+                [links for _, links in linked], length, self.alphabet,
+                bitmask) if linked else None
+
+        # Build a trie: each level maps a slot value to the next level
+        trie = {}
+        for chain in chains:
+            level = trie
+            for value in chain:
+                level = level.setdefault(value, {})
+
+        # Then number its nodes from the leaves up, giving the same number
+        # to nodes with the same depth, value and children
+        self.layers = [{} for _ in range(length)]
+        self._successors = {}
+        numbers = {}
+        def number(depth, value, children):
+            nextnodes = tuple(sorted(number(depth+1, v, c)
+                for v, c in children.items()))
+            key = (depth, value, nextnodes)
+            if key not in numbers:
+                node = numbers[key] = len(numbers)
+                self.layers[depth][node] = value
+                self._successors[node] = nextnodes
+            return numbers[key]
+        for value, children in trie.items():
+            number(0, value, children)
+
+        self._accepting = frozenset(self.layers[-1]) if length else frozenset()
+        self._nullable = not length and bool(chains)
+        self._trail = None
+        self._dirty = False
+
+    def _paths(self):
+        """Returns the slot values along every surviving path through the
+        DAG, as a list of chains
+
+        """
+        self._prune()
+        layers = self.layers
+        out = []
+        def walk(node, depth, prefix):
+            prefix = prefix + [layers[depth][node]]
+            if depth == self.length - 1:
+                out.append(prefix)
+                return
+            for nextnode in self._successors[node]:
+                if nextnode in layers[depth+1]:
+                    walk(nextnode, depth+1, prefix)
+        if self.length:
+            for node in layers[0]:
+                walk(node, 0, [])
+        elif self._nullable:
+            out.append([])
+        return out
+
+    @property
+    def chains(self):
+        """The list of surviving chains, each path through the DAG and then
+        each linked chain
+
+        """
+        out = self._paths()
+        if self._linked is not None:
+            out.extend(self._linked.chains)
+        return out
+
+    @property
+    def links(self):
+        """The links of each surviving chain, in the same order as chains"""
+        out = [None] * len(self._paths())
+        if self._linked is not None:
+            out.extend(self._linked.links)
+        return out
+
+    def constrain_slot(self, index, charset):
+        """Narrows the given slot to the given set of characters. See
+        NFSM.constrain_slot()
+
+        """
+        super().constrain_slot(index, charset)
+        if self._linked is not None:
+            self._linked.constrain_slot(index, charset)
+
+    def checkpoint(self):
+        """Starts logging changes, and returns a mark that can be passed to
+        rollback() to undo every change made after this call
+
+        """
+        return (super().checkpoint(), self._linked.checkpoint()
+                if self._linked is not None else None)
+
+    def rollback(self, mark):
+        """Undoes every change made since the checkpoint() call that returned
+        mark
+
+        """
+        mark, linkedmark = mark
+        super().rollback(mark)
+        if self._linked is not None:
+            self._linked.rollback(linkedmark)
+
+    def peek_slot(self, index):
+        """Returns the characters that are still possible in the given slot.
+        See NFSM.peek_slot()
+
+        """
+        candidates = super().peek_slot(index)
+        if self._linked is not None:
+            candidates = candidates | self._linked.peek_slot(index)
+        return candidates
+
+    def match(self, matchstr):
+        """Returns True if the given string matches this regex and the
+        constraints placed on it. Doesn't change any state.
+
+        """
+        return super().match(matchstr) or (self._linked is not None
+                and self._linked.match(matchstr))
+
+    def match_many(self, strings):
+        """Returns an iterator of True or False for each of the given strings,
+        like calling match() on each. Don't constrain this object while
+        iterating.
+
+        """
+        if self._linked is None:
+            return super().match_many(strings)
+        strings = list(strings)
+        return (a or b for a, b in zip(super().match_many(strings),
+            self._linked.match_many(strings)))
+
+    def copy(self):
+        """Makes a copy of this object, including any constraints already
+        applied
+
+        """
+        newobj = super().copy()
+        if self._linked is not None:
+            newobj._linked = self._linked.copy()
+        return newobj
+
+    def __str__(self):
+        """Return normalized string representing this regex object. See
+        NFSM.__str__()
+
+        """
+        return "|\n".join("".join(self.charsets.format(slot) for slot in chain)
+                for chain in self.chains)
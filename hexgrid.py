@@ -1,152 +1,200 @@
 
+from array import array
+import bisect
 
 class HexGrid:
     """This class represents a hexagonal grid. The hexagons are themselves
     arranged in a hexagon with the given side length.
-    
+
+    Cell values are stored in one flat list, self.values, row by row from
+    the top. Cells are addressed by their index in that list, or by axial
+    coordinates (q, r): r is the row, counting from the top, and q is the
+    diagonal going from the upper right to the lower left, counting from
+    the left. Moving to the lower right adds one to both.
+
+    The cells of every line are computed once, in self.lines, which maps
+    each direction ("l2r", "ur2ll" and "lr2ul", see the traverse_* methods)
+    to a list with the cell indexes of each line of that direction: a range
+    for the rows, and an array of ints for the diagonals. gather() reads the
+    values of a whole line.
+
+    Solving doesn't go through this class: topology.Topology.hex() takes its
+    line tables, and the cell values being solved live in a topology.Board,
+    which also logs changes for rollback.
+
+    GridCell objects, with links to their neighbors, are only made when
+    asked for, so large grids only cost the values and the line tables.
+
     """
 
     def __init__(self, sidelen, defaultvaluegenerator):
         self.sidelen = sidelen
         self.defaultvaluegenerator = defaultvaluegenerator
 
-        # The structure is a grid of linked cells. Each cell has 6 links, one
-        # for each of its neighbors. We hold in this object three lists, one
-        # for the left edges, one for the upper right edges, and one for the
-        # lower right edges. Order goes clockwise.
-        self.leftedges = []
-        self.uredges = []
-        self.lredges = []
-
-        # Create the top row
-        row = []
-        lastcell = None
-        for _ in range(sidelen):
-            newcell = Cell(defaultvaluegenerator())
-            row.append(newcell)
-            if lastcell:
-                lastcell.right = newcell
-                newcell.left = lastcell
-            lastcell = newcell
-
-        self.uredges.extend(row)
-        self.leftedges.append(row[0])
-
-        for _ in range(self.sidelen-1):
-            row = self._newrow_expand(row)
-
-        self.lredges.append(row[-1])
-        
-        for _ in range(self.sidelen-1):
-            row = self._newrow_contract(row)
-        self.lredges.extend(reversed(row[:-1]))
-
-        self.leftedges.reverse()
+        # Row r covers the diagonals from self._rowfirst[r] on, and its cells
+        # start at self._rowstart[r] in self.values
+        nrows = 2*sidelen - 1
+        self._rowfirst = [max(0, r - sidelen + 1) for r in range(nrows)]
+        self._rowstart = []
+        ncells = 0
+        for r in range(nrows):
+            self._rowstart.append(ncells)
+            ncells += self.rowlen(r)
+        self.values = [defaultvaluegenerator() for _ in range(ncells)]
+        self._cells = [None] * ncells
+
+        # Left to right lines go from the bottom row up. Upper-right to
+        # lower-left lines are the diagonals, from the left. Lower-right to
+        # upper-left lines start at the lower-right edges, clockwise.
+        # Within a row, cell q is at offsets[r] + q.
+        offsets = [start - first
+                for start, first in zip(self._rowstart, self._rowfirst)]
+        self.lines = {
+                "l2r": [range(self._rowstart[r],
+                    self._rowstart[r] + self.rowlen(r))
+                    for r in reversed(range(nrows))],
+                "ur2ll": [array("l", (offsets[r] + q
+                    for r in range(max(0, q - sidelen + 1),
+                        min(nrows, q + sidelen))))
+                    for q in range(nrows)],
+                "lr2ul": [array("l", (offsets[r] + r + d
+                    for r in reversed(range(max(0, -d), min(nrows, nrows - d)))))
+                    for d in range(sidelen - 1, -sidelen, -1)],
+                }
+
+    def rowlen(self, r):
+        """Returns the number of cells in row r"""
+        return self.sidelen + min(r, 2*self.sidelen - 2 - r)
+
+    def index(self, q, r):
+        """Returns the index of the cell at axial coordinates (q, r), or None
+        if there is no such cell
+
+        """
+        if not 0 <= r < len(self._rowstart):
+            return None
+        column = q - self._rowfirst[r]
+        if not 0 <= column < self.rowlen(r):
+            return None
+        return self._rowstart[r] + column
+
+    def coords(self, index):
+        """Returns the axial coordinates (q, r) of the cell at the given
+        index
+
+        """
+        r = bisect.bisect_right(self._rowstart, index) - 1
+        return index - self._rowstart[r] + self._rowfirst[r], r
+
+    def cell(self, index):
+        """Returns the GridCell object for the given index. There is only
+        ever one for each cell.
+
+        """
+        cell = self._cells[index]
+        if cell is None:
+            cell = self._cells[index] = GridCell(self, index)
+        return cell
+
+    @property
+    def leftedges(self):
+        """The first cell of each left to right line"""
+        return [self.cell(line[0]) for line in self.lines["l2r"]]
+
+    @property
+    def uredges(self):
+        """The first cell of each upper-right to lower-left line"""
+        return [self.cell(line[0]) for line in self.lines["ur2ll"]]
+
+    @property
+    def lredges(self):
+        """The first cell of each lower-right to upper-left line"""
+        return [self.cell(line[0]) for line in self.lines["lr2ul"]]
 
     def traverse_l2r(self, index):
         """Returns an iterator over cell values starting at a cell on one of
         the left edges and traversing horizontally to the right.
 
         """
-        cell = self.leftedges[index]
-        while cell is not None:
-            yield cell.value
-            cell = cell.right
+        return map(self.values.__getitem__, self.lines["l2r"][index])
 
     def traverse_ur2ll(self, index):
         """Returns an iterator over cell values starting at a cell on one of
         the upper-right edges and traversing diagonally to the lower-left.
 
         """
-        cell = self.uredges[index]
-        while cell is not None:
-            yield cell.value
-            cell = cell.ll
+        return map(self.values.__getitem__, self.lines["ur2ll"][index])
 
     def traverse_lr2ul(self, index):
         """Returns an iterator over cell values starting at a cell on one of
         the lower-right edges and traversing diagonally to the upper-left.
 
         """
-        cell = self.lredges[index]
-        while cell is not None:
-            yield cell.value
-            cell = cell.ul
-
-    def _newrow_expand(self, lastrow):
-        """Add a new row of one length longer than the last one"""
-        newrow = []
-
-        # Create the first node in the new row
-        newrow.append(Cell(self.defaultvaluegenerator()))
-        lastrow[0].ll = newrow[0]
-        newrow[0].ur = lastrow[0]
-
-        # Create all the inner nodes in the new row and connect them to their
-        # upper right and upper left neighbors
-        for ulneighbor, urneighbor in zip(lastrow[:-1], lastrow[1:]):
-            newcell = Cell(self.defaultvaluegenerator())
-            newcell.ul = ulneighbor
-            ulneighbor.lr = newcell
-            newcell.ur = urneighbor
-            urneighbor.ll = newcell
-            newrow.append(newcell)
-
-        # Now create the last node in the row
-        newrow.append(Cell(self.defaultvaluegenerator()))
-        lastrow[-1].lr = newrow[-1]
-        newrow[-1].ul = lastrow[-1]
-
-        # Now go and link each node in the row to each other
-        for left, right in zip(newrow[:-1], newrow[1:]):
-            left.right = right
-            right.left = left
-
-        self.leftedges.append(newrow[0])
-        self.uredges.append(newrow[-1])
-
-        return newrow
-
-    def _newrow_contract(self, lastrow):
-        """Add a new row one length shorter than the last one"""
-        newrow = []
-
-        # Create all the inner nodes in the new row and connect them to their
-        # upper right and upper left neighbors
-        for ulneighbor, urneighbor in zip(lastrow[:-1], lastrow[1:]):
-            newcell = Cell(self.defaultvaluegenerator())
-            newcell.ul = ulneighbor
-            ulneighbor.lr = newcell
-            newcell.ur = urneighbor
-            urneighbor.ll = newcell
-            newrow.append(newcell)
-
-        # Now go and link each node in the row to each other
-        for left, right in zip(newrow[:-1], newrow[1:]):
-            left.right = right
-            right.left = left
-
-        self.leftedges.append(newrow[0])
-        self.lredges.append(newrow[-1])
-
-        return newrow
-
-
-
-class Cell:
-    """A single cell in the grid. Holds a value and 6 links.
+        return map(self.values.__getitem__, self.lines["lr2ul"][index])
+
+    # The cells_* methods are like the traverse_* methods but yield GridCell
+    # objects instead of the values. Use these when cell values are
+    # immutable (such as int bitmasks) and have to be replaced instead of
+    # updated in place.
+
+    def cells_l2r(self, index):
+        """Returns an iterator over the cells of a left to right line"""
+        return map(self.cell, self.lines["l2r"][index])
+
+    def cells_ur2ll(self, index):
+        """Returns an iterator over the cells of an upper-right to lower-left
+        line
+
+        """
+        return map(self.cell, self.lines["ur2ll"][index])
+
+    def cells_lr2ul(self, index):
+        """Returns an iterator over the cells of a lower-right to upper-left
+        line
+
+        """
+        return map(self.cell, self.lines["lr2ul"][index])
+
+    def gather(self, direction, index):
+        """Returns a list of the values of the cells of a line, given its
+        direction (see self.lines) and index
+
+        """
+        line = self.lines[direction][index]
+        if isinstance(line, range):
+            return self.values[line.start:line.stop]
+        values = self.values
+        return [values[i] for i in line]
+
+class GridCell:
+    """A cell of a HexGrid. Its value is held by the grid, and its 6 links
+    to its neighbors are looked up from its coordinates.
 
     """
-    __slots__ = ("value", "left", "ul", "ur", "right", "lr", "ll")
-    def __init__(self, value):
-        self.value = value
-
-        self.left = None
-        self.ul = None
-        self.ur = None
-        self.right = None
-        self.lr = None
-        self.ll = None
+    __slots__ = ("grid", "index")
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.index = index
+
+    @property
+    def value(self):
+        return self.grid.values[self.index]
+
+    @value.setter
+    def value(self, value):
+        self.grid.values[self.index] = value
+
+    def _neighbor(self, dq, dr):
+        q, r = self.grid.coords(self.index)
+        index = self.grid.index(q + dq, r + dr)
+        return self.grid.cell(index) if index is not None else None
+
+    left = property(lambda self: self._neighbor(-1, 0))
+    right = property(lambda self: self._neighbor(1, 0))
+    ul = property(lambda self: self._neighbor(-1, -1))
+    ur = property(lambda self: self._neighbor(0, -1))
+    ll = property(lambda self: self._neighbor(0, 1))
+    lr = property(lambda self: self._neighbor(1, 1))
 
     def __repr__(self):
         return "<Cell: {0!r}>".format(self.value)
@@ -1,15 +1,143 @@
 #!/bin/env python3
 
-from copy import deepcopy
-from itertools import product
-from functools import reduce
-from operator import add
-import io
+import struct
+
+import regexparse
 
 """
 nfsm.py - Nondeterministic finite state machine.
 """
 
+class UnsupportedSyntax(ValueError):
+    """Raised by an engine when given a regex that is valid but uses a feature
+    that engine can't handle. Callers can catch this and fall back to a
+    different engine.
+
+    """
+
+class Charsets:
+    """Converts between collections of characters and the values held in the
+    slots of an automaton.
+
+    In the default set mode a slot value is a frozenset of one-character
+    strings. In bitmask mode each character of the alphabet is assigned a bit
+    and a slot value is a plain int, so intersection, union and emptiness
+    checks are single integer operations. Bits are assigned in sorted order, so
+    any two objects built over the same alphabet agree on the encoding.
+
+    In both modes slot values are immutable. Narrowing a slot replaces the
+    value instead of mutating it, which is what makes copies cheap.
+
+    """
+    def __init__(self, alphabet, bitmask=False):
+        self.alphabet = frozenset(alphabet)
+        self.bitmask = bitmask
+        self.bits = {c: 1 << i for i, c in enumerate(sorted(self.alphabet))}
+
+        # keys maps each character to its key (see members()), and
+        # contains(value, key) tests whether a slot value allows a key
+        if bitmask:
+            self.empty = 0
+            self.full = (1 << len(self.bits)) - 1
+            self.keys = self.bits
+            self.contains = int.__and__
+        else:
+            self.empty = frozenset()
+            self.full = self.alphabet
+            self.keys = {c: c for c in self.alphabet}
+            self.contains = frozenset.__contains__
+
+        # Interned slot values, see intern()
+        self._interned = {}
+
+    def intern(self, value):
+        """Returns the one shared instance of the given slot value. Equal
+        frozensets built in different places are separate objects, so
+        interning them makes chains with many repeated slot values, like
+        [set('A')] slots, hold references to one object each instead of
+        copies. Small ints are already shared by Python, but larger bitmasks
+        are interned the same way.
+
+        """
+        return self._interned.setdefault(value, value)
+
+    def encode(self, chars):
+        """Returns the slot value for the given collection of characters.
+        Characters not in the alphabet are ignored. In bitmask mode, ints are
+        taken to be already encoded and are returned as-is.
+
+        """
+        if not self.bitmask:
+            return frozenset(chars)
+        if isinstance(chars, int):
+            return chars
+        mask = 0
+        bits = self.bits
+        for c in chars:
+            mask |= bits.get(c, 0)
+        return mask
+
+    def decode(self, value):
+        """Returns the set of characters represented by the given slot value"""
+        if not self.bitmask:
+            return set(value)
+        return {c for c, bit in self.bits.items() if value & bit}
+
+    def members(self, value):
+        """Returns an iterable over the keys of the characters in the given
+        slot value. Keys are the characters themselves in set mode, and their
+        bits in bitmask mode.
+
+        """
+        if not self.bitmask:
+            return value
+        bits = []
+        while value:
+            bit = value & -value
+            bits.append(bit)
+            value ^= bit
+        return bits
+
+    def join(self, keys):
+        """The reverse of members(). Returns a new set in set mode."""
+        if not self.bitmask:
+            return set(keys)
+        value = 0
+        for bit in keys:
+            value |= bit
+        return value
+
+    def format(self, value):
+        """Returns a regex snippet matching the characters of the given slot
+        value
+
+        """
+        slot = self.decode(value)
+        if slot == self.alphabet:
+            return "."
+        elif len(slot) > 3 and len(self.alphabet - slot) == 1:
+            # Missing one element
+            missing, = self.alphabet - slot
+            alphabet = "".join(sorted(self.alphabet))
+            i = alphabet.index(missing)
+
+            if i == 0:
+                return "[{0}-{1}]".format(alphabet[1],alphabet[-1])
+            elif i == len(alphabet)-1:
+                return "[{0}-{1}]".format(alphabet[0],alphabet[-2])
+            else:
+                return "[{0}-{1}{2}-{3}]".format(alphabet[0],alphabet[i-1],alphabet[i+1],alphabet[-1])
+        elif len(slot) == 1:
+            return "".join(slot)
+        else:
+            return "[{0}]".format("".join(sorted(slot)))
+
+# Compiling only looks for chains dominated by another one (see
+# NFSM._redundant) when there are at most this many chains, since that
+# compares pairs of chains. Exact duplicates are always dropped, and
+# normalize() always looks.
+DOMINANCE_LIMIT = 1000
+
 class NFSM:
     """This class implements a non-deterministic finite state machine that
     matches a string of fixed, finite length. It is initialized with a string
@@ -20,19 +148,26 @@ class NFSM:
     of possible characters from the alphabet that could possibly belong in the
     slot given the constraints.
 
-    This doesn't support full regular expression syntax. Non-exhaustive list of
-    things that are not supported and will result in undefined behavior:
-    * Only a single level of parenthesis allowed. No nesting.
-    * A reference to a group that may or may not be matched under all
-      circumstances e.g. (A)?\1
-    * A group that is quantified or repeated. e.g. (A)+\1
-    * A reference to a forward group or a reference to a group from within the
-      group. e.g. \1(A) (A\2)
-    (I'm not sure what would happen in a more compliant regex implementation
-    anyways)
+    The regex is parsed by regexparse.parse(), see there for the supported
+    syntax. A backreference to a group that didn't take part in a match, such
+    as the \1 in (A)?\1 when the group is skipped, matches nothing, and a
+    backreference to a quantified group refers to its last repeat, like in
+    python's re module.
+
+    If bitmask is true, slots hold int bitmasks instead of frozensets. See the
+    Charsets class. Use encode() and decode() to convert to and from sets of
+    characters.
+
+    If domains is given, it is a list with the characters each slot can
+    hold, as collections of characters or slot values, such as the current
+    values of the cells of a line. The object then only matches strings that
+    fit them, as if each slot had been constrained with constrain_slot(),
+    but chains that don't fit are left out while the regex is expanded
+    instead of being built and then killed, which can make compiling much
+    cheaper.
 
     """
-    def __init__(self, regex, length, alphabet):
+    def __init__(self, regex, length, alphabet, bitmask=False, domains=None):
         # The finite state machine is represented as a number of "chains". Each
         # chain is a list of sets. Each set is a set of characters that could
         # go in that slot. For example, the regex 'AB+[^B]*' of length 4 over the
@@ -45,188 +180,568 @@ class NFSM:
         # When constraints are added, the constraint set is intersected with
         # that index of each chain. If any chain has an empty set, it is
         # removed from consideration.
-        self.chains = []
+        #
+        # Slot values are immutable (see Charsets), so backreferences can't
+        # be represented by sharing a mutable set between slots. Instead,
+        # self.links holds an entry for each chain: either None, or a dict
+        # mapping each slot that takes part in a backreference to the tuple of
+        # all slots that must hold the same value.
+        #
+        # Chains are never removed from self._chains, so a chain can be
+        # referred to by its index. Dead chains are flagged in self._alive.
+        # The chains and links attributes list the surviving ones.
+        self._chains = []
+        self._links = []
         self.length = length
-        self.alphabet = frozenset(alphabet)
+        self.charsets = Charsets(alphabet, bitmask)
+        self.alphabet = self.charsets.alphabet
 
-        unflattened_chains = list(self._parse_regex_part(regex))
+        self._domains = None
+        if domains is not None:
+            if len(domains) != length:
+                raise ValueError("Got {0} domains for a line of length "
+                        "{1}".format(len(domains), length))
+            charsets = self.charsets
+            self._domains = [frozenset(charsets.decode(charsets.encode(domain)))
+                    for domain in domains]
 
-        #print("{0!r} → {1}".format(regex, unflattened_chains))
+        tree = regexparse.parse(regex, self.alphabet)
+        self._referenced = regexparse.referenced_groups(tree)
+        self._memo = {}
+        partials = self._expand(tree, length,
+                0 if domains is not None else None)
+        del self._memo, self._referenced
 
-        # Derefernce backrefereces and flatten chains
-        for chain in unflattened_chains:
-            # Flatten and dereference this chain, then add it to self.chains
-            groups = []
-            flattened = []
-            for item in chain:
-                if isinstance(item, list):
-                    flattened.extend(item)
-                    groups.append(item)
-                else:
-                    flattened.append(item)
+        for items, links, _, n in partials:
+            # Since we are given the length of the string we match, and
+            # references to groups that never matched are still unresolved
+            if n != self.length or len(items) != n:
+                continue
+            chain, links = self._encode_chain(items, links)
+            if domains is not None:
+                chain = self._fit_domains(chain, links)
+                if chain is None:
+                    continue
+            self._chains.append(chain)
+            self._links.append(links)
+        del self._domains
 
-            dereferenced = []
-            for item in flattened:
-                if isinstance(item, int):
-                    dereferenced.extend(groups[item])
-                else:
-                    dereferenced.append(item)
+        # Leave out the chains that add nothing before indexing them
+        redundant = self._redundant(range(len(self._chains)),
+                len(self._chains) <= DOMINANCE_LIMIT)
+        if redundant:
+            self._chains = [chain for i, chain in enumerate(self._chains)
+                    if i not in redundant]
+            self._links = [links for i, links in enumerate(self._links)
+                    if i not in redundant]
+
+        self._build_index()
 
-            self.chains.append(dereferenced)
-        #print("{0!r} → {1}".format(regex, self.chains))
+    def _redundant(self, chainids, dominance=True):
+        """Returns the set of the given chains that are duplicates of another
+        one of them, or, if dominance is true, that are dominated by another
+        one: every slot is a subset of that chain's slot, and every group of
+        slots that chain links together is linked in this one too. A
+        dominated chain only matches strings the other one matches, and it
+        keeps being dominated however the two are constrained, so it can be
+        dropped without changing what peek_slot() or match() return.
+        Duplicates are found by hashing, dominated chains by comparing pairs
+        of chains.
 
-        # and, since we are given the length of the string we match...
-        self.chains = [chain for chain in self.chains if len(chain) == self.length]
+        Slots of a chain are packed into one int, with the bitmask of each
+        slot (see Charsets) in its own field, so checking a whole chain is a
+        couple of int operations.
 
-        #print("{0!r} → {1}".format(regex, self.chains))
+        """
+        charsets = self.charsets
+        bits = charsets.bits
+        width = len(bits)
 
-    def _parse_regex_part(self, regex):
-        """This recursive method takes a regex and parses it, yielding a series
-        of chain lists that together match this regex
+        # Set mode values are interned, so each is only converted once
+        masks = {}
+        seen = set()
+        redundant = set()
+        candidates = []
+        for chainid in chainids:
+            packed = 0
+            for value in reversed(self._chains[chainid]):
+                if not charsets.bitmask:
+                    mask = masks.get(value)
+                    if mask is None:
+                        mask = masks[value] = sum(bits[c] for c in value)
+                    value = mask
+                packed = packed << width | value
+            links = self._links[chainid]
+            groups = frozenset(links.values()) if links is not None else frozenset()
+            key = (packed, groups)
+            if key in seen:
+                redundant.add(chainid)
+                continue
+            seen.add(key)
+            if dominance:
+                candidates.append((-bin(packed).count("1"), len(groups),
+                    chainid, packed, links, groups))
 
-        Each chain returned is a list. Each item in the list may be one of
-        three things:
-        * A set containing the elements from the alphabet which this slot may
-          contain
-        * An integer referring to a group number from a group previously
-          defined
-        * A list of one or more of the above denoting a group definition
+        # A chain can only be dominated by one with at least as many
+        # characters, which comes first. Of two with the same, the one
+        # with fewer links comes first. The chains kept so far are bucketed
+        # by their first and last slots, so whole buckets that can't
+        # dominate are skipped with one check.
+        candidates.sort()
+        field = (1 << width) - 1
+        ends = field | field << width*max(self.length-1, 0)
+        buckets = {}
+        for _, _, chainid, packed, links, groups in candidates:
+            end = packed & ends
+            for bucketend, kept in buckets.items():
+                if end & bucketend != end:
+                    continue
+                if any(packed & otherpacked == packed and all(
+                        links is not None and group[0] in links
+                        and set(group) <= set(links[group[0]])
+                        for group in othergroups)
+                        for otherpacked, othergroups in kept):
+                    redundant.add(chainid)
+                    break
+            else:
+                buckets.setdefault(end, []).append((packed, groups))
+        return redundant
+
+    def normalize(self):
+        """Kills the surviving chains that are made redundant by another one,
+        see _redundant(). Constraints can make more chains redundant, so this
+        can be worth calling after some constraint rounds. Changes are logged
+        for rollback() like those of constrain_slot(). Returns the number of
+        chains killed.
 
         """
-        if not regex:
-            # Base case, an empty chain
-            yield []
-            return
+        redundant = self._redundant([i for i, alive in enumerate(self._alive)
+            if alive])
+        for chainid in sorted(redundant):
+            self._kill(chainid)
+        return len(redundant)
 
-        # Take care of union'd expressions here, first
-        paren_level = 0
-        index = 0
-        while index < len(regex):
-            c = regex[index]
-            if c == "(":
-                paren_level += 1
-            elif c == ")":
-                paren_level -= 1
-
-            if c == "|" and paren_level == 0:
-                # Here's where a yield from statement added in python 3.3 would
-                # come in handy
-                # Left side
-                for chain in self._parse_regex_part(regex[:index]):
-                    yield chain
-                # Right side
-                for chain in self._parse_regex_part(regex[index+1:]):
-                    yield chain
-                return
-            index += 1
-
-        if paren_level != 0:
-            raise ValueError("Unbalanced parentheses! {0!r}".format(regex))
-
-        # From this point on, we don't have to worry about unioned (|)
-        # expressions. Just try and handle one thing.
-
-        c = regex[0]
-        end_index = 0
-        group = False
-        
-        if c in self.alphabet:
-            chains = [[set(c)]]
-        elif c == ".":
-            chains = [[set(self.alphabet)]]
-        elif c == "[":
-            end_index = regex.find("]")
-            if regex[1] == "^":
-                chains = [[set(self.alphabet - set(regex[2:end_index]))]]
-            else:
-                chains = [[set(regex[1:end_index])]]
-
-        elif c == "(":
-            # XXX Assume no nested parens for now
-            end_index = regex.find(")")
-            chains = list(self._parse_regex_part(regex[1:end_index]))
-            group = True
-
-        elif c == "\\":
-            # A group reference
-            end_index = 1
-            matchindex = int(regex[1])-1
-            # instead of a set or a chain, emit a chain with one integer, which
-            # will be dereferenced later
-            chains = [[matchindex]]
+    @classmethod
+    def estimate_chains(cls, regex, length, alphabet):
+        """Returns an estimate of the number of chains the regex expands into
+        for a line of the given length, before duplicate and dominated ones
+        are dropped, without expanding anything. It counts the partial
+        chains of each length for each node of the parse tree the way
+        _expand() builds them, so it is exact for most regexes without
+        backreferences, and otherwise too high. Use it to tell whether
+        compiling is affordable.
+
+        """
+        tree = regexparse.parse(regex, alphabet)
+        return cls._count(tree, length, {},
+                regexparse.referenced_groups(tree))[length]
+
+    @classmethod
+    def _count(cls, node, length, memo, referenced):
+        """Returns a list with the number of partial chains (see _expand) of
+        each length from 0 to length that the node expands into, given the
+        set of the numbers of the groups that are referenced. Counts for
+        backreferences and the groups they refer to are taken to be
+        independent, which overestimates.
 
+        """
+        if node in memo:
+            return memo[node]
+        counts = [0] * (length + 1)
+        one = [1] + [0] * length
+        def convolve(a, b):
+            out = [0] * (length + 1)
+            for i, x in enumerate(a):
+                if x:
+                    for j in range(length + 1 - i):
+                        out[i+j] += x * b[j]
+            return out
+        def add(a, b):
+            return [x + y for x, y in zip(a, b)]
+        def power(a, n):
+            # a convolved with itself n times, by squaring
+            out = one
+            while n:
+                if n & 1:
+                    out = convolve(out, a)
+                a = convolve(a, a)
+                n >>= 1
+            return out
+        def geometric(a, n):
+            # The sum of a convolved with itself 0 to n-1 times, by doubling
+            # with geometric(a, 2k) = geometric(a, k) * (1 + a^k)
+            if n == 0:
+                return [0] * (length + 1)
+            if n & 1:
+                return add(one, convolve(a, geometric(a, n - 1)))
+            return convolve(geometric(a, n // 2), add(one, power(a, n // 2)))
+
+        if isinstance(node, regexparse.Chars):
+            if length:
+                counts[1] = 1
+        elif isinstance(node, regexparse.Backref):
+            # A reference copies whatever its group matched
+            counts = [1 if n else 0
+                    for n in cls._count(node.group, length, memo, referenced)]
+        elif isinstance(node, regexparse.Group):
+            counts = cls._count(node.item, length, memo, referenced)
+        elif isinstance(node, regexparse.Alt):
+            for option in node.options:
+                counts = [a + b for a, b in zip(counts,
+                    cls._count(option, length, memo, referenced))]
+        elif isinstance(node, regexparse.Concat):
+            counts[0] = 1
+            for item in node.items:
+                counts = convolve(counts,
+                        cls._count(item, length, memo, referenced))
+        elif isinstance(node, regexparse.Repeat):
+            units = cls._count(node.item, length, memo, referenced)
+            # Past the required repeats, empty ones are left out unless
+            # they capture a referenced group, and then one is allowed at
+            # the end
+            captures = cls._captures(node.item, referenced)
+            growing = units if captures else [0] + units[1:]
+            least = min(node.least, length) \
+                    if not node.item.minlen and not cls._refers(node.item) \
+                    else node.least
+            most = max(least, length + 1 if captures else length)
+            if node.most is not None:
+                most = min(node.most, most)
+            # Each repeat count from least to most adds units^least
+            # convolved with growing^(count - least)
+            if least <= most:
+                counts = convolve(power(units, least),
+                        geometric(growing, most - least + 1))
         else:
-            raise ValueError("Found char {0!r} not in the alphabet or recognized regex special char".format(c))
-
-
-        # At this point, the chains list is a list of chains (a chain is a list
-        # of sets) representing the possible matches of the regex up to
-        # end_index. This may be quantified, so take care of that
-        if len(regex) > end_index+1:
-            quantifier = regex[end_index+1]
-
-            if quantifier == "*":
-                # Kleene star. any combination of `chains` can appear zero or
-                # more times
-                for chain2 in self._parse_regex_part(regex[end_index+2:]):
-                    for repeatnum in range(self.length+1):
-                        # chains from above may have multiple chains, and if we
-                        # are to repeat them we must take a cross product
-                        # because the repeated values could be any of the
-                        # possible chains.
-                        for chain1 in (reduce(add, c, []) for c in product(chains, repeat=repeatnum)):
-                            if len(chain1) + len(chain2) <= self.length: # it ain't getting any shorter
-                                yield self._copy_chain(chain1) + self._copy_chain(chain2)
-                return
-            elif quantifier == "+":
-                # Same as above but repeatnum starts at 1
-                for chain2 in self._parse_regex_part(regex[end_index+2:]):
-                    for repeatnum in range(1, self.length+1):
-                        for chain1 in (reduce(add, c, []) for c in product(chains, repeat=repeatnum)):
-                            if len(chain1) + len(chain2) <= self.length:
-                                yield self._copy_chain(chain1) + self._copy_chain(chain2)
-                return
-            elif quantifier == "?":
-                for chain2 in self._parse_regex_part(regex[end_index+2:]):
-                    for chain1 in chains:
-                        yield self._copy_chain(chain2)
-                        yield self._copy_chain(chain1) + self._copy_chain(chain2)
-                return
-            # If the character was not one of the above, fall off this if
-            # statement and continue below
-
-        # If the code gets here, the handled item was not quantified
-        # XXX Assumption: only unquantified parenthesized expressions can be
-        # groups
-        for chain2 in self._parse_regex_part(regex[end_index+1:]):
-            for chain1 in chains:
-                if group:
-                    # the chains in the chains var are part of a group.
-                    # enclose it in a list to marke it as a group. chains will
-                    # be flattened and group references dereferenced later.
-                    yield [self._copy_chain(chain1)] + self._copy_chain(chain2)
-                else:
-                    yield self._copy_chain(chain1) + self._copy_chain(chain2)
-        
+            raise TypeError("Unknown parse tree node {0!r}".format(node))
+        memo[node] = counts
+        return counts
+
+    @classmethod
+    def _captures(cls, node, referenced):
+        """Returns True if there is a group in the set referenced anywhere in
+        the given node
+
+        """
+        if isinstance(node, regexparse.Group):
+            if node.index in referenced:
+                return True
+            return cls._captures(node.item, referenced)
+        if isinstance(node, regexparse.Repeat):
+            return cls._captures(node.item, referenced)
+        children = node.items if isinstance(node, regexparse.Concat) else \
+                node.options if isinstance(node, regexparse.Alt) else ()
+        return any(cls._captures(child, referenced) for child in children)
+
+    @classmethod
+    def _refers(cls, node):
+        """Returns True if there is a backreference anywhere in the given
+        node
+
+        """
+        if isinstance(node, regexparse.Backref):
+            return True
+        if isinstance(node, (regexparse.Repeat, regexparse.Group)):
+            return cls._refers(node.item)
+        children = node.items if isinstance(node, regexparse.Concat) else \
+                node.options if isinstance(node, regexparse.Alt) else ()
+        return any(cls._refers(child) for child in children)
+
+    @classmethod
+    def from_chains(cls, chains, links, length, alphabet, bitmask=False):
+        """Builds an object from lists of slot values, in the mode given by
+        bitmask, and their links (see __init__) instead of from a regex
+
+        """
+        self = cls.__new__(cls)
+        self.length = length
+        self.charsets = Charsets(alphabet, bitmask)
+        self.alphabet = self.charsets.alphabet
+        intern = self.charsets.intern
+        self._chains = [[intern(value) for value in chain] for chain in chains]
+        self._links = list(links)
+        self._build_index()
+        return self
+
+    def _build_index(self):
+        """Builds the support index over self._chains, with every chain
+        alive.
+
+        For each slot, self._support holds a dict mapping each character key
+        (see Charsets.members) to the number of surviving chains that allow it
+        in that slot. peek_slot() reads the keys with nonzero counts.
+
+        For each slot, self._holders holds a dict mapping each character key
+        to the indexes of the chains that allowed it when the index was built.
+        constrain_slot() uses it to visit only the chains that lose a
+        character. It is never modified, so copies share it.
+
+        """
+        members = self.charsets.members
+        self._trail = None
+        self._owned = bytearray([1]) * len(self._chains)
+        self._alive = bytearray([1]) * len(self._chains)
+        self._nalive = len(self._chains)
+        self._support = [{} for _ in range(self.length)]
+        self._holders = [{} for _ in range(self.length)]
+        for chainid, chain in enumerate(self._chains):
+            for support, holders, value in zip(self._support, self._holders, chain):
+                for key in members(value):
+                    support[key] = support.get(key, 0) + 1
+                    holders.setdefault(key, []).append(chainid)
+
+    @property
+    def chains(self):
+        """The list of surviving chains"""
+        return [chain for chain, alive in zip(self._chains, self._alive) if alive]
+
+    @property
+    def links(self):
+        """The links of each surviving chain, in the same order as chains"""
+        return [links for links, alive in zip(self._links, self._alive) if alive]
+
+    def _expand(self, node, budget, offset=None):
+        """Expands a node of the parse tree (see regexparse) into the partial
+        chains that match it, leaving out the ones that are known to be
+        longer than budget slots. Returns a list of (items, links, groups,
+        length) tuples:
+        * items is a tuple with a slot value (an interned frozenset, see
+          Charsets.intern) for each slot. A backreference to a group that
+          isn't in this partial chain is left as the int group number, to be
+          resolved when it is joined to what comes before it.
+        * links is a tuple of tuples of the positions in items that must
+          hold the same character because of a backreference
+        * groups maps the number of each group matched in this partial chain
+          to its (start, end) positions in items
+        * length is the number of slots, not counting unresolved references
+
+        offset is the slot the node starts at if there are domains (see
+        __init__) and it is known, and None otherwise. Characters outside the
+        domains of the slots are left out.
+
+        The same nodes come up over and over again with the same budget, such
+        as the rest of the regex after each repeat count of a quantified
+        item, so results are memoized on (node, budget, offset) in
+        self._memo. Partial chains are never modified, so they can be shared
+        freely.
+
+        """
+        if offset is not None:
+            budget = min(budget, self.length - offset)
+        key = (node, budget, offset)
+        memo = self._memo
+        if key not in memo:
+            memo[key] = self._expand_uncached(node, budget, offset) \
+                    if node.minlen <= budget else []
+        return memo[key]
 
     @staticmethod
-    def _copy_chain(chain, repeat=1):
-        """Takes a chain and returns a copy of it, repeated the given number of
-        times
-        
+    def _offset_after(offset, part):
+        """Returns the slot following the given partial chain (see _expand)
+        if it starts at offset, or None if that isn't known
+
+        """
+        if offset is None or any(isinstance(item, int) for item in part[0]):
+            # Unresolved references can take any number of slots
+            return None
+        return offset + part[3]
+
+    def _expand_uncached(self, node, budget, offset):
+        if isinstance(node, regexparse.Chars):
+            chars = node.chars
+            if offset is not None:
+                chars = chars & self._domains[offset]
+                if not chars:
+                    return []
+            return [((self.charsets.intern(chars),), (), {}, 1)]
+
+        if isinstance(node, regexparse.Backref):
+            return [((node.index,), (), {}, 0)]
+
+        if isinstance(node, regexparse.Group):
+            if node.index not in self._referenced:
+                # Only referenced groups need to be known
+                return self._expand(node.item, budget, offset)
+            out = []
+            for items, links, groups, length in self._expand(node.item, budget,
+                    offset):
+                groups = dict(groups)
+                groups[node.index] = (0, len(items))
+                out.append((items, links, groups, length))
+            return out
+
+        if isinstance(node, regexparse.Alt):
+            out = []
+            for option in node.options:
+                out.extend(self._expand(option, budget, offset))
+            return out
+
+        if isinstance(node, regexparse.Concat):
+            # Each item gets whatever budget the others leave it at the
+            # least, and combinations that overshoot are dropped as soon as
+            # they do
+            items = node.items
+            out = []
+            def combine(i, parts, length, at):
+                if i == len(items):
+                    out.append(self._join(parts))
+                    return
+                item = items[i]
+                for part in self._expand(item,
+                        budget - node.minlen + item.minlen, at):
+                    if length + part[3] <= budget:
+                        combine(i+1, parts + [part], length + part[3],
+                                self._offset_after(at, part))
+            combine(0, [], 0, offset)
+            return out
+
+        if isinstance(node, regexparse.Repeat):
+            # Any combination of the item's partial chains can appear, so
+            # this is a cross product over each repeat count. Repeats are
+            # built one at a time, so the ones that overshoot the budget are
+            # dropped before they are extended any further.
+            least = node.least
+            captures = self._captures(node.item, self._referenced)
+            if node.item.minlen == 0 and not self._refers(node.item):
+                # Required repeats past budget can only match the empty
+                # string. One of them is kept if it captures a referenced
+                # group, so a reference sees the group set, even if only to
+                # nothing. That doesn't hold for a reference, which may copy
+                # a group that matched something or never matched at all.
+                least = min(least, max(budget, 1) if captures else budget)
+            # Likewise, one more repeat than the budget allows is needed
+            # for an empty one to set a referenced group at the end
+            most = max(least, budget + 1 if captures else budget)
+            if node.most is not None:
+                most = min(node.most, most)
+            # Once the required repeats are there, an empty repeat would
+            # only duplicate a shorter count, unless it captures a
+            # referenced group. Repeats starting at different slots can
+            # expand differently.
+            units = {}
+            def units_at(at, required):
+                if at not in units:
+                    expanded = self._expand(node.item, budget, at)
+                    units[at] = (expanded, [unit for unit in expanded
+                        if unit[0] or unit[2]])
+                return units[at][0 if required else 1]
+
+            out = [self._join([])] if least == 0 else []
+            current = [([], 0, offset)]
+            for repeatnum in range(1, most+1):
+                current = [(parts + [unit], length + unit[3],
+                            self._offset_after(at, unit))
+                        for parts, length, at in current
+                        for unit in units_at(at, repeatnum <= least)
+                        if length + unit[3] <= budget]
+                if not current:
+                    break
+                if repeatnum >= least:
+                    out.extend(self._join(parts) for parts, _, _ in current)
+            return out
+
+        raise TypeError("Unknown parse tree node {0!r}".format(node))
+
+    @staticmethod
+    def _join(parts):
+        """Concatenates partial chains (see _expand) into a new one, resolving
+        references against the groups of the parts before them. A resolved
+        reference gets a copy of the group's slot values, each linked to the
+        slot it was copied from.
+
+        """
+        items = []
+        # Links are tracked with a union-find over the positions in items.
+        # Unresolved references are never linked to anything.
+        parent = []
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        groups = {}
+        for partitems, partlinks, partgroups, _ in parts:
+            # Where each item of the part starts in items
+            starts = []
+            for item in partitems:
+                starts.append(len(items))
+                if isinstance(item, int) and item in groups:
+                    start, end = groups[item]
+                    for i in range(start, end):
+                        items.append(items[i])
+                        if isinstance(items[i], int):
+                            parent.append(len(parent))
+                        else:
+                            parent.append(find(i))
+                else:
+                    items.append(item)
+                    parent.append(len(parent))
+            starts.append(len(items))
+
+            for link in partlinks:
+                root = find(starts[link[0]])
+                for i in link[1:]:
+                    parent[find(starts[i])] = root
+
+            # Later groups replace earlier ones with the same number, so a
+            # reference sees the last repeat of a group
+            for index, (start, end) in partgroups.items():
+                groups[index] = (starts[start], starts[end])
+
+        classes = {}
+        for i, item in enumerate(items):
+            if not isinstance(item, int):
+                classes.setdefault(find(i), []).append(i)
+        links = tuple(tuple(positions) for positions in classes.values()
+                if len(positions) > 1)
+        length = sum(1 for item in items if not isinstance(item, int))
+        return tuple(items), links, groups, length
+
+    def _encode_chain(self, items, links):
+        """Takes the items and links of a partial chain with no unresolved
+        references (see _expand), and returns a chain of interned slot values
+        along with its links (see __init__)
+
+        """
+        charsets = self.charsets
+        chain = [charsets.intern(charsets.encode(item)) for item in items]
+        if not links:
+            return chain, None
+        chainlinks = {}
+        for group in links:
+            for i in group:
+                chainlinks[i] = group
+        return chain, chainlinks
+
+    def _fit_domains(self, chain, links):
+        """Narrows the slots of a chain (see _encode_chain) to their domains,
+        and linked slots to the characters they have in common. Returns the
+        new chain, or None if a slot ends up empty.
+
         """
-        # You may think this method could just be replaced with python's
-        # copy.deepcopy, but deepcopy will keep references to identical
-        # objects, copying the object just once, and we want to copy
-        # everything. In other words, this method also has the hidden but
-        # necessary effect of decoupling some set references in some chains.
-        if not isinstance(chain, list):
-            raise ValueError("Given item is not a chain. Chains are lists")
-        chaincopy = []
-        for _ in range(repeat):
-            for item in chain:
-                chaincopy.append(deepcopy(item))
-        return chaincopy
+        charsets = self.charsets
+        chain = [charsets.intern(value & charsets.encode(domain))
+                for value, domain in zip(chain, self._domains)]
+        if links is not None:
+            for group in set(links.values()):
+                common = chain[group[0]]
+                for i in group[1:]:
+                    common = common & chain[i]
+                common = charsets.intern(common)
+                for i in group:
+                    chain[i] = common
+        if not all(chain):
+            return None
+        return chain
+
+    def encode(self, chars):
+        """Returns the slot value for the given collection of characters"""
+        return self.charsets.encode(chars)
+
+    def decode(self, value):
+        """Returns the set of characters for the given slot value"""
+        return self.charsets.decode(value)
 
     def constrain_slot(self, index, charset):
         """constrain_slot takes a slot index and a set of characters
@@ -235,14 +750,116 @@ class NFSM:
         adjusted to be consistent with that data.
 
         """
-        charset = frozenset(charset)
-        newchains = []
-        for chain in self.chains:
-            chain[index] &= charset
+        charsets = self.charsets
+        charset = charsets.encode(charset)
+        current = charsets.join(self._support[index])
+        gone = current ^ (current & charset)
+        if not gone:
+            return
+
+        # Only chains that allowed one of the removed characters need a look
+        holders = self._holders[index]
+        alive = self._alive
+        for key in charsets.members(gone):
+            for chainid in holders[key]:
+                if alive[chainid]:
+                    self._narrow(chainid, index, charset)
+
+    def _narrow(self, chainid, index, charset):
+        """Intersects one slot of one chain with charset, keeping the support
+        counts up to date
+
+        """
+        old = self._chains[chainid][index]
+        new = old & charset
+        if new == old:
+            return
+        if not new:
+            self._kill(chainid)
+            return
+        new = self.charsets.intern(new)
+        chain = self._own(chainid)
 
-            if chain[index]:
-                newchains.append(chain)
-        self.chains = newchains
+        links = self._links[chainid]
+        if links is not None and index in links:
+            # Narrow every slot that is a reference to this one
+            slots = links[index]
+        else:
+            slots = (index,)
+
+        removed = self.charsets.members(old ^ new)
+        if self._trail is not None:
+            self._trail.append((chainid, slots, old, removed))
+        for i in slots:
+            chain[i] = new
+            support = self._support[i]
+            for key in removed:
+                support[key] -= 1
+                if not support[key]:
+                    del support[key]
+
+    def _own(self, chainid):
+        """Returns the list of slot values of the given chain, ready to be
+        modified. Chain lists are shared between an object and its copies
+        until one of them modifies a chain (see copy()), which then gets its
+        own copy of that list.
+
+        """
+        chain = self._chains[chainid]
+        if not self._owned[chainid]:
+            chain = self._chains[chainid] = list(chain)
+            self._owned[chainid] = 1
+        return chain
+
+    def _kill(self, chainid):
+        """Marks a chain as dead and removes its support from every slot"""
+        if self._trail is not None:
+            self._trail.append((chainid,))
+        self._alive[chainid] = 0
+        self._nalive -= 1
+        members = self.charsets.members
+        for support, value in zip(self._support, self._chains[chainid]):
+            for key in members(value):
+                support[key] -= 1
+                if not support[key]:
+                    del support[key]
+
+    def checkpoint(self):
+        """Starts logging changes made by constrain_slot(), and returns a mark
+        that can be passed to rollback() to undo every change made after this
+        call
+
+        """
+        if self._trail is None:
+            self._trail = []
+        return len(self._trail)
+
+    def rollback(self, mark):
+        """Undoes every change made since the checkpoint() call that returned
+        mark. Takes time proportional to the number of changes undone.
+
+        """
+        trail = self._trail
+        members = self.charsets.members
+        while len(trail) > mark:
+            entry = trail.pop()
+            if len(entry) == 1:
+                # A chain was killed. Bring it back and restore its support.
+                chainid, = entry
+                self._alive[chainid] = 1
+                self._nalive += 1
+                for support, value in zip(self._support, self._chains[chainid]):
+                    for key in members(value):
+                        support[key] = support.get(key, 0) + 1
+            else:
+                # Some slots of a chain were narrowed
+                chainid, slots, old, removed = entry
+                chain = self._own(chainid)
+                for i in slots:
+                    chain[i] = old
+                    support = self._support[i]
+                    for key in removed:
+                        support[key] = support.get(key, 0) + 1
 
     def peek_slot(self, index):
         """peek_slot takes a slot index, and returns the set of characters that
@@ -250,11 +867,8 @@ class NFSM:
         to the regex and the constraints placed upon it.
 
         """
-        candidates = set()
-        for chain in self.chains:
-            candidates |= chain[index]
-
-        return candidates
+        # Every character with a nonzero count is supported by some chain
+        return self.charsets.join(self._support[index])
 
     def match(self, matchstr):
         """Takes a string and returns True or False if it matches this regex,
@@ -263,48 +877,228 @@ class NFSM:
         """
         if len(matchstr) != self.length:
             return False
+        if not self.length:
+            return bool(self._nalive)
+
+        keys = self.charsets.keys
+        if not all(c in keys for c in matchstr):
+            return False
+        strkeys = [keys[c] for c in matchstr]
 
-        # The string needs to match at least one of the chains. We implement
-        # this as a series of constraints, but since we mutate the object we
-        # need to make a copy
-        newregex = self.copy()
-        for i, c in enumerate(matchstr):
-            newregex.constrain_slot(i, set(c))
+        # The string needs to match at least one of the chains. Only the
+        # chains that allowed the first character are candidates.
+        contains = self.charsets.contains
+        alive = self._alive
+        for chainid in self._holders[0].get(strkeys[0], ()):
+            if not alive[chainid]:
+                continue
+            chain = self._chains[chainid]
+            if all(contains(value, key) for value, key in zip(chain, strkeys)) \
+                    and self._links_match(chainid, matchstr):
+                return True
+        return False
 
-        return bool(newregex.chains)
+    def _links_match(self, chainid, matchstr):
+        """Returns True if the given string has the same character in every
+        group of linked slots of the given chain
+
+        """
+        links = self._links[chainid]
+        if links is None:
+            return True
+        return all(len({matchstr[i] for i in group}) == 1
+                for group in links.values())
+
+    def match_many(self, strings):
+        """Returns an iterator of True or False for each of the given strings,
+        like calling match() on each.
+
+        Lookup tables are built once from the current state and shared by the
+        whole batch: for each slot and character, an int with a bit set for
+        every chain allowing that character there. Matching a string is then
+        one AND per slot. Don't constrain this object while iterating.
+
+        """
+        keys = self.charsets.keys
+        members = self.charsets.members
+
+        # Number the surviving chains from 0 for the bitsets. Chains with
+        # links have to be checked one by one after the lookup.
+        chainids = [i for i, alive in enumerate(self._alive) if alive]
+        tables = [{} for _ in range(self.length)]
+        linked = 0
+        for bit, chainid in enumerate(chainids):
+            bit = 1 << bit
+            for table, value in zip(tables, self._chains[chainid]):
+                for key in members(value):
+                    table[key] = table.get(key, 0) | bit
+            if self._links[chainid] is not None:
+                linked |= bit
+        allchains = (1 << len(chainids)) - 1
+
+        for matchstr in strings:
+            if len(matchstr) != self.length:
+                yield False
+                continue
+
+            matches = allchains
+            for table, c in zip(tables, matchstr):
+                matches &= table.get(keys.get(c), 0)
+                if not matches:
+                    break
+
+            if matches & ~linked:
+                yield True
+                continue
+            while matches:
+                bit = matches & -matches
+                matches ^= bit
+                if self._links_match(chainids[bit.bit_length()-1], matchstr):
+                    yield True
+                    break
+            else:
+                yield False
 
     def copy(self):
         """Makes a copy of this regex object, including any constraints already
         applied
 
         """
-        newobj = self.__class__("", self.length, self.alphabet)
-
-        # The rest of this method could be implemented with deepcopy() and
-        # still function correctly, but deepcopy() runs quite a bit slower. The
-        # code below must make some assumptions that deepcopy() doesn't. I'm
-        # guessing it's probably that every item in the sets are immutable
-        # strings.
-        newobj.chains = []
-        for chain in self.chains:
-            # Copy each set, but we need to make sure to keep aliased
-            # references intact.
-            newchain = []
-            # maps the id() of old sets to the new copy of that set, so we can
-            # re-use it when we encounter the original again.
-            ids = {}
-
-            for oldset in chain:
-                if id(oldset) in ids:
-                    newchain.append(ids[id(oldset)])
-                else:
-                    newset = set(oldset)
-                    newchain.append(newset)
-                    ids[id(oldset)] = newset
+        newobj = self.__class__.__new__(self.__class__)
+        newobj.length = self.length
+        newobj.charsets = self.charsets
+        newobj.alphabet = self.alphabet
+
+        # Slot values are immutable and links are never modified, so the
+        # chain lists can be shared, and are copied on write: both objects
+        # give up ownership of them, and _own() copies a list the first time
+        # it is modified. Aliased slots don't need any special treatment
+        # since the links keep track of them. The copy starts without a
+        # trail, so it can't roll back past this point.
+        if self._nalive * 2 < len(self._chains):
+            # Mostly dead chains. Leave them behind and build a fresh index.
+            chainids = [i for i, alive in enumerate(self._alive) if alive]
+            for i in chainids:
+                self._owned[i] = 0
+            newobj._chains = [self._chains[i] for i in chainids]
+            newobj._links = self.links
+            newobj._build_index()
+            newobj._owned = bytearray(len(chainids))
+        else:
+            newobj._trail = None
+            newobj._chains = list(self._chains)
+            newobj._links = self._links
+            self._owned = bytearray(len(self._chains))
+            newobj._owned = bytearray(len(self._chains))
+            newobj._alive = bytearray(self._alive)
+            newobj._nalive = self._nalive
+            newobj._support = [dict(support) for support in self._support]
+            newobj._holders = self._holders
+
+        return newobj
+
+    # Serialization format, all little-endian:
+    # * header: the magic bytes, then SERIAL_HEADER (version, line length,
+    #   number of surviving chains, bytes per slot, alphabet size in bytes),
+    #   then the sorted alphabet encoded as utf-8
+    # * for each chain, its slots as bitmasks (see Charsets) of the given
+    #   width, then the number of link groups, then for each group its size
+    #   and the slot indexes in it, as unsigned 16 bit ints
+    SERIAL_MAGIC = b"NFSM"
+    SERIAL_VERSION = 1
+    SERIAL_HEADER = struct.Struct("<BHIBH")
+
+    def dumps(self):
+        """Returns the surviving chains of this object, with their current
+        constraints, as a compact byte string. See loads().
+
+        """
+        charsets = self.charsets
+        alphabet = "".join(sorted(self.alphabet)).encode("utf-8")
+        width = (len(charsets.bits) + 7) // 8 or 1
+        chains = self.chains
+        out = [self.SERIAL_MAGIC, self.SERIAL_HEADER.pack(self.SERIAL_VERSION,
+            self.length, len(chains), width, len(alphabet)), alphabet]
+
+        bits = charsets.bits
+        for chain, links in zip(chains, self.links):
+            for value in chain:
+                if not charsets.bitmask:
+                    value = sum(bits[c] for c in value)
+                out.append(value.to_bytes(width, "little"))
 
-            newobj.chains.append(newchain)
+            groups = set(links.values()) if links is not None else ()
+            out.append(struct.pack("<H", len(groups)))
+            for group in sorted(groups):
+                out.append(struct.pack("<{0}H".format(len(group)+1),
+                    len(group), *group))
+        return b"".join(out)
 
-        return newobj 
+    @classmethod
+    def loads(cls, data, bitmask=False):
+        """Builds an object from the output of dumps(), with slots in set or
+        bitmask mode as given. Raises ValueError if the data is corrupt or of
+        an unknown version.
+
+        """
+        magic = cls.SERIAL_MAGIC
+        header = cls.SERIAL_HEADER
+        if data[:len(magic)] != magic:
+            raise ValueError("Not a serialized NFSM")
+        try:
+            pos = len(magic)
+            version, length, nchains, width, alphabetlen = \
+                    header.unpack_from(data, pos)
+            if version != cls.SERIAL_VERSION:
+                raise ValueError("Unknown serialization version {0}".format(version))
+            pos += header.size
+            alphabet = data[pos:pos+alphabetlen].decode("utf-8")
+            pos += alphabetlen
+
+            self = cls.__new__(cls)
+            self.length = length
+            self.charsets = Charsets(alphabet, bitmask)
+            self.alphabet = self.charsets.alphabet
+            self._chains = []
+            self._links = []
+
+            # The same few masks come up over and over again, so only decode
+            # each one once
+            values = {}
+            for _ in range(nchains):
+                chain = []
+                for _ in range(length):
+                    mask = data[pos:pos+width]
+                    if mask not in values:
+                        value = int.from_bytes(mask, "little")
+                        if not bitmask:
+                            value = frozenset(c for c, bit in
+                                    self.charsets.bits.items() if value & bit)
+                        values[mask] = self.charsets.intern(value)
+                    chain.append(values[mask])
+                    pos += width
+
+                ngroups, = struct.unpack_from("<H", data, pos)
+                pos += 2
+                links = None
+                for _ in range(ngroups):
+                    size, = struct.unpack_from("<H", data, pos)
+                    group = struct.unpack_from("<{0}H".format(size), data, pos+2)
+                    pos += 2 + 2*size
+                    if links is None:
+                        links = {}
+                    for i in group:
+                        links[i] = group
+                self._chains.append(chain)
+                self._links.append(links)
+
+            if pos != len(data):
+                raise ValueError("Trailing data after serialized NFSM")
+        except (struct.error, UnicodeDecodeError, IndexError) as e:
+            raise ValueError("Corrupt serialized NFSM: {0}".format(e))
+
+        self._build_index()
+        return self
 
     def __str__(self):
         """Return normalized string representing this regex object.
@@ -312,27 +1106,6 @@ class NFSM:
         """
         out = []
         for chain in self.chains:
-            chainstr = io.StringIO()
-            for slot in chain:
-                if slot == self.alphabet:
-                    chainstr.write(".")
-                elif len(slot) > 3 and len(self.alphabet - slot) == 1:
-                    # Missing one element
-                    missing = (self.alphabet - slot).pop()
-                    alphabet = "".join(sorted(self.alphabet))
-                    i = alphabet.index(missing)
-                    
-                    if i == 0:
-                        chainstr.write("[{0}-{1}]".format(alphabet[1],alphabet[-1]))
-                    elif i == len(alphabet)-1:
-                        chainstr.write("[{0}-{1}]".format(alphabet[0],alphabet[-2]))
-                    else:
-                        chainstr.write("[{0}-{1}{2}-{3}]".format(alphabet[0],alphabet[i],alphabet[i+1],alphabet[-1]))
-                elif len(slot) == 1:
-                    chainstr.write("".join(slot))
-                else:
-                    chainstr.write("[{0}]".format("".join(sorted(slot))))
-            out.append(chainstr.getvalue())
+            out.append("".join(self.charsets.format(slot) for slot in chain))
 
         return "|\n".join(out)
-
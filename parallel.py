@@ -0,0 +1,82 @@
+#!/bin/env python3
+
+"""
+parallel.py - Compiles regexes across a pool of processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+
+from nfsm import NFSM
+
+def _compile_job(regex, length, alphabet, domains=None, bitmask=False):
+    """Runs in a worker process. Returns the compiled NFSM serialized with
+    NFSM.dumps(), which is much smaller and faster to send back than a pickle
+    of the chain lists. Compiles in bitmask mode if bitmask is true, which
+    is what int domains need.
+
+    """
+    return NFSM(regex, length, alphabet, bitmask=bitmask,
+            domains=domains).dumps()
+
+def compile_cost(regex, length):
+    """Returns a rough guess at how expensive a regex is to compile for a
+    line of the given length. Only useful for comparing regexes.
+
+    Every repeated item can take up to length different repeat counts, and
+    the chain engine expands every combination of them.
+
+    """
+    repeats = regex.count("*") + regex.count("+") + regex.count("{")
+    return (length + 1) ** repeats * (regex.count("|") + 1)
+
+def compile_all(jobs, bitmask=False, workers=None, cache=None):
+    """Compiles the NFSM for each (regex, length, alphabet) tuple in jobs, and
+    returns them in the same order. A job can also be a (regex, length,
+    alphabet, domains) tuple, to compile with per-slot domains (see NFSM).
+
+    The jobs are spread over a process pool of the given number of workers,
+    defaulting to one per CPU. The most expensive regexes (see
+    compile_cost()) are submitted first, so a slow one doesn't end up running
+    alone at the end. With one worker, or only one job to do, everything is
+    compiled in this process.
+
+    If cache, a cache.CompileCache, is given, it is checked first and
+    updated with whatever had to be compiled. Jobs with domains depend on the
+    state of a board, so they are never cached.
+
+    """
+    results = [None] * len(jobs)
+    todo = []
+    cacheable = set()
+    for i, job in enumerate(jobs):
+        if cache is not None and _domains(job) is None:
+            cacheable.add(i)
+            results[i] = cache.lookup(*job[:3], bitmask=bitmask)
+        if results[i] is None:
+            todo.append(i)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    todo.sort(key=lambda i: compile_cost(*jobs[i][:2]), reverse=True)
+
+    if workers <= 1 or len(todo) <= 1:
+        for i in todo:
+            regex, length, alphabet = jobs[i][:3]
+            results[i] = NFSM(regex, length, alphabet, bitmask=bitmask,
+                    domains=_domains(jobs[i]))
+    elif todo:
+        with ProcessPoolExecutor(min(workers, len(todo))) as pool:
+            futures = {pool.submit(_compile_job, *jobs[i][:3],
+                _domains(jobs[i]), bitmask): i for i in todo}
+            for future in as_completed(futures):
+                results[futures[future]] = NFSM.loads(future.result(), bitmask)
+
+    for i in todo:
+        if i in cacheable:
+            cache.put(*jobs[i][:3], results[i])
+    return results
+
+def _domains(job):
+    """Returns the domains of a job for compile_all(), or None"""
+    return job[3] if len(job) > 3 else None
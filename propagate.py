@@ -0,0 +1,152 @@
+#!/bin/env python3
+
+"""
+propagate.py - Worklist driven constraint propagation between regexes and
+board cells.
+"""
+
+class Propagator:
+    """Keeps the cells of a board and the regex objects covering them
+    consistent with each other, AC-3 style.
+
+    lines is a list of (regex, cells) tuples, where regex is an object with
+    the NFSM interface and cells is the sequence of cell indexes making up
+    that line, in slot order, as in the lines of a topology.Topology. The
+    cell values are held by board, a topology.Board, and changed with
+    board.set_value() so they can be rolled back. Cell values must support &
+    with the regex's slot values, so use frozensets or sets with a set mode
+    regex, and ints with a bitmask mode one.
+
+    Instead of re-applying every cell to every regex until nothing changes,
+    only regexes with cells that changed since they were last processed are
+    queued, and only the changed slots are re-applied. A back-index from each
+    cell to the (line, slot) pairs covering it is used to find them.
+
+    If normalize is true, the regexes processed in a round that have a
+    normalize() method (see NFSM.normalize) get it called at the end of the
+    round, to drop the chains the new constraints made redundant.
+
+    The work is counted in rounds. Round 1 processes every line; round n+1
+    processes the lines queued up during round n. Compared to processing every
+    line in every round, the work skipped is available from skipped().
+
+    """
+    def __init__(self, lines, board, normalize=False):
+        self.lines = lines
+        self.board = board
+        self.normalize = normalize
+
+        # The list of (line number, slot) pairs covering each cell, by cell
+        # index
+        self.index = [[] for _ in board.values]
+        for lineno, (_, cells) in enumerate(lines):
+            for slot, cell in enumerate(cells):
+                self.index[cell].append((lineno, slot))
+
+        self.stats = {
+                "rounds": 0,
+                "lines processed": 0,
+                "slots constrained": 0,
+                "slots peeked": 0,
+                "cells changed": 0,
+                "chains dropped": 0,
+                }
+
+        # Maps each queued line number to the set of its slots whose cells
+        # changed. self._queue holds the line numbers for the next round.
+        self._pending = {}
+        self._queue = []
+        for lineno, (_, cells) in enumerate(lines):
+            self._mark(lineno, range(len(cells)))
+
+    def _mark(self, lineno, slots):
+        if lineno not in self._pending:
+            self._pending[lineno] = set()
+            self._queue.append(lineno)
+        self._pending[lineno].update(slots)
+
+    def touch(self, cell):
+        """Call this after changing the value of the cell at the given index
+        from outside the propagator, so the lines covering it get processed
+        by the next run()
+
+        """
+        for lineno, slot in self.index[cell]:
+            self._mark(lineno, (slot,))
+
+    def clear(self):
+        """Forgets about all queued work"""
+        self._pending.clear()
+        self._queue = []
+
+    def run(self, callback=None):
+        """Propagates until nothing changes. If given, callback is called with
+        the round number after each round.
+
+        Returns False if some cell ran out of possible characters, meaning
+        the board has no solution, and True otherwise. On failure the queue is
+        cleared and the cells and regexes are left partially updated.
+
+        """
+        while self._queue:
+            queue, self._queue = self._queue, []
+            self.stats["rounds"] += 1
+            for lineno in queue:
+                if not self._process(lineno):
+                    self.clear()
+                    return False
+            if self.normalize:
+                for lineno in queue:
+                    regex = self.lines[lineno][0]
+                    if hasattr(regex, "normalize"):
+                        self.stats["chains dropped"] += regex.normalize()
+            if callback is not None:
+                callback(self.stats["rounds"])
+        return True
+
+    def _process(self, lineno):
+        """Applies the changed cells of one line to its regex, then narrows
+        every cell of the line by what the regex allows. Returns False if a
+        cell became empty.
+
+        """
+        regex, cells = self.lines[lineno]
+        slots = self._pending.pop(lineno)
+        values = self.board.values
+        stats = self.stats
+        stats["lines processed"] += 1
+
+        for slot in slots:
+            regex.constrain_slot(slot, values[cells[slot]])
+        stats["slots constrained"] += len(slots)
+
+        stats["slots peeked"] += len(cells)
+        for slot, cell in enumerate(cells):
+            value = values[cell]
+            newvalue = value & regex.peek_slot(slot)
+            if newvalue == value:
+                continue
+            if not newvalue:
+                return False
+            self.board.set_value(cell, newvalue)
+            stats["cells changed"] += 1
+
+            # This line is consistent with the new value already, every other
+            # line covering the cell needs another look
+            for other, otherslot in self.index[cell]:
+                if other != lineno:
+                    self._mark(other, (otherslot,))
+        return True
+
+    def skipped(self):
+        """Returns a dict with the number of line visits and slot operations
+        that were skipped, compared to processing every line in every round
+
+        """
+        rounds = self.stats["rounds"]
+        nslots = sum(len(cells) for _, cells in self.lines)
+        return {
+                "lines": rounds * len(self.lines) - self.stats["lines processed"],
+                "slots constrained": rounds * nslots - self.stats["slots constrained"],
+                "slots peeked": rounds * nslots - self.stats["slots peeked"],
+                }
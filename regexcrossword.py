@@ -1,10 +1,41 @@
 #!/usr/bin/env python3
 
+import argparse
 import string
 import time
 
-from nfsm import NFSM
-from hexgrid import HexGrid
+from nfsm import NFSM, Charsets, UnsupportedSyntax
+from unrolled import UnrolledNFA
+from chaindag import ChainDAG
+try:
+    from arraynfsm import ArrayNFSM
+except ImportError:
+    # NumPy isn't installed
+    ArrayNFSM = None
+from topology import Topology, Board
+from propagate import Propagator
+from search import Search
+from cache import CompileCache
+from parallel import compile_all, compile_cost
+
+# Engines that can be passed to main(). They all share the NFSM interface.
+engines = {
+        "chain": NFSM,
+        "unrolled": UnrolledNFA,
+        "dag": ChainDAG,
+        }
+if ArrayNFSM is not None:
+    engines["array"] = ArrayNFSM
+
+# With engine "auto", the chain engine is used for a line unless compiling
+# it is estimated to take more than the memory limit, at roughly this many
+# bytes for each slot of each chain. See choose_engine().
+CHAIN_SLOT_BYTES = 100
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Roughly how many bytes unrolling a regex with backreferences takes at its
+# peak for each slot of each branch of the unrolled engine
+UNROLLED_NODE_BYTES = 500
 
 # clockwise starting at the bottom of the lower left edge
 definitions = [
@@ -49,56 +80,275 @@ definitions = [
         ".*G.*V.*H.*",
         ]
 
-def main():
+def format_cells(charsets, values):
+    """Returns a string showing the solved letters of the given cell values,
+    with an underscore for each cell that isn't solved yet
 
-    grid = HexGrid(7, lambda: set(string.ascii_uppercase))
+    """
+    out = []
+    for value in values:
+        chars = charsets.decode(value)
+        out.append("".join(chars) if len(chars) == 1 else "_")
+    return "".join(out)
 
-    regexes = []
+def choose_engine(regexstr, length, alphabet, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Picks the engine for the given regex and line length, and returns a
+    (engine name, estimated number of chains) tuple. The chain engine is
+    picked if its estimated memory use fits in memory_limit bytes, and the
+    unrolled engine otherwise. That one grows polynomially with the line
+    length instead of with the number of chains, except that a regex with
+    backreferences is unrolled once for each of its branches (see
+    UnrolledNFA.estimate_branches()), which can be as many as the chains.
+    Raises ValueError if the branches don't fit in memory_limit either.
+
+    """
+    estimate = NFSM.estimate_chains(regexstr, length, alphabet)
+    if estimate * length * CHAIN_SLOT_BYTES <= memory_limit:
+        return "chain", estimate
+    branches = UnrolledNFA.estimate_branches(regexstr, length, alphabet)
+    if branches > 1 and branches * length * UNROLLED_NODE_BYTES > memory_limit:
+        raise ValueError("Regex {0!r} over {1} slots is estimated to take "
+                "more than {2} bytes to compile with any engine".format(
+                    regexstr, length, memory_limit))
+    return "unrolled", estimate
+
+def compile_lines(lines, alphabet, engine="chain", cache=None, workers=None,
+        domains=None, memory_limit=DEFAULT_MEMORY_LIMIT, choices=None):
+    """Builds the objects matching each (regexstr, length) pair in lines
+    with the named engine, and returns them in the same order. Falls back to
+    the chain engine for regexes the chosen engine can't handle.
+
+    Chain engine objects are compiled in parallel by parallel.compile_all()
+    with the given number of workers, and come from cache, a
+    cache.CompileCache, if one is given. Engines built from chains (those
+    with a from_nfsm() constructor) are converted from those.
+
+    If given, domains holds the per-slot domains (see NFSM) of each line,
+    which chain engine objects are compiled with. Other objects are
+    constrained to them after they are built.
+
+    With engine "auto", each line gets the engine choose_engine() picks for
+    it with the given memory_limit, and ValueError is raised if a line is
+    too big for any engine. If choices is given, a list, an (engine
+    name, estimated number of chains) tuple is appended to it for each line,
+    with None for the estimate unless engine is "auto".
+
+    Lines with the same regex, length and domains are only compiled once.
+    The first of them gets the compiled object and the others get copies of
+    it, which share its compiled structure (see NFSM.copy()) and only have
+    their own constraint state.
+
+    """
+    keys = [line if domains is None else line + (tuple(domains[i]),)
+            for i, line in enumerate(lines)]
+    distinct = list(dict.fromkeys(keys))
+    if len(distinct) < len(keys):
+        distinctchoices = []
+        compiled = dict(zip(distinct, compile_lines(
+            [key[:2] for key in distinct], alphabet, engine, cache, workers,
+            None if domains is None else [key[2] for key in distinct],
+            memory_limit, distinctchoices)))
+        if choices is not None:
+            picked = dict(zip(distinct, distinctchoices))
+            choices.extend(picked[key] for key in keys)
+        results = []
+        seen = set()
+        for key in keys:
+            result = compiled[key]
+            results.append(result.copy() if key in seen else result)
+            seen.add(key)
+        return results
+
+    if engine == "auto":
+        picks = [choose_engine(regexstr, length, alphabet, memory_limit)
+                for regexstr, length in lines]
+        if choices is not None:
+            choices.extend(picks)
+        results = [None] * len(lines)
+        for name in set(name for name, _ in picks):
+            picked = [i for i, (choice, _) in enumerate(picks)
+                    if choice == name]
+            compiled = compile_lines([lines[i] for i in picked], alphabet, name,
+                    cache, workers, domains and [domains[i] for i in picked])
+            for i, result in zip(picked, compiled):
+                results[i] = result
+        return results
+
+    if choices is not None:
+        choices.extend((engine, None) for _ in lines)
+    engineclass = engines[engine]
+    convert = getattr(engineclass, "from_nfsm", None)
+    results = [None] * len(lines)
+    if engine != "chain" and convert is None:
+        for i, (regexstr, length) in enumerate(lines):
+            try:
+                results[i] = engineclass(regexstr, length, alphabet,
+                        bitmask=True)
+            except UnsupportedSyntax:
+                continue
+            if domains is not None:
+                for slot, domain in enumerate(domains[i]):
+                    results[i].constrain_slot(slot, domain)
+
+    todo = [i for i, result in enumerate(results) if result is None]
+    compiled = compile_all([lines[i] + (alphabet,) if domains is None else
+            lines[i] + (alphabet, domains[i]) for i in todo],
+            bitmask=True, workers=workers, cache=cache)
+    for i, result in zip(todo, compiled):
+        if convert is not None:
+            try:
+                result = convert(result, bitmask=True)
+            except UnsupportedSyntax:
+                pass
+        results[i] = result
+    return results
+
+def solve(topology, regexes, charsets, limit=1, deadline=None):
+    """Solves a puzzle quietly, given its topology.Topology and a regex
+    object for each of its lines, in the same order. The regex objects are
+    constrained in place. charsets describes the cell values.
+
+    Propagates, then searches for up to limit solutions, or all of them if
+    limit is None, if propagation leaves cells unsolved. Returns a list of
+    solutions, each a list with the value of every cell of the board. Raises
+    TimeoutError if the search runs past deadline (see Search.solve()).
+
+    """
+    board = Board([charsets.full] * topology.ncells)
+    propagator = Propagator([(regex, cells)
+        for regex, (_, cells) in zip(regexes, topology.lines)], board)
+    if not propagator.run():
+        return []
+    searcher = Search(propagator, board, charsets)
+    if all(len(charsets.members(board.values[cell])) == 1
+            for cell in searcher.cells):
+        return [list(board.values)]
+    solutions = []
+    for solution in searcher.solve(limit, deadline):
+        for cell, value in zip(searcher.cells, solution):
+            board.set_value(cell, value)
+        solutions.append(list(board.values))
+    return solutions
+
+def main(engine="auto", search="first", cache=None, workers=None,
+        lazy=None, memory_limit=DEFAULT_MEMORY_LIMIT, topology=None):
+    """Solves the puzzle in topology, a topology.Topology, or the hex puzzle
+    in definitions if not given, with the named engine (see engines), or
+    with the engine choose_engine() picks for each line if engine is "auto".
+
+    If propagation leaves cells unsolved, search picks what happens next:
+    "first" searches for one solution, "all" searches for and counts every
+    solution, and "none" stops at the propagation result.
+
+    Compiled chain engine objects are taken from cache, a
+    cache.CompileCache, if given. Compiling is spread over the given number
+    of worker processes, one per CPU by default.
+
+    If lazy is given, regexes with a parallel.compile_cost() over it are
+    put off until the others have been compiled and propagated, and are then
+    compiled with the cells of their lines as domains (see NFSM), which
+    leaves out the chains that can't fit the board any more.
+
+    """
+
+    # Cells and regex slots are int bitmasks over this alphabet
+    alphabet = string.ascii_uppercase
+    charsets = Charsets(alphabet, bitmask=True)
+
+    if topology is None:
+        topology = Topology.hex(7, definitions)
+    board = Board([charsets.full] * topology.ncells)
+    lines = topology.lines
+
+    sizes = topology.sizes()
+    deferred = []
+    if lazy is not None:
+        deferred = [i for i, size in enumerate(sizes)
+                if compile_cost(*size) > lazy]
+    now = [i for i in range(len(lines)) if i not in deferred]
 
     print("Compiling regex objects...")
-    for i, regexstr in enumerate(definitions[:13]):
-        print("{0:25}".format(regexstr), end="")
-        cells = list(grid.traverse_l2r(i))
-        regex = NFSM(regexstr, len(cells), string.ascii_uppercase)
-        regexes.append((regexstr, regex, cells))
-        print("  ...done")
-    for i, regexstr in enumerate(definitions[13:26]):
-        print("{0:25}".format(regexstr), end="")
-        cells = list(grid.traverse_ur2ll(i))
-        regex = NFSM(regexstr, len(cells), string.ascii_uppercase)
-        regexes.append((regexstr, regex, cells))
-        print("  ...done")
-    for i, regexstr in enumerate(definitions[26:]):
-        print("{0:25}".format(regexstr), end="")
-        cells = list(grid.traverse_lr2ul(i))
-        regex = NFSM(regexstr, len(cells), string.ascii_uppercase)
+    choices = []
+    compiled = dict(zip(now, compile_lines([sizes[i] for i in now],
+        alphabet, engine, cache, workers, memory_limit=memory_limit,
+        choices=choices)))
+    if deferred:
+        print("Propagating before compiling {0} more...".format(len(deferred)))
+        if not Propagator([(compiled[i], lines[i][1]) for i in now],
+                board).run():
+            print("\nNo solution!")
+            return
+        domains = [board.gather(lines[i][1]) for i in deferred]
+        compiled.update(zip(deferred, compile_lines([sizes[i] for i in deferred],
+            alphabet, engine, cache, workers, domains, memory_limit, choices)))
+    choices = dict(zip(now + deferred, choices))
+    compiled = [compiled[i] for i in range(len(lines))]
+    regexes = []
+    for i, ((regexstr, cells), regex) in enumerate(zip(lines, compiled)):
+        name, estimate = choices[i]
+        if estimate is None:
+            print("{0:25}  ...done ({1})".format(regexstr, name))
+        else:
+            print("{0:25}  ...done ({1}, ~{2} chains)".format(regexstr, name,
+                estimate))
         regexes.append((regexstr, regex, cells))
-        print("  ...done")
-
-    finished = False
-    iteration = 0
-    while not finished:
-        # Step 1: go and apply board constraints to the regexes
-        for _, r, cells in regexes:
-            for i, cell in enumerate(cells):
-                r.constrain_slot(i, cell)
-
-        # Step 2: go and apply regex constraints to the board
-        # finished will be set back to false if at least one cell changed
-        finished = True
-        for regexstr, r, cells in regexes:
-            for i, cell in enumerate(cells):
-                oldcell = cell.copy()
-                cell &= r.peek_slot(i)
-                if oldcell != cell:
-                    finished = False
-
-        # Step 3: print progress
-        iteration += 1
+
+    def print_progress(iteration):
         print("\nIteration {0}".format(iteration))
         for regexstr, _, cells in regexes:
-            print("{0:25} {1}".format(regexstr, "".join(("".join(c) if len(c)==1 else "_") for c in cells)))
+            print("{0:25} {1}".format(regexstr,
+                format_cells(charsets, board.gather(cells))))
+
+    propagator = Propagator([(r, cells) for _, r, cells in regexes], board)
+    if not propagator.run(print_progress):
+        print("\nNo solution!")
+        return
+
+    print("\nWork skipped by propagation: {0}".format(", ".join(
+        "{0} {1}".format(n, what) for what, n in propagator.skipped().items())))
+
+    if search == "none" or all(len(charsets.members(value)) == 1
+            for value, covering in zip(board.values, propagator.index)
+            if covering):
+        return
+
+    print("\nPropagation stalled, searching...")
+    searcher = Search(propagator, board, charsets)
+    solutions = searcher.solve(None if search == "all" else 1)
+    print("Found {0} solution(s) in {1} nodes with {2} backtracks".format(
+        len(solutions), searcher.stats["nodes"], searcher.stats["backtracks"]))
+    if not solutions:
+        return
+
+    for cell, value in zip(searcher.cells, solutions[0]):
+        board.set_value(cell, value)
+    print("\nSolution")
+    for regexstr, _, cells in regexes:
+        print("{0:25} {1}".format(regexstr,
+            format_cells(charsets, board.gather(cells))))
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Solves the regex crossword")
+    parser.add_argument("--engine", choices=sorted(engines) + ["auto"],
+            default="auto")
+    parser.add_argument("--search", choices=["first", "all", "none"],
+            default="first", help="what to do if propagation stalls")
+    parser.add_argument("--cache-dir", default=None,
+            help="where to cache compiled regexes")
+    parser.add_argument("--no-cache", action="store_true",
+            help="always compile regexes from scratch")
+    parser.add_argument("--workers", type=int, default=None,
+            help="number of processes to compile with")
+    parser.add_argument("--lazy", type=int, default=None, metavar="COST",
+            help="compile regexes costing more than this after propagating "
+            "the others")
+    parser.add_argument("--memory-limit", type=int,
+            default=DEFAULT_MEMORY_LIMIT // (1024*1024), metavar="MB",
+            help="with --engine auto, compile lines estimated to need more "
+            "than this with the unrolled engine")
+    args = parser.parse_args()
+
+    main(args.engine, args.search,
+            None if args.no_cache else CompileCache(args.cache_dir),
+            args.workers, args.lazy, args.memory_limit * 1024*1024)
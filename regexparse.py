@@ -0,0 +1,281 @@
+#!/bin/env python3
+
+"""
+regexparse.py - Regex parser shared by all the engines.
+
+A regex is tokenized in one pass, then parsed by recursive descent into a
+tree of the node classes below. Every engine compiles from the tree, so they
+all accept the same syntax and see the same errors, which are raised here
+before any compiling starts.
+
+Supported syntax: characters of the alphabet, ".", bracket expressions with
+optional "^", groups (nested, and quantified), alternation with "|", the
+quantifiers "*", "+", "?", {n}, {m,}, {,n} and {m,n}, and backreferences
+\\1 to \\9 to groups that were closed earlier.
+"""
+
+class Node:
+    """Base class of the parse tree nodes. minlen is the least number of
+    characters the node can match.
+
+    """
+    __slots__ = ("minlen",)
+
+class Chars(Node):
+    """Matches one character out of the set chars"""
+    __slots__ = ("chars",)
+    def __init__(self, chars):
+        self.chars = frozenset(chars)
+        self.minlen = 1
+
+    def __repr__(self):
+        return "Chars({0!r})".format("".join(sorted(self.chars)))
+
+class Concat(Node):
+    """Matches each of items in turn. Matches the empty string if there are
+    no items.
+
+    """
+    __slots__ = ("items",)
+    def __init__(self, items):
+        self.items = tuple(items)
+        self.minlen = sum(item.minlen for item in self.items)
+
+    def __repr__(self):
+        return "Concat({0!r})".format(list(self.items))
+
+class Alt(Node):
+    """Matches any one of options"""
+    __slots__ = ("options",)
+    def __init__(self, options):
+        self.options = tuple(options)
+        self.minlen = min(option.minlen for option in self.options)
+
+    def __repr__(self):
+        return "Alt({0!r})".format(list(self.options))
+
+class Repeat(Node):
+    """Matches item repeated at least least times, and at most most times,
+    or any number of times if most is None
+
+    """
+    __slots__ = ("item", "least", "most")
+    def __init__(self, item, least, most):
+        self.item = item
+        self.least = least
+        self.most = most
+        self.minlen = item.minlen * least
+
+    def __repr__(self):
+        return "Repeat({0!r}, {1}, {2})".format(self.item, self.least, self.most)
+
+class Group(Node):
+    """A capturing group, numbered from 1 in order of the opening
+    parentheses
+
+    """
+    __slots__ = ("index", "item")
+    def __init__(self, index, item):
+        self.index = index
+        self.item = item
+        self.minlen = item.minlen
+
+    def __repr__(self):
+        return "Group({0}, {1!r})".format(self.index, self.item)
+
+class Backref(Node):
+    """Matches the same characters as the last match of group"""
+    __slots__ = ("index", "group")
+    def __init__(self, group):
+        self.index = group.index
+        self.group = group
+        self.minlen = group.minlen
+
+    def __repr__(self):
+        return "Backref({0})".format(self.index)
+
+# Quantifier characters and their (least, most) repeat counts
+QUANTIFIERS = {
+        "*": (0, None),
+        "+": (1, None),
+        "?": (0, 1),
+        }
+
+def _repeat_count(regex, spec):
+    """Returns the (least, most) tuple for the inside of a {} quantifier"""
+    least, comma, most = spec.partition(",")
+    try:
+        least = int(least) if least.strip() else 0
+        if not comma:
+            most = least
+        else:
+            most = int(most) if most.strip() else None
+    except ValueError:
+        raise ValueError("Bad repeat count {{{0}}} in {1!r}".format(spec, regex))
+    if least < 0 or most is not None and most < least:
+        raise ValueError("Bad repeat count {{{0}}} in {1!r}".format(spec, regex))
+    return least, most
+
+def tokenize(regex):
+    """Splits a regex into a list of (kind, value, position) tokens. kind is
+    one of:
+    * "char": value is a character
+    * "any": a "."
+    * "set": value is a (negated, characters) tuple for a bracket expression
+    * "ref": value is the group number of a backreference
+    * "quantifier": value is a (least, most) tuple, see Repeat
+    * "(", ")" or "|"
+
+    """
+    tokens = []
+    pos = 0
+    while pos < len(regex):
+        c = regex[pos]
+        start = pos
+        pos += 1
+        if c in "()|":
+            tokens.append((c, None, start))
+        elif c == ".":
+            tokens.append(("any", None, start))
+        elif c in QUANTIFIERS:
+            tokens.append(("quantifier", QUANTIFIERS[c], start))
+        elif c == "{":
+            end = regex.find("}", pos)
+            if end == -1:
+                raise ValueError("Unterminated repeat count! {0!r}".format(regex))
+            tokens.append(("quantifier", _repeat_count(regex, regex[pos:end]),
+                start))
+            pos = end + 1
+        elif c == "[":
+            end = regex.find("]", pos)
+            if end == -1:
+                raise ValueError("Unterminated bracket! {0!r}".format(regex))
+            negated = regex[pos:pos+1] == "^"
+            tokens.append(("set", (negated, regex[pos+negated:end]), start))
+            pos = end + 1
+        elif c == "\\":
+            if not regex[pos:pos+1].isdigit() or regex[pos] == "0":
+                raise ValueError("Bad group reference at {0} in {1!r}".format(
+                    start, regex))
+            tokens.append(("ref", int(regex[pos]), start))
+            pos += 1
+        else:
+            tokens.append(("char", c, start))
+    return tokens
+
+class Parser:
+    """Recursive descent parser over the tokens of a regex. Use parse()."""
+    def __init__(self, regex, alphabet):
+        self.regex = regex
+        self.alphabet = frozenset(alphabet)
+        self.tokens = tokenize(regex)
+        self.pos = 0
+        self.ngroups = 0
+        # Groups that have been closed, by number. Only these can be
+        # referenced.
+        self.groups = {}
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def parse(self):
+        node = self._parse_alt()
+        if self.pos != len(self.tokens):
+            # The only way to stop before the end is an unmatched ")"
+            raise ValueError("Unbalanced parentheses! {0!r}".format(self.regex))
+        return node
+
+    def _parse_alt(self):
+        options = [self._parse_concat()]
+        while self._peek() == "|":
+            self.pos += 1
+            options.append(self._parse_concat())
+        if len(options) == 1:
+            return options[0]
+        return Alt(options)
+
+    def _parse_concat(self):
+        items = []
+        while self._peek() not in (None, "|", ")"):
+            items.append(self._parse_repeat())
+        if len(items) == 1:
+            return items[0]
+        return Concat(items)
+
+    def _parse_repeat(self):
+        node = self._parse_atom()
+        if self._peek() == "quantifier":
+            least, most = self.tokens[self.pos][1]
+            self.pos += 1
+            node = Repeat(node, least, most)
+        if self._peek() == "quantifier":
+            # python's re reads A** as an error, and A*? or A{2}? as lazy
+            # repeats, which aren't supported
+            raise ValueError("Multiple repeat at {0} in {1!r}".format(
+                self.tokens[self.pos][2], self.regex))
+        return node
+
+    def _parse_atom(self):
+        kind, value, position = self.tokens[self.pos]
+        self.pos += 1
+
+        if kind == "(":
+            self.ngroups += 1
+            index = self.ngroups
+            item = self._parse_alt()
+            if self._peek() != ")":
+                raise ValueError("Unbalanced parentheses! {0!r}".format(self.regex))
+            self.pos += 1
+            group = Group(index, item)
+            self.groups[index] = group
+            return group
+
+        if kind == "char":
+            if value not in self.alphabet:
+                raise ValueError("Found char {0!r} not in the alphabet or recognized regex special char".format(value))
+            return Chars(value)
+        if kind == "any":
+            return Chars(self.alphabet)
+        if kind == "set":
+            negated, chars = value
+            # Characters outside the alphabet can never match, so engines
+            # only ever see characters of the alphabet
+            return Chars(self.alphabet - set(chars) if negated
+                    else self.alphabet & set(chars))
+        if kind == "ref":
+            if value not in self.groups:
+                raise ValueError("Reference to group {0} before it is closed "
+                        "in {1!r}".format(value, self.regex))
+            return Backref(self.groups[value])
+        if kind == "quantifier":
+            raise ValueError("Nothing to repeat at {0} in {1!r}".format(
+                position, self.regex))
+        raise ValueError("Unbalanced parentheses! {0!r}".format(self.regex))
+
+def referenced_groups(node):
+    """Returns the set of the numbers of the groups that are referenced by a
+    backreference somewhere in the given parse tree
+
+    """
+    if isinstance(node, Backref):
+        return {node.index}
+    children = ()
+    if isinstance(node, Concat):
+        children = node.items
+    elif isinstance(node, Alt):
+        children = node.options
+    elif isinstance(node, (Repeat, Group)):
+        children = (node.item,)
+    out = set()
+    for child in children:
+        out.update(referenced_groups(child))
+    return out
+
+def parse(regex, alphabet):
+    """Parses a regex over the given alphabet and returns the root node of
+    its parse tree. Raises ValueError if the regex is malformed.
+
+    """
+    return Parser(regex, alphabet).parse()
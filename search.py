@@ -0,0 +1,122 @@
+#!/bin/env python3
+
+"""
+search.py - Backtracking search for boards that propagation alone can't solve.
+"""
+
+import time
+
+class Search:
+    """Depth-first search over cell assignments, on top of a Propagator.
+
+    propagator is a propagate.Propagator, and board the topology.Board it
+    was built with. Every regex in the propagator's lines must support
+    checkpoint() and rollback(). charsets is the nfsm.Charsets object
+    describing the cell values. Only the cells covered by some line are
+    searched, and cells are referred to by their index.
+
+    At each branch the unsolved cell with the fewest candidates is picked,
+    preferring the cell covered by the most lines when there is a tie. Each
+    candidate character is assigned in turn and propagated, and the search
+    backtracks when propagation hits a contradiction.
+
+    self.stats counts the search nodes visited, the backtracks taken because
+    propagation hit a contradiction, and the solutions found, across all calls
+    to solve().
+
+    """
+    def __init__(self, propagator, board, charsets):
+        self.propagator = propagator
+        self.board = board
+        self.charsets = charsets
+        self.cells = [cell for cell, covering in enumerate(propagator.index)
+                if covering]
+        self.regexes = [regex for regex, _ in propagator.lines]
+        self._deadline = None
+        self.stats = {
+                "nodes": 0,
+                "backtracks": 0,
+                "solutions": 0,
+                }
+
+    def solve(self, limit=1, deadline=None):
+        """Searches for solutions, stopping after limit of them are found, or
+        finding them all if limit is None.
+
+        Returns a list of solutions. Each solution is a list of cell values in
+        the same order as self.cells. The board and regexes are rolled back
+        to the state they were in before the call, except for the initial
+        propagation of any queued work.
+
+        If deadline, a time.monotonic() value, is given and passes before the
+        search is done, it is abandoned with a TimeoutError, after rolling
+        back like above.
+
+        """
+        if not self.propagator.run():
+            return []
+        solutions = []
+        self._deadline = deadline
+        marks = self._checkpoint()
+        try:
+            self._search(solutions, limit)
+        except TimeoutError:
+            self._rollback(marks)
+            raise
+        return solutions
+
+    def _checkpoint(self):
+        return (self.board.checkpoint(),
+                [regex.checkpoint() for regex in self.regexes])
+
+    def _rollback(self, marks):
+        boardmark, regexmarks = marks
+        self.board.rollback(boardmark)
+        for regex, mark in zip(self.regexes, regexmarks):
+            regex.rollback(mark)
+
+    def _choose(self):
+        """Returns the unsolved cell to branch on, or None if every cell is
+        solved
+
+        """
+        members = self.charsets.members
+        index = self.propagator.index
+        values = self.board.values
+        best = None
+        bestkey = None
+        for cell in self.cells:
+            candidates = len(members(values[cell]))
+            if candidates < 2:
+                continue
+            key = (candidates, -len(index[cell]))
+            if bestkey is None or key < bestkey:
+                best = cell
+                bestkey = key
+        return best
+
+    def _search(self, solutions, limit):
+        """Returns True once limit solutions have been found"""
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise TimeoutError("Search ran out of time")
+        self.stats["nodes"] += 1
+        cell = self._choose()
+        if cell is None:
+            solutions.append(self.board.gather(self.cells))
+            self.stats["solutions"] += 1
+            return limit is not None and len(solutions) >= limit
+
+        charsets = self.charsets
+        for key in sorted(charsets.members(self.board.values[cell])):
+            marks = self._checkpoint()
+            self.board.set_value(cell, charsets.join((key,)))
+            self.propagator.touch(cell)
+            if self.propagator.run():
+                done = self._search(solutions, limit)
+            else:
+                done = False
+                self.stats["backtracks"] += 1
+            self._rollback(marks)
+            if done:
+                return True
+        return False
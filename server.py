@@ -0,0 +1,251 @@
+#!/bin/env python3
+
+"""
+server.py - Long running solve service on a local TCP or Unix socket.
+
+Clients send one JSON object per line and get one JSON object back per
+line, in the same order. A puzzle, in the format batch.py reads, is
+answered with its result:
+
+    {"id": ..., "solutions": [[cell letters], ...]}
+
+or with an "error" entry if it can't be solved, the server is too busy or
+the solve takes too long. {"command": "stats"} is answered with the
+server's stats instead, see SolveServer.stats().
+
+Puzzles are solved in a pool of worker processes. Each worker keeps the
+compiled regex objects of the puzzles it has seen in an LRU cache bounded by
+their estimated size (see batch.CompiledCache), so common patterns such as
+.* are only compiled once per worker.
+
+Run "python server.py --port 8765" or "python server.py --unix /tmp/solve.sock".
+"""
+
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import os
+import statistics
+import time
+
+import batch
+import regexcrossword
+
+# How many latencies to keep for the percentiles in the stats
+LATENCY_WINDOW = 1000
+
+# How many seconds past its timeout to wait for a worker that is still
+# compiling, before answering with a timeout anyway
+TIMEOUT_GRACE = 5.0
+
+def _init_worker(cache_bytes):
+    batch.set_cache_size(cache_bytes)
+
+def _solve_job(puzzle, engine, limit, timeout):
+    """Runs in a worker process. Returns the result of the puzzle, the
+    worker's process id and its compiled regex cache hits and misses so far.
+
+    """
+    result = batch.solve_puzzle(puzzle, engine, limit, timeout)
+    stats = batch.cache.stats
+    return result, os.getpid(), stats["hits"], stats["misses"]
+
+class SolveServer:
+    """Solves puzzles sent over a socket in a pool of worker processes.
+
+    At most max_queue puzzles are waiting or being solved at any time;
+    puzzles beyond that are answered right away with a "busy" error, so a
+    flood of requests can't pile up unbounded work. Clients that want to
+    wait should retry. Each connection is read one request at a time, so a
+    client that sends faster than it is answered is slowed down by the
+    socket.
+
+    A puzzle that isn't solved within timeout seconds is answered with a
+    "timeout" error. The worker gives up the search by itself at that point
+    (see batch.solve_puzzle()) and moves on to the next puzzle. Compiling
+    can't be interrupted that way, so a puzzle still compiling TIMEOUT_GRACE
+    seconds later is answered with a timeout while its worker finishes the
+    compile, which stays in its cache; with engine "auto" compiles are kept
+    affordable by regexcrossword.choose_engine().
+
+    Each worker's cache of compiled regexes holds up to cache_bytes of
+    them, as estimated by batch.estimated_bytes().
+
+    """
+    def __init__(self, workers=None, engine="auto", limit=1, timeout=30.0,
+            max_queue=100, cache_bytes=batch.CACHE_BYTES):
+        self.engine = engine
+        self.limit = limit
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self._pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                initargs=(cache_bytes,))
+        self._server = None
+
+        self.queued = 0
+        self.counts = {
+                "requests": 0,
+                "solved": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "rejected": 0,
+                }
+        # Maps each worker's process id to its (hits, misses) cache counts
+        self._caches = {}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, host="127.0.0.1", port=None, path=None):
+        """Starts listening on the given Unix socket path if given, and on
+        the given TCP host and port otherwise. Returns the asyncio server.
+
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        """Stops listening and shuts the worker pool down"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def solve(self, puzzle):
+        """Solves a puzzle dict in the worker pool and returns its result
+        dict, with an "error" entry if it couldn't be solved
+
+        """
+        self.counts["requests"] += 1
+        if self.queued >= self.max_queue:
+            self.counts["rejected"] += 1
+            return {"id": _id(puzzle), "error": "busy"}
+
+        start = time.perf_counter()
+        self.queued += 1
+        future = asyncio.get_running_loop().run_in_executor(self._pool,
+                _solve_job, puzzle, self.engine, self.limit, self.timeout)
+        # A puzzle that times out while compiling keeps its worker busy, so
+        # it stays queued until the worker is done with it
+        future.add_done_callback(self._done)
+        try:
+            result, pid, hits, misses = await asyncio.wait_for(
+                    asyncio.shield(future), self.timeout + TIMEOUT_GRACE)
+        except asyncio.TimeoutError:
+            self.counts["timeouts"] += 1
+            return {"id": _id(puzzle), "error": "timeout"}
+        except Exception as e:
+            # A crashed worker or a bug, not a problem with the puzzle
+            self.counts["errors"] += 1
+            return {"id": _id(puzzle), "error": "{0}: {1}".format(
+                type(e).__name__, e)}
+        self._caches[pid] = (hits, misses)
+        self._latencies.append(time.perf_counter() - start)
+        if result.get("error") == "timeout":
+            self.counts["timeouts"] += 1
+        else:
+            self.counts["errors" if "error" in result else "solved"] += 1
+        return result
+
+    def _done(self, future):
+        self.queued -= 1
+
+    def stats(self):
+        """Returns a dict with the request counts, the number of puzzles
+        waiting or being solved, the compiled regex cache hits, misses and
+        hit rate summed over the workers, and the median, 95th percentile
+        and maximum latency in seconds of the recent solves.
+
+        """
+        hits = sum(h for h, _ in self._caches.values())
+        misses = sum(m for _, m in self._caches.values())
+        latencies = sorted(self._latencies)
+        out = dict(self.counts)
+        out.update({
+                "queue_depth": self.queued,
+                "cache_hits": hits,
+                "cache_misses": misses,
+                "cache_hit_rate": hits / (hits + misses) if hits + misses else None,
+                "latency_median": statistics.median(latencies)
+                    if latencies else None,
+                "latency_p95": latencies[math.ceil(0.95 * len(latencies)) - 1]
+                    if latencies else None,
+                "latency_max": latencies[-1] if latencies else None,
+                })
+        return out
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"id": None, "error": str(e)}
+                else:
+                    if isinstance(request, dict) and "command" in request:
+                        response = self._command(request["command"])
+                    else:
+                        response = await self.solve(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _command(self, command):
+        if command == "stats":
+            return self.stats()
+        return {"error": "Unknown command {0!r}".format(command)}
+
+def _id(puzzle):
+    return puzzle.get("id") if isinstance(puzzle, dict) else None
+
+async def serve(server, host, port, path):
+    """Runs server until cancelled"""
+    listener = await server.start(host, port, path)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves regex crossword "
+            "solutions on a local socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, metavar="PATH",
+            help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--engine", choices=sorted(regexcrossword.engines)
+            + ["auto"], default="auto")
+    parser.add_argument("--workers", type=int, default=None,
+            help="number of processes to solve with")
+    parser.add_argument("--limit", type=int, default=1,
+            help="maximum number of solutions per puzzle, 0 for all of them")
+    parser.add_argument("--timeout", type=float, default=30.0,
+            help="seconds to wait for a solve")
+    parser.add_argument("--max-queue", type=int, default=100,
+            help="puzzles waiting or being solved before new ones are "
+            "turned away")
+    parser.add_argument("--cache-mb", type=int,
+            default=batch.CACHE_BYTES // (1024*1024), metavar="MB",
+            help="estimated size of the compiled regexes to keep in each "
+            "worker")
+    args = parser.parse_args()
+
+    server = SolveServer(args.workers, args.engine, args.limit or None,
+            args.timeout, args.max_queue, args.cache_mb * 1024*1024)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
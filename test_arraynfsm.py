@@ -0,0 +1,117 @@
+import unittest
+import re
+from itertools import product
+
+from nfsm import NFSM
+from regexcrossword import compile_lines
+
+try:
+    from arraynfsm import ArrayNFSM
+except ImportError:
+    ArrayNFSM = None
+
+@unittest.skipIf(ArrayNFSM is None, "NumPy is not installed")
+class TestArrayNFSM(unittest.TestCase):
+    def test_or_peek_and_constraint(self):
+        r = ArrayNFSM("AB|BC", 2, "ABC")
+        self.assertEqual(set("AB"), r.peek_slot(0))
+        self.assertEqual(set("BC"), r.peek_slot(1))
+
+        r.constrain_slot(0, set("AC"))
+
+        self.assertEqual(set("A"), r.peek_slot(0))
+        self.assertEqual(set("B"), r.peek_slot(1))
+        self.assertEqual("AB", str(r))
+
+    def test_bitmask(self):
+        r = ArrayNFSM("A+[^A]*", 3, "ABC", bitmask=True)
+        self.assertEqual(1, r.peek_slot(0))
+        self.assertEqual(7, r.peek_slot(1))
+        r.constrain_slot(2, r.encode("A"))
+        self.assertEqual(1, r.peek_slot(1))
+
+    def test_backreference(self):
+        r = ArrayNFSM("(.)(.)\\2\\1", 4, "ABC")
+        self.assertTrue(r.match("ABBA"))
+        self.assertFalse(r.match("ABCA"))
+        r.constrain_slot(3, "A")
+        self.assertEqual(set("A"), r.peek_slot(0))
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+        self.assertEqual([{0: (0, 3), 3: (0, 3), 1: (1, 2), 2: (1, 2)}],
+                r.links)
+
+    def test_empty(self):
+        self.assertTrue(ArrayNFSM("A*", 0, "A").match(""))
+        self.assertFalse(ArrayNFSM("A", 0, "A").match(""))
+
+    def test_copy(self):
+        r = ArrayNFSM("...", 3, "ABC")
+        r2 = r.copy()
+        r2.constrain_slot(1, "A")
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+        self.assertEqual(set("A"), r2.peek_slot(1))
+
+    def test_rollback(self):
+        r = ArrayNFSM("(RR|HHH)*", 7, "RHA")
+        start = str(r)
+        mark = r.checkpoint()
+        r.constrain_slot(0, "H")
+        self.assertEqual(set("R"), r.peek_slot(3))
+        mark2 = r.checkpoint()
+        r.constrain_slot(3, "H")
+        self.assertEqual(set(), r.peek_slot(0))
+        r.rollback(mark2)
+        self.assertEqual(set("R"), r.peek_slot(3))
+        r.rollback(mark)
+        self.assertEqual(start, str(r))
+
+    def test_from_nfsm(self):
+        chainr = NFSM("(.)C\\1", 3, "ABC")
+        chainr.constrain_slot(0, "AB")
+        r = ArrayNFSM.from_nfsm(chainr, bitmask=True)
+        self.assertEqual(str(chainr), str(r))
+        self.assertEqual(r.encode("AB"), r.peek_slot(2))
+
+    def test_compile_lines(self):
+        results = compile_lines([("(.)\\1", 2), ("A*", 3)], "AB", "array",
+                workers=1)
+        self.assertEqual([ArrayNFSM, ArrayNFSM], [type(r) for r in results])
+        self.assertEqual(1, results[1].peek_slot(2))
+
+@unittest.skipIf(ArrayNFSM is None, "NumPy is not installed")
+class TestSameAsChains(unittest.TestCase):
+    """Compares the array engine with the chain engine and python's re module
+    for every string over a small alphabet
+
+    """
+    regexes = [
+            ("(DI|NS|TH|OM)*", 4, "DINSTHOMZ"),
+            ("(RR|HHH)*.?", 6, "RHZ"),
+            ("(...?)\\1*", 6, "AB"),
+            ("P+(..)\\1.*", 6, "PAB"),
+            ("(A|BC){2,3}C{,2}", 5, "ABC"),
+            ("[^C]*[^R]*III.*", 6, "CRIX"),
+            ]
+
+    def test_match(self):
+        for regex_str, length, alphabet in self.regexes:
+            myr = ArrayNFSM(regex_str, length, alphabet)
+            realr = re.compile(regex_str+"$")
+            strings = ["".join(x) for x in product(alphabet, repeat=length)]
+            for s, many in zip(strings, myr.match_many(strings)):
+                self.assertEqual(bool(realr.match(s)), myr.match(s), msg=s)
+                self.assertEqual(bool(realr.match(s)), many, msg=s)
+
+    def test_peek(self):
+        for regex_str, length, alphabet in self.regexes:
+            myr = ArrayNFSM(regex_str, length, alphabet)
+            chainr = NFSM(regex_str, length, alphabet)
+            for slot, chars in ((1, alphabet[0]), (length-1, alphabet[1:])):
+                myr.constrain_slot(slot, chars)
+                chainr.constrain_slot(slot, chars)
+                for i in range(length):
+                    self.assertEqual(chainr.peek_slot(i), myr.peek_slot(i))
+                self.assertEqual(str(chainr), str(myr))
+
+if __name__ == "__main__":
+    unittest.main()
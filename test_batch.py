@@ -0,0 +1,110 @@
+import unittest
+import json
+
+import batch
+import regexcrossword
+
+def puzzle(id, rows, columns, alphabet="ABC"):
+    return json.dumps({"id": id, "alphabet": alphabet,
+        "topology": {"shape": "rectangular", "rows": rows, "columns": columns}})
+
+class TestBatch(unittest.TestCase):
+    lines = [
+            puzzle(1, ["A[BC]", "C*"], ["[AB]C", "BC|AA"]),
+            "",
+            puzzle("two", ["AA", ".."], ["B.", ".."]),
+            puzzle(3, ["A*|B*", "A*|B*"], ["A*|B*", "A*|B*"]),
+            "not json",
+            json.dumps({"id": 5, "topology": {"shape": "cube"}}),
+            ]
+
+    def _check(self, results):
+        self.assertEqual([0, 1, 2, 3, 4], [r["index"] for r in results])
+        self.assertEqual([[["A", "B", "C", "C"]], [], [["A"] * 4]],
+                [r["solutions"] for r in results[:3]])
+        self.assertEqual([1, "two", 3, None, 5], [r["id"] for r in results])
+        self.assertIn("error", results[3])
+        self.assertIn("error", results[4])
+
+    def test_serial(self):
+        self._check(list(batch.solve_all(self.lines, workers=1)))
+
+    def test_pool(self):
+        self._check(list(batch.solve_all(self.lines, workers=2)))
+        results = list(batch.solve_all(self.lines, workers=2, ordered=False))
+        self._check(sorted(results, key=lambda r: r["index"]))
+
+    def test_crash(self):
+        # An exception while solving one puzzle doesn't stop the others
+        def crash(*args):
+            raise RecursionError("maximum recursion depth exceeded")
+        solve = regexcrossword.solve
+        regexcrossword.solve = crash
+        try:
+            results = list(batch.solve_all(self.lines[:1], workers=1))
+        finally:
+            regexcrossword.solve = solve
+        self.assertEqual([{"index": 0, "id": 1,
+            "error": "RecursionError: maximum recursion depth exceeded"}],
+            results)
+        self._check(list(batch.solve_all(self.lines, workers=1)))
+
+    def test_limit(self):
+        result = batch.solve_puzzle(json.loads(self.lines[3]), limit=None)
+        self.assertEqual(2, len(result["solutions"]))
+
+    def test_uncovered(self):
+        # The corners of a plus shape aren't on any line
+        line = json.dumps({"topology": {"shape": "lines", "ncells": 4,
+            "lines": [["AB", [0, 1]], ["BC", [1, 2]]]}})
+        result = next(batch.solve_all([line], workers=1))
+        self.assertEqual([["A", "B", "C", None]], result["solutions"])
+
+    def test_bundled(self):
+        line = json.dumps({"topology": {"shape": "hex", "sidelen": 7,
+            "regexes": regexcrossword.definitions}})
+        result = next(batch.solve_all([line], workers=1))
+        self.assertEqual(1, len(result["solutions"]))
+        self.assertEqual(127, len(result["solutions"][0]))
+
+    def test_warm_cache(self):
+        batch.set_cache_size(batch.CACHE_BYTES)
+        list(batch.solve_all(self.lines[:1] * 3, workers=1))
+        self.assertEqual(4, batch.cache.stats["misses"])
+        self.assertEqual(8, batch.cache.stats["hits"])
+
+    def test_cache_bytes(self):
+        # Bounded by the estimated size of the objects, not their number
+        small = batch.estimated_bytes(batch._compile("A*", 3, "AB"))
+        big = batch.estimated_bytes(batch._compile("(A|B)*", 8, "AB"))
+        self.assertGreater(big, small)
+        cache = batch.CompiledCache(big + small)
+        cache.get("A*", 3, "AB")
+        cache.get("(A|B)*", 8, "AB")
+        self.assertEqual(2, len(cache))
+        cache.get("A*", 3, "AB")
+        cache.get("B*", 3, "AB")
+        # The big one was used least recently
+        self.assertEqual(1, cache.stats["evictions"])
+        self.assertEqual(2 * small, cache.bytes)
+        self.assertEqual(1, cache.stats["hits"])
+
+        # Too big to keep at all
+        cache.get("(A|B)*", 9, "AB")
+        self.assertEqual(2, len(cache))
+        self.assertEqual(2 * small, cache.bytes)
+
+    def test_estimated_bytes(self):
+        for engine in ("chain", "unrolled", "dag"):
+            self.assertGreater(batch.estimated_bytes(
+                batch._compile("(A|B)*(.)\\1", 6, "AB", engine)), 0)
+
+    def test_timeout(self):
+        # Every board is a solution, far too many to find them all
+        line = puzzle(6, ["[AB]*"] * 12, ["[AB]*"] * 12)
+        result = next(batch.solve_all([line], workers=1, limit=None,
+            timeout=0.2))
+        self.assertEqual({"index": 0, "id": 6, "error": "timeout"}, result)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_definitions(self):
+        # Small enough to solve quickly, and solvable by construction
+        definitions = benchmark.synthetic_definitions(3)
+        self.assertEqual(15, len(definitions))
+        self.assertEqual(definitions, benchmark.synthetic_definitions(3))
+        lines, solution = benchmark.solve(3, definitions, "unrolled")
+        self.assertEqual(19, len(solution))
+        self.assertTrue(all(len(c) == 1 for c in solution.values()))
+
+    def test_measure(self):
+        calls = []
+        record = benchmark.measure(lambda x: calls.append(x),
+                setup=lambda: 1, repeat=3)
+        self.assertEqual([1, 1, 1, 1], calls)
+        self.assertLessEqual(record["min"], record["median"])
+        self.assertIn("peak_bytes", record)
+
+    def test_compare(self):
+        def run(*times):
+            return {"results": [{"benchmark": "compile", "engine": "chain",
+                "name": str(i), "length": 7, "min": t}
+                for i, t in enumerate(times)]}
+        old = run(1.0, 1.0, 1.0)
+        new = run(1.05, 2.0, 0.5)
+        new["results"].append({"benchmark": "compile", "engine": "chain",
+            "name": "0", "length": 8, "min": 9.0})
+        regressions = benchmark.compare(old, new)
+        self.assertEqual([(("compile", "chain", "1", 7), 1.0, 2.0, 2.0)],
+                regressions)
+        self.assertEqual(2, len(benchmark.compare(old, new, threshold=0.01)))
+
+if __name__ == "__main__":
+    unittest.main()
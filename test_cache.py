@@ -0,0 +1,94 @@
+import unittest
+import os
+import tempfile
+
+from nfsm import NFSM
+from cache import CompileCache
+
+class TestCompileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _entries(self):
+        return [n for n in os.listdir(self.tmpdir.name) if n.endswith(".nfsm")]
+
+    def test_hit(self):
+        r = self.cache.get("(.)(.)\\2\\1|AB*", 4, "ABC")
+        self.assertEqual(1, self.cache.stats["misses"])
+        self.assertEqual(1, len(self._entries()))
+
+        r2 = self.cache.get("(.)(.)\\2\\1|AB*", 4, "CBA", bitmask=True)
+        self.assertEqual(1, self.cache.stats["hits"])
+        self.assertEqual(str(r), str(r2))
+        self.assertEqual(r.links, r2.links)
+        self.assertTrue(r2.match("ABBA"))
+        self.assertFalse(r2.match("ABCA"))
+
+    def test_key(self):
+        self.cache.get("A*", 3, "AB")
+        self.cache.get("A*", 4, "AB")
+        self.cache.get("A*", 3, "ABC")
+        self.assertEqual(3, self.cache.stats["misses"])
+        self.assertEqual(3, len(self._entries()))
+
+    def test_corrupt(self):
+        key = CompileCache.key("A*B*", 3, "AB")
+        for data in (b"garbage", b"RXCC\x63\x00\x00\x00\x00", b""):
+            with open(self.cache.path(key), "wb") as f:
+                f.write(data)
+            r = self.cache.get("A*B*", 3, "AB")
+            self.assertEqual(4, len(r.chains))
+        self.assertEqual(3, self.cache.stats["bad entries"])
+
+        # It was rewritten, so this one hits
+        self.cache.get("A*B*", 3, "AB")
+        self.assertEqual(1, self.cache.stats["hits"])
+
+    def test_truncated(self):
+        self.cache.get("A*B*", 3, "AB")
+        path = self.cache.path(CompileCache.key("A*B*", 3, "AB"))
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:-3])
+        self.assertEqual(4, len(self.cache.get("A*B*", 3, "AB").chains))
+        self.assertEqual(1, self.cache.stats["bad entries"])
+
+    def test_evict(self):
+        self.cache.get("A*B*", 3, "AB")
+        size = os.path.getsize(self.cache.path(CompileCache.key("A*B*", 3, "AB")))
+        # Room for two entries but not three
+        self.cache.max_bytes = size * 5 // 2
+        self.cache.get("B*A*", 3, "AB")
+        # Use the first one, so the second one is least recently used
+        oldest = self.cache.path(CompileCache.key("B*A*", 3, "AB"))
+        os.utime(oldest, ns=(0, 0))
+        self.cache.get("A*B*", 3, "AB")
+        self.cache.get("A*C*", 3, "ABC")
+
+        self.assertEqual(1, self.cache.stats["evictions"])
+        self.assertFalse(os.path.exists(oldest))
+        self.assertEqual(2, len(self._entries()))
+
+class TestSerialization(unittest.TestCase):
+    def test_roundtrip(self):
+        r = NFSM("(..?)\\1*|A*", 6, "ABC")
+        r.constrain_slot(0, "AB")
+        for bitmask in (False, True):
+            r2 = NFSM.loads(r.dumps(), bitmask)
+            self.assertEqual(str(r), str(r2))
+            self.assertEqual(r.links, r2.links)
+            for i in range(6):
+                self.assertEqual(r.peek_slot(i), r2.decode(r2.peek_slot(i)))
+
+    def test_corrupt(self):
+        data = NFSM("AB", 2, "AB").dumps()
+        for bad in (b"", b"XXXX", data[:-1], data + b"\0"):
+            self.assertRaises(ValueError, NFSM.loads, bad)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import re
+from itertools import product
+
+from nfsm import NFSM
+from chaindag import ChainDAG
+from regexcrossword import compile_lines
+
+class TestChainDAG(unittest.TestCase):
+    def test_sharing(self):
+        # 1365 chains of 11 slots, but only a few distinct nodes per slot
+        r = ChainDAG("([^MC]|MM|CC)*", 11, "ABCM")
+        self.assertEqual(1365, len(r.chains))
+        self.assertLess(sum(len(layer) for layer in r.layers), 60)
+
+    def test_or_peek_and_constraint(self):
+        r = ChainDAG("AB|BC", 2, "ABC")
+        self.assertEqual(set("AB"), r.peek_slot(0))
+        self.assertEqual(set("BC"), r.peek_slot(1))
+
+        r.constrain_slot(0, set("AC"))
+
+        self.assertEqual(set("A"), r.peek_slot(0))
+        self.assertEqual(set("B"), r.peek_slot(1))
+        self.assertEqual("AB", str(r))
+
+    def test_shared_suffix_pruning(self):
+        # Both chains end in the same node. Killing one chain's prefix
+        # mustn't take the other one's suffix with it.
+        r = ChainDAG("AC|BC", 2, "ABC", bitmask=True)
+        self.assertEqual(1, len(r.layers[1]))
+        r.constrain_slot(0, "A")
+        self.assertEqual(r.encode("C"), r.peek_slot(1))
+        r.constrain_slot(0, "B")
+        self.assertEqual(0, r.peek_slot(1))
+
+    def test_backreference(self):
+        r = ChainDAG("(.)(.)\\2\\1|A...", 4, "ABC")
+        self.assertIsNotNone(r._linked)
+        self.assertTrue(r.match("ABBA"))
+        self.assertTrue(r.match("ACBA"))
+        self.assertFalse(r.match("BCAB"))
+        self.assertEqual([None, {0: (0, 3), 3: (0, 3), 1: (1, 2), 2: (1, 2)}],
+                r.links)
+        r.constrain_slot(3, "B")
+        self.assertEqual(set("AB"), r.peek_slot(0))
+        r.constrain_slot(0, "B")
+        self.assertEqual(set("B"), r.peek_slot(3))
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+
+    def test_empty(self):
+        self.assertTrue(ChainDAG("A*", 0, "A").match(""))
+        self.assertFalse(ChainDAG("A", 0, "A").match(""))
+
+    def test_copy(self):
+        r = ChainDAG("(.)\\1|..", 2, "ABC")
+        r2 = r.copy()
+        r2.constrain_slot(1, "A")
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+        self.assertEqual(set("A"), r2.peek_slot(1))
+
+    def test_rollback(self):
+        r = ChainDAG("(RR|HHH)*|(.).*\\2", 7, "RHA")
+        start = sorted(str(r).split("|\n"))
+        mark = r.checkpoint()
+        r.constrain_slot(0, "H")
+        self.assertEqual(set("RHA"), r.peek_slot(3))
+        mark2 = r.checkpoint()
+        r.constrain_slot(6, "A")
+        self.assertEqual(set(), r.peek_slot(0))
+        r.rollback(mark2)
+        self.assertEqual(set("RHA"), r.peek_slot(3))
+        r.rollback(mark)
+        self.assertEqual(start, sorted(str(r).split("|\n")))
+
+    def test_compile_lines(self):
+        results = compile_lines([("(.)\\1", 2), ("A*", 3)], "AB", "dag",
+                workers=1)
+        self.assertEqual([ChainDAG, ChainDAG], [type(r) for r in results])
+        self.assertEqual(1, results[1].peek_slot(2))
+
+class TestSameAsChains(unittest.TestCase):
+    """Compares the DAG engine with the chain engine and python's re module
+    for every string over a small alphabet
+
+    """
+    regexes = [
+            ("(DI|NS|TH|OM)*", 4, "DINSTHOMZ"),
+            ("(RR|HHH)*.?", 6, "RHZ"),
+            ("(...?)\\1*", 6, "AB"),
+            ("P+(..)\\1.*", 6, "PAB"),
+            ("[^C]*[^R]*III.*", 6, "CRIX"),
+            ("(A|BC){2,3}C{,2}", 5, "ABC"),
+            ]
+
+    def test_match(self):
+        for regex_str, length, alphabet in self.regexes:
+            myr = ChainDAG(regex_str, length, alphabet)
+            realr = re.compile(regex_str+"$")
+            strings = ["".join(x) for x in product(alphabet, repeat=length)]
+            for s, many in zip(strings, myr.match_many(strings)):
+                self.assertEqual(bool(realr.match(s)), myr.match(s), msg=s)
+                self.assertEqual(bool(realr.match(s)), many, msg=s)
+
+    def test_peek(self):
+        for regex_str, length, alphabet in self.regexes:
+            myr = ChainDAG(regex_str, length, alphabet)
+            chainr = NFSM(regex_str, length, alphabet)
+            for slot, chars in ((1, alphabet[0]), (length-1, alphabet[1:])):
+                myr.constrain_slot(slot, chars)
+                chainr.constrain_slot(slot, chars)
+                for i in range(length):
+                    self.assertEqual(chainr.peek_slot(i), myr.peek_slot(i))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,6 +22,56 @@ class TestHexGrid(unittest.TestCase):
             self.assertEqual(lengths[i],
                     len(list(self.g.traverse_ur2ll(i))))
 
+    def test_cells(self):
+        """The cells_* methods yield the cells whose values the traverse_*
+        methods yield"""
+        for i in range(13):
+            for cells, values in (
+                    (self.g.cells_l2r(i), self.g.traverse_l2r(i)),
+                    (self.g.cells_ur2ll(i), self.g.traverse_ur2ll(i)),
+                    (self.g.cells_lr2ul(i), self.g.traverse_lr2ul(i)),
+                    ):
+                cells = list(cells)
+                values = list(values)
+                self.assertEqual(len(cells), len(values))
+                for cell, value in zip(cells, values):
+                    self.assertIs(cell.value, value)
+
+    def test_coords(self):
+        g = HexGrid(3, lambda: 0)
+        self.assertEqual(19, len(g.values))
+        for index in range(19):
+            self.assertEqual(index, g.index(*g.coords(index)))
+        self.assertEqual((0, 0), g.coords(0))
+        self.assertEqual((4, 4), g.coords(18))
+        self.assertIsNone(g.index(3, 0))
+        self.assertIsNone(g.index(0, 3))
+
+    def test_lines(self):
+        g = HexGrid(2, lambda: 0)
+        self.assertEqual([[5, 6], [2, 3, 4], [0, 1]],
+                [list(line) for line in g.lines["l2r"]])
+        self.assertEqual([[0, 2], [1, 3, 5], [4, 6]],
+                [list(line) for line in g.lines["ur2ll"]])
+        self.assertEqual([[4, 1], [6, 3, 0], [5, 2]],
+                [list(line) for line in g.lines["lr2ul"]])
+
+    def test_gather(self):
+        g = HexGrid(2, lambda: 0)
+        for i, value in zip(g.lines["ur2ll"][1], [1, 2, 3]):
+            g.values[i] = value
+        self.assertEqual([1, 2, 3], g.gather("ur2ll", 1))
+        self.assertEqual([0, 2, 0], g.gather("l2r", 1))
+        self.assertEqual([0, 2, 0], g.gather("lr2ul", 1))
+
+    def test_large(self):
+        g = HexGrid(200, lambda: 0)
+        self.assertEqual(3*200*199 + 1, len(g.values))
+        for direction in ("l2r", "ur2ll", "lr2ul"):
+            self.assertEqual(399, len(g.lines[direction]))
+            self.assertEqual(len(g.values),
+                    sum(len(line) for line in g.lines[direction]))
+
     def _fill_by_row(self):
         for i in range(13):
             for cell in self.g.traverse_l2r(i):
@@ -4,19 +4,30 @@ from copy import deepcopy
 import re
 from itertools import product
 
-from nfsm import NFSM
+import nfsm
+from nfsm import NFSM, Charsets
+import regexparse
 
 class TestNFSMBase(unittest.TestCase):
     def assert_no_references(self, r):
-        """For regexes that have no backreferences, each set must be unique, so
+        """For regexes that have no backreferences, no slots may be linked, so
         call this to verify that
 
         """
-        ids = set()
-        for chain in r.chains:
-            for s in chain:
-                self.assertNotIn(id(s), ids, msg="set {0} in chain {1}".format(s, chain))
-                ids.add(id(s))
+        for chain, links in zip(r.chains, r.links):
+            self.assertIsNone(links, msg="links in chain {0}".format(chain))
+
+    def assert_linked(self, links, i, j):
+        """Checks that slots i and j of a chain with the given links must
+        hold the same character
+
+        """
+        self.assertIsNotNone(links)
+        self.assertIn(i, links)
+        self.assertIn(j, links[i])
+
+    def assert_not_linked(self, links, i, j):
+        self.assertFalse(links is not None and i in links and j in links[i])
 
 class TestBasics(TestNFSMBase):
     """Tests the basic matching mechanisms. Each test here involves only one
@@ -39,6 +50,14 @@ class TestBasics(TestNFSMBase):
         self.assert_no_references(r)
         self.assertEqual([[set("AB")]], r.chains)
 
+    def test_bracket_outside_alphabet(self):
+        # Characters that aren't in the alphabet are left out
+        r = NFSM("[AZ]B", 2, "ABC")
+        self.assertEqual([[set("A"), set("B")]], r.chains)
+        r = NFSM("[A-C]", 1, "ABC", bitmask=True)
+        self.assertEqual([[5]], r.chains)
+        self.assertEqual(r.chains, NFSM.loads(r.dumps(), bitmask=True).chains)
+
     def test_inverse_bracket(self):
         r = NFSM("[^A]", 1, "ABC")
         self.assert_no_references(r)
@@ -193,73 +212,118 @@ class TestQuantifiers(TestNFSMBase):
 class TestGroups(TestNFSMBase):
     """This set of tests involves groups and backreferences.
     These tests must not only test that the sets are correct, but that the
-    actual set objects are linked appropriately
+    slots are linked appropriately
     
     """
 
     def test_single_group(self):
         r = NFSM("(A)\\1", 2, "ABC")
         self.assertEqual([[set("A"), set("A")]], r.chains)
-        self.assertIs(r.chains[0][0], r.chains[0][1])
+        self.assert_linked(r.links[0], 0, 1)
 
     def test_dot_group(self):
         r = NFSM("(.)\\1", 2, "ABC")
         self.assertIn([set("ABC"), set("ABC")], r.chains)
         self.assertEqual(1, len(r.chains))
-        for chain in r.chains:
-            self.assertIs(chain[0], chain[1])
+        for chain, links in zip(r.chains, r.links):
+            self.assert_linked(links, 0, 1)
 
     def test_star_reference(self):
         r = NFSM("(.)\\1*", 3, "ABC")
-        for chain in r.chains:
-            self.assertIs(chain[0], chain[1])
-            self.assertIs(chain[1], chain[2])
+        for chain, links in zip(r.chains, r.links):
+            self.assert_linked(links, 0, 1)
+            self.assert_linked(links, 1, 2)
 
     def test_group_2nd_pos(self):
         r = NFSM("A(.)B\\1", 4, "ABC")
         self.assertIn([set("A"), set("ABC"), set("B"), set("ABC")], r.chains)
         self.assertEqual(1, len(r.chains))
-        self.assertIs(r.chains[0][1], r.chains[0][3])
+        self.assert_linked(r.links[0], 1, 3)
 
     def test_two_groups(self):
         r = NFSM("(A)(B)\\2\\1", 4, "ABC")
         self.assertIn([set("A"), set("B"), set("B"), set("A")], r.chains)
         self.assertEqual(1, len(r.chains))
-        for chain in r.chains:
-            self.assertIs(chain[0], chain[3])
-            self.assertIs(chain[1], chain[2])
+        for chain, links in zip(r.chains, r.links):
+            self.assert_linked(links, 0, 3)
+            self.assert_linked(links, 1, 2)
 
     def test_two_dot_groups(self):
         r = NFSM("(.)(.)\\2\\1", 4, "ABC")
         self.assertIn([set("ABC"), set("ABC"), set("ABC"), set("ABC")], r.chains)
         self.assertEqual(1, len(r.chains))
-        for chain in r.chains:
-            self.assertIs(chain[0], chain[3])
-            self.assertIs(chain[1], chain[2])
+        for chain, links in zip(r.chains, r.links):
+            self.assert_linked(links, 0, 3)
+            self.assert_linked(links, 1, 2)
 
     def test_two_dot_group(self):
         r = NFSM("(..)\\1", 4, "ABC")
         self.assertIn([set("ABC"), set("ABC"), set("ABC"), set("ABC")], r.chains)
-        for chain in r.chains:
-            self.assertIs(chain[0], chain[2])
-            self.assertIs(chain[1], chain[3])
+        for chain, links in zip(r.chains, r.links):
+            self.assert_linked(links, 0, 2)
+            self.assert_linked(links, 1, 3)
 
     def test_bracket_group(self):
         r = NFSM("([^C])\\1", 2, "ABC")
         self.assertEqual([[set("AB"), set("AB")]], r.chains)
-        self.assertIs(r.chains[0][0], r.chains[0][1])
+        self.assert_linked(r.links[0], 0, 1)
 
     def test_var_len_group(self):
         r = NFSM("([^C][^C]?)\\1C*", 4, "ABC")
         self.assertIn([set("AB"), set("AB"), set("AB"), set("AB")], r.chains)
         self.assertIn([set("AB"), set("AB"), set("C"), set("C")], r.chains)
-        for chain in r.chains:
+        for chain, links in zip(r.chains, r.links):
             if chain[-1] == set("C"):
-                self.assertIs(chain[0], chain[1])
+                self.assert_linked(links, 0, 1)
             else:
-                self.assertIs(chain[0], chain[2])
-                self.assertIs(chain[1], chain[3])
+                self.assert_linked(links, 0, 2)
+                self.assert_linked(links, 1, 3)
 
+    def test_nested_group(self):
+        r = NFSM("((.)B)\\2\\1", 5, "ABC")
+        self.assertEqual(1, len(r.chains))
+        links = r.links[0]
+        self.assert_linked(links, 0, 2)
+        self.assert_linked(links, 0, 3)
+        self.assertTrue(r.match("ABAAB"))
+        self.assertFalse(r.match("ABACB"))
+
+    def test_quantified_group(self):
+        # The reference is to the last repeat
+        r = NFSM("(.)+\\1", 4, "ABC")
+        for chain, links in zip(r.chains, r.links):
+            self.assert_linked(links, 2, 3)
+            self.assert_not_linked(links, 1, 2)
+        self.assertTrue(r.match("ABCC"))
+        self.assertFalse(r.match("AABA"))
+
+    def test_unmatched_group(self):
+        r = NFSM("(A)?B\\1", 2, "ABC")
+        self.assertEqual([], r.chains)
+        r = NFSM("(A)?B\\1", 3, "ABC")
+        self.assertEqual([[set("A"), set("B"), set("A")]], r.chains)
+
+    def test_bad_references(self):
+        self.assertRaises(ValueError, NFSM, "\\1(A)", 2, "ABC")
+        self.assertRaises(ValueError, NFSM, "(A\\1)", 2, "ABC")
+
+
+class TestCountedRepeats(TestNFSMBase):
+    def test_exact(self):
+        r = NFSM("A{2}B", 3, "AB")
+        self.assertEqual([[set("A"), set("A"), set("B")]], r.chains)
+        self.assertEqual([], NFSM("A{2}B", 4, "AB").chains)
+
+    def test_ranges(self):
+        r = NFSM("(AB|C){1,2}.{2,}", 5, "ABC")
+        self.assertTrue(r.match("ABCAA"))
+        self.assertTrue(r.match("CAAAA"))
+        self.assertFalse(r.match("AAAAA"))
+        self.assertFalse(r.match("BBBBB"))
+
+    def test_too_many(self):
+        self.assertEqual([], NFSM("A{1000}", 5, "A").chains)
+        self.assertEqual(1, len(NFSM("(A?){1000}", 5, "A").chains))
 
 class TestMatching(TestNFSMBase):
     """Test some more complex regexes without and with constraints
@@ -393,6 +457,24 @@ class TestMatching(TestNFSMBase):
         self.assertFalse(r.match("AA"))
         self.assertFalse(r.match("CC"))
 
+    def test_match_keeps_state(self):
+        r = NFSM("(.)\\1|AB", 2, "ABC")
+        chains = r.chains
+        self.assertTrue(r.match("AB"))
+        self.assertFalse(r.match("AC"))
+        self.assertEqual(chains, r.chains)
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+
+    def test_match_many(self):
+        r = NFSM("(.)\\1|AB", 2, "ABC", bitmask=True)
+        strings = ["AA", "AB", "AC", "CC", "ZZ", "A", "AAA"]
+        self.assertEqual([True, True, False, True, False, False, False],
+                list(r.match_many(strings)))
+
+        r.constrain_slot(1, "B")
+        self.assertEqual([False, True, False, False, False, False, False],
+                list(r.match_many(strings)))
+
 class TestPeek(TestNFSMBase):
     def test_simple_peek(self):
         r = NFSM("[ABC][AB]", 2, "ABC")
@@ -413,6 +495,316 @@ class TestPeek(TestNFSMBase):
         self.assertEqual(set("A"), r.peek_slot(0))
         self.assertEqual(set("B"), r.peek_slot(1))
 
+class TestBitmask(TestNFSMBase):
+    """Tests the bitmask charset mode"""
+    def test_charsets(self):
+        c = Charsets("CAB", bitmask=True)
+        self.assertEqual({"A": 1, "B": 2, "C": 4}, c.bits)
+        self.assertEqual(7, c.full)
+        self.assertEqual(5, c.encode("AC"))
+        self.assertEqual(5, c.encode(5))
+        self.assertEqual(0, c.encode("Z"))
+        self.assertEqual(set("AC"), c.decode(5))
+
+    def test_chains(self):
+        r = NFSM("A+[^A]*", 3, "ABC", bitmask=True)
+        self.assertIn([1, 1, 1], r.chains)
+        self.assertIn([1, 1, 6], r.chains)
+        self.assertIn([1, 6, 6], r.chains)
+        self.assertEqual(3, len(r.chains))
+
+    def test_links(self):
+        r = NFSM("(.)(.)\\2\\1", 4, "ABC", bitmask=True)
+        self.assertEqual([[7, 7, 7, 7]], r.chains)
+        self.assertEqual((0, 3), r.links[0][0])
+        self.assertEqual((1, 2), r.links[0][2])
+
+        r.constrain_slot(3, set("AB"))
+        self.assertEqual(set("AB"), r.decode(r.peek_slot(0)))
+        self.assertEqual(set("ABC"), r.decode(r.peek_slot(1)))
+
+        r.constrain_slot(1, r.encode("C"))
+        self.assertEqual([[3, 4, 4, 3]], r.chains)
+
+    def test_copy(self):
+        r = NFSM("(.)\\1", 2, "ABC", bitmask=True)
+        r2 = r.copy()
+        r2.constrain_slot(0, "A")
+        self.assertEqual(7, r.peek_slot(1))
+        self.assertEqual(1, r2.peek_slot(1))
+
+    def test_same_as_sets(self):
+        for regex, length in (("F.*[AO].*[AO].*", 6), ("(RR|HHH)*.?", 8),
+                ("([^C][^C]?)\\1C*", 4)):
+            r = NFSM(regex, length, "AFHORC")
+            rb = NFSM(regex, length, "AFHORC", bitmask=True)
+            self.assertEqual(str(r), str(rb))
+            for i in range(length):
+                self.assertEqual(r.peek_slot(i), rb.decode(rb.peek_slot(i)))
+
+            r.constrain_slot(1, set("AOR"))
+            rb.constrain_slot(1, set("AOR"))
+            self.assertEqual(str(r), str(rb))
+            for s in ("FAOAOR", "FOHHAR", "RRHHHRRA", "HHHRRRRA", "AAAA",
+                    "ABAB"):
+                self.assertEqual(r.match(s), rb.match(s), msg=s)
+
+class TestSupport(TestNFSMBase):
+    """Tests the per-slot support counts"""
+    def test_counts(self):
+        r = NFSM("A+[^A]*", 3, "ABC")
+        self.assertEqual({"A": 3}, r._support[0])
+        self.assertEqual({"A": 2, "B": 1, "C": 1}, r._support[1])
+        self.assertEqual({"A": 1, "B": 2, "C": 2}, r._support[2])
+
+        # Kills AAA and narrows the other two chains
+        r.constrain_slot(2, set("B"))
+        self.assertEqual(2, len(r.chains))
+        self.assertEqual({"A": 1, "B": 1, "C": 1}, r._support[1])
+        self.assertEqual({"B": 2}, r._support[2])
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+
+    def test_links(self):
+        r = NFSM("(.)\\1", 2, "ABC", bitmask=True)
+        r.constrain_slot(0, "AB")
+        self.assertEqual({1: 1, 2: 1}, r._support[1])
+        r.constrain_slot(1, "BC")
+        self.assertEqual({2: 1}, r._support[0])
+        r.constrain_slot(0, "A")
+        self.assertEqual([], r.chains)
+        self.assertEqual(0, r.peek_slot(1))
+
+    def test_copy_compacts(self):
+        r = NFSM("(DI|NS|TH|OM)*", 4, "DINSTHOM")
+        r.constrain_slot(0, "D")
+        r.constrain_slot(2, "T")
+        r2 = r.copy()
+        self.assertEqual(1, len(r2._chains))
+        self.assertEqual(r.chains, r2.chains)
+        self.assertTrue(r2.match("DITH"))
+        self.assertFalse(r2.match("DIOM"))
+
+    def test_interned(self):
+        r = NFSM("A.*A|.A*", 4, "ABC")
+        values = {}
+        for chain in r.chains:
+            for value in chain:
+                self.assertIs(values.setdefault(value, value), value)
+
+    def test_copy_on_write(self):
+        r = NFSM("A+[^A]*", 3, "ABC")
+        r2 = r.copy()
+        self.assertTrue(all(c is c2 for c, c2 in zip(r._chains, r2._chains)))
+        r2.constrain_slot(2, set("B"))
+        self.assertEqual(set("ABC"), r.peek_slot(2))
+        self.assertEqual(3, len(r.chains))
+        self.assertIn([set("A"), set("A"), set("BC")], r.chains)
+        self.assertIn([set("A"), set("A"), set("B")], r2.chains)
+        r.constrain_slot(1, set("BC"))
+        self.assertEqual(set("BC"), r.peek_slot(2))
+        self.assertEqual(set("ABC"), r2.peek_slot(1))
+
+class TestRollback(TestNFSMBase):
+    def _state(self, r):
+        return (r.chains, r.links, [r.peek_slot(i) for i in range(r.length)])
+
+    def test_rollback(self):
+        r = NFSM("A+[^A]*", 3, "ABC")
+        start = self._state(r)
+        mark = r.checkpoint()
+        r.constrain_slot(2, set("B"))
+        after_one = self._state(r)
+        mark2 = r.checkpoint()
+        r.constrain_slot(1, set("C"))
+        r.constrain_slot(0, set("B"))
+        self.assertEqual([], r.chains)
+
+        r.rollback(mark2)
+        self.assertEqual(after_one, self._state(r))
+        r.rollback(mark)
+        self.assertEqual(start, self._state(r))
+
+    def test_rollback_links(self):
+        r = NFSM("(.)(.)\\2\\1", 4, "ABC", bitmask=True)
+        start = self._state(r)
+        mark = r.checkpoint()
+        r.constrain_slot(3, "AB")
+        r.constrain_slot(2, "C")
+        r.constrain_slot(0, "C")
+        self.assertFalse(r.match("ACCA"))
+        r.rollback(mark)
+        self.assertEqual(start, self._state(r))
+        self.assertTrue(r.match("ACCA"))
+
+    def test_copy_has_no_trail(self):
+        r = NFSM("...", 3, "ABC")
+        r.checkpoint()
+        r.constrain_slot(0, "A")
+        r2 = r.copy()
+        mark = r2.checkpoint()
+        self.assertEqual(0, mark)
+        r2.constrain_slot(1, "B")
+        r2.rollback(mark)
+        self.assertEqual(set("A"), r2.peek_slot(0))
+        self.assertEqual(set("ABC"), r2.peek_slot(1))
+
+    def test_rollback_after_copy(self):
+        r = NFSM("A+[^A]*", 3, "ABC")
+        mark = r.checkpoint()
+        r.constrain_slot(2, set("B"))
+        r2 = r.copy()
+        copied = self._state(r2)
+        r.rollback(mark)
+        self.assertEqual(set("ABC"), r.peek_slot(2))
+        self.assertEqual(copied, self._state(r2))
+
+class TestBudget(TestNFSMBase):
+    """The parser leaves out chains that can't fit in the line"""
+
+    def test_long_line(self):
+        # Every way of adding up 2s and 3s to 30, without building any of
+        # the much longer repeats along the way
+        r = NFSM("(RR|HHH)*", 30, "RH")
+        self.assertEqual(1897, len(r.chains))
+        self.assertTrue(r.match("RR" * 6 + "HHH" * 6))
+        self.assertFalse(hasattr(r, "_memo"))
+
+    def test_unreferenced_empty_repeats(self):
+        # Empty repeats are only kept for groups that are referenced
+        r = NFSM("(A?B?)*", 10, "AB")
+        self.assertEqual(1024, len(r.chains))
+        r = NFSM("(.?)*(.?)*", 8, "AB")
+        self.assertEqual(1, len(r.chains))
+
+    def test_parts_fit(self):
+        r = NFSM("A", 1, "ABC")
+        r._memo = {}
+        r._referenced = set()
+        partials = r._expand(regexparse.parse("(AB|C)*B?", "ABC"), 3)
+        chains = [list(items) for items, _, _, _ in partials]
+        self.assertTrue(all(len(chain) <= 3 for chain in chains))
+        self.assertIn([set("A"), set("B"), set("B")], chains)
+        self.assertIn([set("C"), set("C"), set("C")], chains)
+        self.assertNotIn([set("A"), set("B"), set("C"), set("C")], chains)
+
+    def test_reference_in_budget(self):
+        r = NFSM("(..)A*\\1", 6, "AB")
+        self.assertEqual(1, len(r.chains))
+        self.assertTrue(r.match("ABAAAB"))
+        self.assertFalse(r.match("ABAABB"))
+
+class TestNormalize(TestNFSMBase):
+    def test_duplicates(self):
+        r = NFSM(".*.*", 4, "AB")
+        self.assertEqual(1, len(r.chains))
+        self.assertTrue(r.match("ABBA"))
+
+    def test_dominated(self):
+        r = NFSM("A.|[AB].|C", 2, "ABC")
+        self.assertEqual([[set("AB"), set("ABC")]], r.chains)
+
+    def test_links(self):
+        # A linked chain can be dominated by an unlinked one, but not the
+        # other way around
+        r = NFSM("(.)\\1|..", 2, "AB")
+        self.assertEqual([None], r.links)
+        r = NFSM("(.)\\1|A.", 2, "AB")
+        self.assertEqual(2, len(r.chains))
+        r = NFSM("(.)\\1.|(.).\\2|...", 3, "AB")
+        self.assertEqual([None], r.links)
+
+    def test_dominance_limit(self):
+        # Too many chains to compare in pairs, so only duplicates are dropped
+        # when compiling, and normalize() drops the dominated ones
+        r = NFSM("(A|B)*|A*(.|..)*", 11, "ABC")
+        self.assertGreater(len(r._chains), nfsm.DOMINANCE_LIMIT)
+        self.assertTrue(r.match("AAAAAAAAAAB"))
+        self.assertGreater(r.normalize(), 0)
+        self.assertTrue(r.match("AAAAAAAAAAB"))
+        self.assertTrue(r.match("CCCCCCCCCCC"))
+
+    def test_after_constraints(self):
+        r = NFSM("A.|.B", 2, "AB", bitmask=True)
+        self.assertEqual(2, len(r.chains))
+        mark = r.checkpoint()
+        r.constrain_slot(0, "A")
+        r.constrain_slot(1, "B")
+        self.assertEqual(1, r.normalize())
+        self.assertEqual(1, len(r.chains))
+        self.assertEqual(r.encode("B"), r.peek_slot(1))
+        r.rollback(mark)
+        self.assertEqual(2, len(r.chains))
+        self.assertEqual(r.encode("AB"), r.peek_slot(1))
+
+class TestDomains(TestNFSMBase):
+    def _constrained(self, regex, length, alphabet, domains):
+        r = NFSM(regex, length, alphabet)
+        for i, domain in enumerate(domains):
+            r.constrain_slot(i, domain)
+        return r
+
+    def test_same_as_constraining(self):
+        for regex, length, domains in (
+                ("A+[^A]*", 3, ["AB", "AC", "BC"]),
+                ("(RR|HHH)*.?", 7, ["RH", "H", "RHA", "R", "RHA", "RA", "A"]),
+                ("(.)(.)\\2\\1", 4, ["AB", "BC", "C", "ABC"]),
+                ("([^C][^C]?)\\1C*", 4, ["A", "ABC", "ABC", "BC"]),
+                # The group fills the line, leaving the references no room
+                ("(A?)\\1+", 1, ["A"]),
+                ("(A?)(B?)\\1{2}\\2", 3, ["AB", "AB", "ABC"])):
+            r = NFSM(regex, length, "ABCRH", domains=domains)
+            expected = self._constrained(regex, length, "ABCRH", domains)
+            for i in range(length):
+                self.assertEqual(expected.peek_slot(i), r.peek_slot(i))
+            for s in ("A", "ABC", "AAB", "HHRRRRA", "RRHHHRA", "ABCA", "ABBA",
+                    "ABAB", "AAAC", "ABAB"):
+                self.assertEqual(expected.match(s), r.match(s), msg=s)
+
+    def test_fewer_chains(self):
+        # Every chain that starts with something other than AB is left out
+        full = NFSM("(AB|BA|C)*", 6, "ABC")
+        r = NFSM("(AB|BA|C)*", 6, "ABC", domains=["A", "B"] + ["ABC"] * 4)
+        self.assertLess(len(r._chains), len(full._chains))
+        self.assertTrue(all(chain[:2] == [set("A"), set("B")]
+            for chain in r.chains))
+
+    def test_bitmask(self):
+        r = NFSM("(.)\\1", 2, "ABC", bitmask=True, domains=[3, "BC"])
+        self.assertEqual([[2, 2]], r.chains)
+
+    def test_bad_domains(self):
+        self.assertRaises(ValueError, NFSM, "A*", 2, "AB", domains=["A"])
+
+class TestEstimate(TestNFSMBase):
+    def test_exact_without_references(self):
+        for regex, length in (("A+[^A]*", 3), ("(RR|HHH)*.?", 8),
+                (".*H.*H.*", 6), ("(DI|NS|TH|OM)*", 6), ("A{2,}B{,2}", 5),
+                ("(AB|B)*A?", 5)):
+            r = NFSM(regex, length, "ABDHINMORST")
+            # Without dropping the redundant chains
+            r._redundant = lambda chainids, dominance=True: set()
+            r.__init__(regex, length, "ABDHINMORST")
+            self.assertEqual(len(r._chains),
+                    NFSM.estimate_chains(regex, length, "ABDHINMORST"),
+                    msg=regex)
+
+    def test_overestimates(self):
+        for regex, length in (("(..?)\\1*", 6), ("(A*)*B", 4)):
+            self.assertGreaterEqual(NFSM.estimate_chains(regex, length, "AB"),
+                    len(NFSM(regex, length, "AB")._chains))
+
+    def test_long_lines(self):
+        # Repeats are counted by squaring, not one repeat count at a time
+        self.assertEqual(2**400, NFSM.estimate_chains("(A|B)*", 400, "AB"))
+        self.assertEqual(401, NFSM.estimate_chains("A*B*", 400, "AB"))
+        self.assertEqual(1, NFSM.estimate_chains("(AB){100,}", 400, "AB"))
+        self.assertEqual(0, NFSM.estimate_chains("(AB){,199}", 400, "AB"))
+
+    def test_huge(self):
+        # Far too many to ever expand, but cheap to count
+        self.assertGreater(NFSM.estimate_chains("(.|..)*(.|..)*(.|..)*", 60,
+            "AB"), 10**15)
+
 class TestRealRegexType(type):
     def __init__(cls, *args, **kwargs):
         super(TestRealRegexType, cls).__init__(*args, **kwargs)
@@ -420,22 +812,36 @@ class TestRealRegexType(type):
         # Create the test methods from the defined regexes
         for i, regex in enumerate(cls.regexes):
             setattr(cls, "test_{0}".format(i),
-                    lambda self: self._compare(regex[0], regex[1], regex[2])
+                    lambda self, regex=regex: self._compare(*regex)
                     )
             setattr(getattr(cls, "test_{0}".format(i)), "__doc__",
                     regex[0]
                     )
 class TestRealRegex(TestNFSMBase, metaclass=TestRealRegexType):
     regexes = [
-            ("(DI|NS|TH|OM)*", 4, "DINSTHOMZ")
+            ("(DI|NS|TH|OM)*", 4, "DINSTHOMZ"),
+            ("((A|B)C)*\\2", 5, "ABC"),
+            ("(A(B|C)?)+\\1", 5, "ABC"),
+            ("(.)((.)\\1)*\\3", 5, "AB"),
+            ("(A|BC){2,3}C{,2}", 5, "ABC"),
+            ("(.)\\1{2}[AB]{1,}", 5, "ABC"),
+            ("C(C?)+\\1(C)", 2, "ABC"),
+            (".(B*)+\\1.", 2, "ABC"),
+            ("(A?){2}B\\1", 3, "AB"),
+            ("(A?)|B\\1{2}", 1, "AB"),
+            ("(B|(A)?)*\\1", 0, "AB"),
+            ("(B|(A)?)*\\1", 3, "AB"),
+            ("(A?)*(B?)*\\1\\2", 4, "AB"),
             ]
 
     def _compare(self, regex_str, length, alphabet):
         myr = NFSM(regex_str, length, alphabet)
-        realr = re.compile(regex_str+"$")
+        realr = re.compile(regex_str)
 
-        for s in ("".join(x) for x in product(alphabet, repeat=length)):
-            self.assertEqual(bool(realr.match(s)), myr.match(s), msg=s)
+        strings = ["".join(x) for x in product(alphabet, repeat=length)]
+        for s, many in zip(strings, myr.match_many(strings)):
+            self.assertEqual(bool(realr.fullmatch(s)), myr.match(s), msg=s)
+            self.assertEqual(bool(realr.fullmatch(s)), many, msg=s)
 
 
 if __name__ == "__main__":
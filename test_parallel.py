@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+
+from nfsm import NFSM
+from cache import CompileCache
+from parallel import compile_all, compile_cost
+
+class TestCompileAll(unittest.TestCase):
+    jobs = [
+            ("(.)(.)\\2\\1", 4, "ABC"),
+            ("(DI|NS|TH|OM)*", 8, "DINSTHOM"),
+            ("A*B*", 5, "AB"),
+            ("[^C]*", 3, "ABC"),
+            ]
+
+    def _check(self, results, bitmask):
+        self.assertEqual(len(self.jobs), len(results))
+        for job, result in zip(self.jobs, results):
+            expected = NFSM(*job, bitmask=bitmask)
+            self.assertEqual(str(expected), str(result))
+            self.assertEqual(expected.links, result.links)
+            self.assertEqual(bitmask, result.charsets.bitmask)
+
+    def test_serial(self):
+        self._check(compile_all(self.jobs, workers=1), False)
+
+    def test_pool(self):
+        self._check(compile_all(self.jobs, bitmask=True, workers=2), True)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = CompileCache(tmpdir)
+            compile_all(self.jobs[:2], workers=2, cache=cache)
+            self.assertEqual(2, cache.stats["misses"])
+            self._check(compile_all(self.jobs, workers=2, cache=cache), False)
+            self.assertEqual(2, cache.stats["hits"])
+            self.assertEqual(4, cache.stats["misses"])
+
+    def test_domains(self):
+        jobs = [("(DI|NS|TH|OM)*", 4, "DINSTHOM", ["D", "I", "NT", "SH"]),
+                ("A*B*", 3, "AB")]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = CompileCache(tmpdir)
+            for workers in (1, 2):
+                results = compile_all(jobs, workers=workers, cache=cache)
+                self.assertEqual(str(NFSM(*jobs[0][:3], domains=jobs[0][3])),
+                        str(results[0]))
+                self.assertEqual(str(NFSM(*jobs[1])), str(results[1]))
+            # Only the job without domains was cached
+            self.assertEqual(1, cache.stats["hits"])
+            self.assertEqual(1, cache.stats["misses"])
+
+    def test_bitmask_domains(self):
+        # Domains taken from a bitmask board are ints
+        alphabet = "ABCH"
+        jobs = [(".*H.*H.*", 5, alphabet, (8, 8, 15, 15, 15)),
+                ("A*", 3, alphabet, (1, 1, 1))]
+        for workers in (1, 2):
+            results = compile_all(jobs, bitmask=True, workers=workers)
+            self.assertEqual([str(NFSM(*job[:3], bitmask=True,
+                domains=job[3])) for job in jobs],
+                [str(result) for result in results])
+            self.assertTrue(results[0].match("HHAAA"))
+            self.assertFalse(results[0].match("AHHAA"))
+
+    def test_cost(self):
+        self.assertGreater(compile_cost("(DI|NS|TH|OM)*", 8),
+                compile_cost("A*B", 8))
+        self.assertGreater(compile_cost(".*H.*H.*", 8),
+                compile_cost(".*H.*", 8))
+        self.assertGreater(compile_cost(".*H.*", 10),
+                compile_cost(".*H.*", 8))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from nfsm import NFSM
+from topology import Topology, Board
+from propagate import Propagator
+
+class TestPropagator(unittest.TestCase):
+    def _board(self, rows, cols, alphabet="ABC"):
+        """Builds a rectangular board. rows and cols are lists of regexes."""
+        topology = Topology.rectangular(rows, cols)
+        board = Board(set(alphabet) for _ in range(topology.ncells))
+        lines = [(NFSM(regex, len(cells), alphabet), cells)
+                for regex, cells in topology.lines]
+        return board, lines
+
+    def _solution(self, board, width):
+        values = ["".join(v) if len(v) == 1 else "_" for v in board.values]
+        return ["".join(values[i:i+width])
+            for i in range(0, len(values), width)]
+
+    def test_solve(self):
+        board, lines = self._board(["A[BC]", "C*"], ["[AB]C", "BC|AA"])
+        p = Propagator(lines, board)
+        self.assertTrue(p.run())
+        self.assertEqual(["AB", "CC"], self._solution(board, 2))
+
+    def test_index(self):
+        board, lines = self._board(["..", ".."], ["..", ".."])
+        p = Propagator(lines, board)
+        self.assertEqual([(0, 1), (3, 0)], p.index[1])
+
+    def test_contradiction(self):
+        board, lines = self._board(["AA", ".."], ["B.", ".."])
+        p = Propagator(lines, board)
+        self.assertFalse(p.run())
+
+    def test_skips_unchanged_lines(self):
+        # Only the first row and column have anything to say. Nothing
+        # changes in the others, so they are never processed a second time.
+        board, lines = self._board(["A..", "...", "..."], ["A..", "...", "..."])
+        rounds = []
+        p = Propagator(lines, board)
+        self.assertTrue(p.run(rounds.append))
+        self.assertEqual([1], rounds)
+        self.assertEqual(6, p.stats["lines processed"])
+        self.assertEqual(0, p.skipped()["lines"])
+
+        board.values[4] = set("B")
+        p.touch(4)
+        self.assertTrue(p.run(rounds.append))
+        self.assertEqual([1, 2], rounds)
+        self.assertEqual(8, p.stats["lines processed"])
+        self.assertEqual(4, p.skipped()["lines"])
+        self.assertEqual(set("B"), lines[1][0].peek_slot(1))
+
+    def test_normalize(self):
+        board, lines = self._board(["A.|.B", ".."], ["..", ".."], "AB")
+        board.values[0] = set("A")
+        board.values[1] = set("B")
+        p = Propagator(lines, board, normalize=True)
+        self.assertTrue(p.run())
+        self.assertEqual(1, p.stats["chains dropped"])
+        self.assertEqual(1, len(lines[0][0].chains))
+
+    def test_double_sided(self):
+        # The clues on both sides of the first row only agree on AB
+        board, lines = self._board([["A.", ".B"], ".."], ["..", ".."])
+        self.assertEqual(5, len(lines))
+        p = Propagator(lines, board)
+        self.assertTrue(p.run())
+        self.assertEqual(["AB", "__"], self._solution(board, 2))
+
+    def test_rollback(self):
+        board, lines = self._board(["A.", ".."], ["..", ".B"])
+        mark = board.checkpoint()
+        p = Propagator(lines, board)
+        self.assertTrue(p.run())
+        self.assertEqual(["A_", "_B"], self._solution(board, 2))
+        board.rollback(mark)
+        self.assertEqual(["__", "__"], self._solution(board, 2))
+
+if __name__ == "__main__":
+    unittest.main()
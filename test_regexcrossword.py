@@ -0,0 +1,76 @@
+import unittest
+import string
+
+from nfsm import NFSM
+from unrolled import UnrolledNFA
+import regexcrossword
+from regexcrossword import choose_engine, compile_lines
+
+class TestChooseEngine(unittest.TestCase):
+    def test_choose(self):
+        self.assertEqual(("chain", 78), choose_engine(".*H.*H.*", 13,
+            string.ascii_uppercase))
+        name, estimate = choose_engine("(.|..)*(.|..)*(.|..)*", 40, "AB")
+        self.assertEqual("unrolled", name)
+        self.assertGreater(estimate, 10**9)
+
+    def test_memory_limit(self):
+        self.assertEqual("unrolled", choose_engine(".*H.*H.*", 13,
+            string.ascii_uppercase, memory_limit=1000)[0])
+
+    def test_long_backreference_line(self):
+        # Unrolled once for each way of laying out (.)\2 over the line
+        self.assertRaises(ValueError, choose_engine, "((.)\\2|.)*", 30,
+                string.ascii_uppercase)
+        self.assertEqual(4181, UnrolledNFA.estimate_branches("((.)\\2|.)*",
+            18, string.ascii_uppercase))
+        # The reference can only go at the end, so there is one branch
+        self.assertEqual("unrolled", choose_engine(".*.*.*.*.*.*.*.*(.)\\1",
+            40, "AB")[0])
+        self.assertEqual(1, UnrolledNFA.estimate_branches(
+            ".*.*.*.*.*.*.*.*(.)\\1", 40, "AB"))
+
+    def test_compile_auto(self):
+        lines = [("(.|..)*(.|..)*(.|..)*", 40), ("(.)\\1", 2), ("A*", 3)]
+        choices = []
+        results = compile_lines(lines, "AB", "auto", workers=1,
+                choices=choices)
+        self.assertEqual(["unrolled", "chain", "chain"],
+                [name for name, _ in choices])
+        self.assertEqual(1, choices[2][1])
+        self.assertIsInstance(results[0], UnrolledNFA)
+        self.assertIsInstance(results[1], NFSM)
+        self.assertTrue(results[0].match("AB" * 20))
+        self.assertTrue(results[1].match("BB"))
+        self.assertFalse(results[2].match("AAB"))
+
+    def test_shared_lines(self):
+        lines = [(".*", 3), ("A*", 2), (".*", 3), (".*", 2)]
+        for engine in ("chain", "unrolled", "auto"):
+            choices = []
+            results = compile_lines(lines, "AB", engine, workers=1,
+                    choices=choices)
+            self.assertEqual(4, len(results))
+            self.assertEqual(choices[0], choices[2])
+            self.assertEqual(4, len(choices))
+            self.assertIsNot(results[0], results[2])
+            if engine == "chain":
+                self.assertIs(results[0]._chains[0], results[2]._chains[0])
+
+            # Every line constrains its own copy
+            results[2].constrain_slot(0, results[2].charsets.encode("B"))
+            self.assertTrue(results[0].match("AAA"))
+            self.assertFalse(results[2].match("AAA"))
+            self.assertTrue(results[3].match("AB"))
+
+    def test_shared_domains(self):
+        # The same regex with different domains is compiled separately
+        b = NFSM(".*", 1, "AB", bitmask=True).charsets.encode("B")
+        lines = [(".*", 1), (".*", 1), (".*", 1)]
+        results = compile_lines(lines, "AB", "chain", workers=1,
+                domains=[[b], [b], [b | 1]])
+        self.assertEqual([False, False, True],
+                [r.match("A") for r in results])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from regexparse import parse, tokenize, Concat, Repeat
+
+class TestTokenize(unittest.TestCase):
+    def test_tokens(self):
+        self.assertEqual([
+            ("(", None, 0),
+            ("char", "A", 1),
+            ("|", None, 2),
+            ("set", (True, "BC"), 3),
+            (")", None, 8),
+            ("quantifier", (1, None), 9),
+            ("any", None, 10),
+            ("ref", 1, 11),
+            ], tokenize("(A|[^BC])+.\\1"))
+
+    def test_counts(self):
+        self.assertEqual([(0, 0), (2, 2), (2, None), (0, 3), (1, 4)],
+                [value for _, value, _ in
+                    tokenize("A{0}A{2}A{2,}A{,3}A{1,4}")[1::2]])
+
+    def test_bad_tokens(self):
+        self.assertRaises(ValueError, tokenize, "[AB")
+        self.assertRaises(ValueError, tokenize, "A\\")
+        self.assertRaises(ValueError, tokenize, "A\\0")
+        self.assertRaises(ValueError, tokenize, "A{2")
+        self.assertRaises(ValueError, tokenize, "A{B}")
+        self.assertRaises(ValueError, tokenize, "A{3,2}")
+
+class TestParse(unittest.TestCase):
+    def test_tree(self):
+        node = parse("A(B|C)*\\1", "ABC")
+        self.assertEqual("Concat([Chars('A'), Repeat(Group(1, Alt([Chars('B'), "
+                "Chars('C')])), 0, None), Backref(1)])", repr(node))
+        self.assertEqual(2, node.minlen)
+
+    def test_nested(self):
+        node = parse("((A)(B+))?\\3", "ABC")
+        self.assertIsInstance(node, Concat)
+        repeat, ref = node.items
+        self.assertIsInstance(repeat, Repeat)
+        self.assertEqual((0, 1), (repeat.least, repeat.most))
+        outer = repeat.item
+        self.assertEqual(1, outer.index)
+        self.assertEqual([2, 3], [group.index for group in outer.item.items])
+        self.assertIs(outer.item.items[1], ref.group)
+        self.assertEqual(1, ref.minlen)
+
+    def test_sets(self):
+        self.assertEqual(frozenset("ABC"), parse(".", "ABC").chars)
+        self.assertEqual(frozenset("A"), parse("[^BC]", "ABC").chars)
+        self.assertEqual(frozenset("AB"), parse("[AB]", "ABC").chars)
+        self.assertEqual(frozenset("A"), parse("[AZ]", "ABC").chars)
+        self.assertEqual(frozenset(), parse("[XYZ]", "ABC").chars)
+
+    def test_empty(self):
+        node = parse("(|A)", "A")
+        self.assertEqual(0, node.minlen)
+        self.assertEqual(0, parse("", "A").minlen)
+
+    def test_errors(self):
+        for regex in ("(AB", "AB)", "A)(", "*A", "A|+", "\\1(A)", "(A\\1)",
+                "AD", "A**", "A{2}?", "C*?", "(A)+{2}"):
+            self.assertRaises(ValueError, parse, regex, "ABC")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from nfsm import NFSM, Charsets
+from topology import Topology, Board
+from propagate import Propagator
+from search import Search
+
+class TestSearch(unittest.TestCase):
+    def _search(self, regexes, alphabet="ABC"):
+        """Builds a Search over a side length 2 hex grid. regexes holds the
+        9 regexes in the same order as regexcrossword.definitions. Lines
+        with None for a regex are left out.
+
+        """
+        charsets = Charsets(alphabet, bitmask=True)
+        topology = Topology.hex(2, regexes)
+        board = Board([charsets.full] * topology.ncells)
+        lines = [(NFSM(regex, len(cells), alphabet, bitmask=True), cells)
+                for regex, cells in topology.lines]
+        propagator = Propagator(lines, board)
+        return Search(propagator, board, charsets)
+
+    def _decode(self, search, solution):
+        return "".join("".join(search.charsets.decode(v)) for v in solution)
+
+    def test_first(self):
+        # Every line is all As or all Bs, so the whole board is
+        s = self._search(["A*|B*"] * 9)
+        solutions = s.solve()
+        self.assertEqual(["AAAAAAA"], [self._decode(s, x) for x in solutions])
+        self.assertEqual(1, s.stats["solutions"])
+
+    def test_all(self):
+        s = self._search(["A*|B*"] * 9)
+        solutions = s.solve(None)
+        self.assertEqual(["AAAAAAA", "BBBBBBB"],
+                [self._decode(s, x) for x in solutions])
+        self.assertEqual(3, s.stats["nodes"])
+        self.assertEqual(0, s.stats["backtracks"])
+
+        # The board is left as it was after the initial propagation
+        for cell in s.cells:
+            self.assertEqual(s.charsets.encode("AB"), s.board.values[cell])
+        for regex, _ in s.propagator.lines:
+            self.assertEqual(s.charsets.encode("AB"), regex.peek_slot(0))
+
+    def test_deadline(self):
+        s = self._search(["A*|B*"] * 9)
+        self.assertRaises(TimeoutError, s.solve, None, 0)
+        # Rolled back to the state after the initial propagation
+        for cell in s.cells:
+            self.assertEqual(s.charsets.encode("AB"), s.board.values[cell])
+        self.assertEqual(2, len(s.solve(None)))
+
+    def test_no_solution(self):
+        # The middle row and middle diagonal cross, but can't agree on the
+        # cell they share. Every other line allows both.
+        s = self._search([".*", "B*", ".*", ".*", "A*", ".*", ".*", ".*", ".*"])
+        self.assertEqual([], s.solve(None))
+
+    def test_backtrack(self):
+        # Propagation stalls with every cell either A or B. Trying A in the
+        # first cell leads to a contradiction.
+        s = self._search([".*", "[AB]*", "A?B*A?", "A.*|.*B", "(.)\\1*",
+            "[AB]*", "AB|BA", "(.)\\1*", "AB|BA"], alphabet="AB")
+        solutions = s.solve(None)
+        self.assertEqual(["AABABAA"], [self._decode(s, x) for x in solutions])
+        self.assertEqual(1, s.stats["backtracks"])
+
+    def test_choose(self):
+        # Only the lower-right to upper-left lines are missing except for the
+        # middle one, so its cells are covered by three lines and the rest
+        # by two
+        s = self._search([".*"] * 6 + [None, ".*", None])
+        middle = set(s.propagator.lines[-1][1])
+        self.assertIn(s._choose(), middle)
+
+        # Fewer candidates comes first
+        cell = [c for c in s.cells if c not in middle][0]
+        s.board.set_value(cell, s.charsets.encode("AB"))
+        self.assertEqual(cell, s._choose())
+
+        # Solved cells are never picked
+        for c in s.cells:
+            s.board.set_value(c, s.charsets.encode("A"))
+        self.assertIsNone(s._choose())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+
+import server
+
+PUZZLE = {"id": 1, "alphabet": "ABC", "topology": {"shape": "rectangular",
+    "rows": ["A[BC]", "C*"], "columns": ["[AB]C", "BC|AA"]}}
+
+class TestSolveServer(unittest.TestCase):
+    def _run(self, requests, **kwargs):
+        """Starts a server on a Unix socket, sends it the given requests on
+        one connection, and returns the responses and the server
+
+        """
+        async def run():
+            s = server.SolveServer(workers=1, **kwargs)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "solve.sock")
+                await s.start(path=path)
+                try:
+                    reader, writer = await asyncio.open_unix_connection(path)
+                    responses = []
+                    for request in requests:
+                        writer.write(json.dumps(request).encode() + b"\n")
+                        await writer.drain()
+                        responses.append(json.loads(await reader.readline()))
+                    writer.close()
+                    await writer.wait_closed()
+                finally:
+                    await s.close()
+            return responses, s
+        return asyncio.run(run())
+
+    def test_solve(self):
+        responses, s = self._run([PUZZLE, PUZZLE, {"command": "stats"}])
+        self.assertEqual([["A", "B", "C", "C"]], responses[0]["solutions"])
+        self.assertEqual(responses[0], responses[1])
+
+        # The second puzzle reuses every compiled regex of the first
+        stats = responses[2]
+        self.assertEqual(2, stats["solved"])
+        self.assertEqual(4, stats["cache_misses"])
+        self.assertEqual(4, stats["cache_hits"])
+        self.assertEqual(0.5, stats["cache_hit_rate"])
+        self.assertEqual(0, stats["queue_depth"])
+        self.assertGreater(stats["latency_max"], 0)
+        self.assertEqual(s.stats()["requests"], 2)
+
+    def test_errors(self):
+        bad = {"id": 2, "topology": {"shape": "rectangular", "rows": ["A("],
+            "columns": ["."]}}
+        responses, s = self._run([bad, {"command": "nope"}])
+        self.assertEqual(2, responses[0]["id"])
+        self.assertIn("error", responses[0])
+        self.assertIn("error", responses[1])
+        self.assertEqual(1, s.stats()["errors"])
+
+    def test_busy(self):
+        responses, s = self._run([PUZZLE], max_queue=0)
+        self.assertEqual({"id": 1, "error": "busy"}, responses[0])
+        self.assertEqual(1, s.stats()["rejected"])
+
+    def test_timeout(self):
+        # Every board is a solution, far too many to find them all. The
+        # worker gives up on its own, and is free for the next puzzle.
+        endless = {"id": 2, "alphabet": "AB", "topology": {
+            "shape": "rectangular", "rows": ["[AB]*"] * 12,
+            "columns": ["[AB]*"] * 12}}
+        responses, s = self._run([endless, PUZZLE, {"command": "stats"}],
+                timeout=0.2, limit=None)
+        self.assertEqual({"id": 2, "error": "timeout"}, responses[0])
+        self.assertEqual([["A", "B", "C", "C"]], responses[1]["solutions"])
+        self.assertEqual(1, responses[2]["timeouts"])
+        self.assertEqual(1, responses[2]["solved"])
+        self.assertEqual(0, responses[2]["queue_depth"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from hexgrid import HexGrid
+from topology import Topology, Board
+
+class TestTopology(unittest.TestCase):
+    def test_rectangular(self):
+        t = Topology.rectangular(["A", "B"], ["C", "D", "E"])
+        self.assertEqual(6, t.ncells)
+        self.assertEqual([("A", [0, 1, 2]), ("B", [3, 4, 5]), ("C", [0, 3]),
+            ("D", [1, 4]), ("E", [2, 5])],
+            [(r, list(cells)) for r, cells in t.lines])
+        self.assertEqual([("A", 3), ("B", 3), ("C", 2), ("D", 2), ("E", 2)],
+                t.sizes())
+
+    def test_double_sided(self):
+        t = Topology.rectangular([["A", "B"], None], ["C", [None, "D"]])
+        self.assertEqual([("A", [0, 1]), ("B", [0, 1]), ("C", [0, 2]),
+            ("D", [1, 3])], [(r, list(cells)) for r, cells in t.lines])
+
+    def test_hex(self):
+        definitions = [str(i) for i in range(15)]
+        t = Topology.hex(3, definitions)
+        grid = HexGrid(3, lambda: None)
+        self.assertEqual(len(grid.values), t.ncells)
+        self.assertEqual(list(grid.lines["l2r"][0]), list(t.lines[0][1]))
+        self.assertEqual(list(grid.lines["lr2ul"][4]), list(t.lines[14][1]))
+        self.assertEqual(definitions, [r for r, _ in t.lines])
+
+        definitions[5] = None
+        self.assertEqual(14, len(Topology.hex(3, definitions).lines))
+        with self.assertRaises(ValueError):
+            Topology.hex(3, definitions[:-1])
+
+    def test_irregular(self):
+        # A plus shape: a row and a column crossing in the middle
+        t = Topology(5, [("ABC", [0, 1, 2]), ("DBE", [3, 1, 4])])
+        self.assertEqual([("ABC", 3), ("DBE", 3)], t.sizes())
+        with self.assertRaises(ValueError):
+            Topology(3, [("AB", [2, 3])])
+
+    def test_large(self):
+        # Thousands of lines only cost their cell indexes
+        t = Topology.rectangular(["."] * 1000, ["."] * 1000)
+        self.assertEqual(2000, len(t.lines))
+        self.assertEqual(list(range(999, 10**6, 1000)), list(t.lines[-1][1]))
+
+class TestBoard(unittest.TestCase):
+    def test_rollback(self):
+        b = Board([0, 0, 0])
+        b.set_value(0, 5)
+        mark = b.checkpoint()
+        b.set_value(1, 1)
+        mark2 = b.checkpoint()
+        b.set_value(1, 2)
+        b.set_value(2, 3)
+        self.assertEqual([5, 2, 3], b.values)
+        self.assertEqual([3, 5], b.gather([2, 0]))
+        b.rollback(mark2)
+        self.assertEqual([5, 1, 0], b.values)
+        b.rollback(mark)
+        self.assertEqual([5, 0, 0], b.values)
+
+    def test_scatter(self):
+        b = Board([0, 0, 0, 0])
+        b.scatter(range(2), [1, 1])
+        mark = b.checkpoint()
+        b.scatter([3, 1, 0], [4, 2, 1])
+        self.assertEqual([1, 2, 0, 4], b.values)
+        self.assertEqual([4, 2, 1], b.gather([3, 1, 0]))
+        # The unchanged cell isn't logged
+        self.assertEqual(2, len(b._trail))
+        b.rollback(mark)
+        self.assertEqual([1, 1, 0, 0], b.values)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import unittest
+import re
+from itertools import product
+
+from nfsm import NFSM
+from unrolled import UnrolledNFA
+
+class TestUnrolled(unittest.TestCase):
+    def test_peek(self):
+        r = UnrolledNFA("[ABC][AB]", 2, "ABC")
+        self.assertEqual(set("ABC"), r.peek_slot(0))
+        self.assertEqual(set("AB"), r.peek_slot(1))
+
+    def test_or_peek_and_constraint(self):
+        r = UnrolledNFA("AB|BC", 2, "ABC")
+        self.assertEqual(set("AB"), r.peek_slot(0))
+        self.assertEqual(set("BC"), r.peek_slot(1))
+
+        r.constrain_slot(0, set("AC"))
+
+        self.assertEqual(set("A"), r.peek_slot(0))
+        self.assertEqual(set("B"), r.peek_slot(1))
+
+    def test_length_prunes(self):
+        # Only RRRRHHH and HHHRRRR (and the like) fit in 7 slots, so the last
+        # slot can't be anything but R or H
+        r = UnrolledNFA("(RR|HHH)*", 7, "RHA")
+        for i in range(7):
+            self.assertEqual(set("RH"), r.peek_slot(i))
+        r.constrain_slot(0, "H")
+        self.assertEqual(set("H"), r.peek_slot(2))
+        self.assertEqual(set("R"), r.peek_slot(3))
+
+    def test_bitmask(self):
+        r = UnrolledNFA("A+[^A]*", 3, "ABC", bitmask=True)
+        self.assertEqual(1, r.peek_slot(0))
+        self.assertEqual(7, r.peek_slot(1))
+        r.constrain_slot(2, r.encode("A"))
+        self.assertEqual(1, r.peek_slot(1))
+
+    def test_nested(self):
+        r = UnrolledNFA("((A|B)C)*", 4, "ABC")
+        self.assertTrue(r.match("ACBC"))
+        self.assertFalse(r.match("ACCC"))
+
+    def test_empty(self):
+        self.assertTrue(UnrolledNFA("A*", 0, "A").match(""))
+        self.assertFalse(UnrolledNFA("A", 0, "A").match(""))
+
+    def test_copy(self):
+        r = UnrolledNFA("...", 3, "ABC")
+        r2 = r.copy()
+        r2.constrain_slot(1, "A")
+        self.assertEqual(set("ABC"), r.peek_slot(1))
+        self.assertEqual(set("A"), r2.peek_slot(1))
+
+    def test_rollback(self):
+        r = UnrolledNFA("(RR|HHH)*", 7, "RHA")
+        start = [r.peek_slot(i) for i in range(7)]
+        mark = r.checkpoint()
+        r.constrain_slot(0, "H")
+        self.assertEqual(set("R"), r.peek_slot(3))
+        mark2 = r.checkpoint()
+        r.constrain_slot(3, "H")
+        self.assertEqual(set(), r.peek_slot(0))
+        r.rollback(mark2)
+        self.assertEqual(set("R"), r.peek_slot(3))
+        r.rollback(mark)
+        self.assertEqual(start, [r.peek_slot(i) for i in range(7)])
+
+    def test_counted_repeats(self):
+        # Linear in the counts, and cut down to what fits in the line
+        r = UnrolledNFA("A{0,1000}B{2}", 6, "AB")
+        self.assertEqual(8, len(r._successors))
+        self.assertTrue(r.match("AAAABB"))
+        self.assertFalse(r.match("AAABBB"))
+        r = UnrolledNFA("A{1000}", 6, "AB")
+        self.assertEqual(set(), r.peek_slot(0))
+        self.assertFalse(r.match("AAAAAA"))
+
+    def test_backreference(self):
+        r = UnrolledNFA("(.)\\1", 2, "ABC")
+        self.assertEqual([((1, 0),)], [pairs for pairs, _ in r._equalities])
+        r.constrain_slot(1, "AB")
+        self.assertEqual(set("AB"), r.peek_slot(0))
+        r.constrain_slot(0, "BC")
+        self.assertEqual(set("B"), r.peek_slot(1))
+        self.assertTrue(r.match("BB"))
+        self.assertFalse(r.match("AB"))
+
+    def test_backreference_branches(self):
+        # One branch for each place the groups can start, each small
+        r = UnrolledNFA(".*(.)(.)\\2\\1.*", 6, "AB")
+        self.assertEqual(3, len(r._equalities))
+        self.assertEqual(set("AB"), r.peek_slot(0))
+        r.constrain_slot(0, "A")
+        r.constrain_slot(1, "B")
+        r.constrain_slot(2, "A")
+        r.constrain_slot(4, "A")
+        r.constrain_slot(5, "A")
+        # ABABAA can't match in any branch, ABAAAA can in the last one
+        self.assertEqual(set("A"), r.peek_slot(3))
+
+    def test_backreference_rollback(self):
+        r = UnrolledNFA("(..?)\\1", 4, "ABC")
+        start = [r.peek_slot(i) for i in range(4)]
+        mark = r.checkpoint()
+        r.constrain_slot(2, "A")
+        self.assertEqual(set("A"), r.peek_slot(0))
+        r.rollback(mark)
+        self.assertEqual(start, [r.peek_slot(i) for i in range(4)])
+
+    def test_empty_backreference_loop(self):
+        # A repeated reference to a group that matched nothing is an empty
+        # step that can loop forever
+        r = UnrolledNFA("(A?)\\1*(.|..)*(.|..)*(.|..)*", 40, "AB")
+        self.assertTrue(r.match("A" * 40))
+        self.assertTrue(r.match("B" * 40))
+        self.assertEqual(set("AB"), r.peek_slot(0))
+
+    def test_unbalanced(self):
+        self.assertRaises(ValueError, UnrolledNFA, "(AB", 2, "ABC")
+        self.assertRaises(ValueError, UnrolledNFA, "AB)", 2, "ABC")
+
+class TestSameAsChains(unittest.TestCase):
+    """Compares the unrolled engine with the chain engine and python's re
+    module for every string over a small alphabet
+
+    """
+    regexes = [
+            ("(DI|NS|TH|OM)*", 4, "DINSTHOMZ"),
+            ("(RR|HHH)*.?", 6, "RHZ"),
+            ("F.*[AO].*[AO].*", 5, "FAOB"),
+            ("A*B?C+", 4, "ABC"),
+            ("((A|B)C?)+A", 5, "ABC"),
+            ("(A|BC){2,3}C{,2}", 5, "ABC"),
+            ("[AB]{1,}C{2}", 5, "ABC"),
+            ("[^C]*[^R]*III.*", 6, "CRIX"),
+            ("(...?)\\1*", 6, "AB"),
+            ("P+(..)\\1.*", 6, "PAB"),
+            (".*(.)C\\1X\\1.*", 6, "CXA"),
+            (".*(.)(.)(.)\\3\\2\\1.*", 7, "AB"),
+            ("(A)?B\\1", 3, "AB"),
+            ("((A)|B)*\\2", 4, "AB"),
+            ("(A?)\\1*", 4, "ABC"),
+            ("(A*)\\1+B", 4, "ABC"),
+            ("(B{,2})C\\1*", 4, "ABC"),
+            ]
+
+    def test_match(self):
+        for regex_str, length, alphabet in self.regexes:
+            myr = UnrolledNFA(regex_str, length, alphabet)
+            realr = re.compile(regex_str+"$")
+            strings = ["".join(x) for x in product(alphabet, repeat=length)]
+            for s, many in zip(strings, myr.match_many(strings)):
+                self.assertEqual(bool(realr.match(s)), myr.match(s), msg=s)
+                self.assertEqual(bool(realr.match(s)), many, msg=s)
+
+    def test_peek(self):
+        for regex_str, length, alphabet in self.regexes:
+            myr = UnrolledNFA(regex_str, length, alphabet)
+            chainr = NFSM(regex_str, length, alphabet)
+            for i in range(length):
+                self.assertEqual(chainr.peek_slot(i), myr.peek_slot(i))
+
+            myr.constrain_slot(1, alphabet[0])
+            chainr.constrain_slot(1, alphabet[0])
+            for i in range(length):
+                self.assertEqual(chainr.peek_slot(i), myr.peek_slot(i))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/bin/env python3
+
+"""
+topology.py - Puzzle shapes as a flat list of cells plus the lines covering
+them.
+
+Every puzzle, whatever its shape, is described the same way: N cells,
+numbered from 0, and a list of lines, each a regex paired with the indexes
+of the cells it covers, in slot order. Propagation and search only ever see
+this description and a Board holding the cell values, so a hex grid, a
+rectangle with clues on both sides or an irregular shape all cost the same
+per cell and per line.
+"""
+
+from array import array
+
+from hexgrid import HexGrid
+
+class Topology:
+    """The shape of a puzzle: ncells cells, and self.lines, a list of
+    (regexstr, cells) tuples where cells is a sequence of cell indexes.
+
+    Several lines may cover the same cells, such as the clues on both sides
+    of a row, and cells don't have to be covered by any line.
+
+    """
+    def __init__(self, ncells, lines):
+        self.ncells = ncells
+        self.lines = []
+        for regexstr, cells in lines:
+            cells = array("l", cells)
+            if cells and not 0 <= min(cells) <= max(cells) < ncells:
+                raise ValueError("Line {0!r} covers cells outside of the "
+                        "puzzle".format(regexstr))
+            self.lines.append((regexstr, cells))
+
+    @classmethod
+    def hex(cls, sidelen, definitions):
+        """Builds the topology of a hexagonal puzzle with the given side
+        length, laid out like hexgrid.HexGrid. The definitions go clockwise
+        starting at the bottom of the lower left edge: first the left to
+        right lines, then the upper-right to lower-left ones, then the
+        lower-right to upper-left ones. Lines with None for a definition are
+        left out.
+
+        """
+        grid = HexGrid(sidelen, lambda: None)
+        tables = [line for direction in ("l2r", "ur2ll", "lr2ul")
+                for line in grid.lines[direction]]
+        if len(definitions) != len(tables):
+            raise ValueError("Expected {0} definitions for side length {1}, "
+                    "got {2}".format(len(tables), sidelen, len(definitions)))
+        return cls(len(grid.values), [(regexstr, cells)
+            for regexstr, cells in zip(definitions, tables)
+            if regexstr is not None])
+
+    @classmethod
+    def rectangular(cls, rows, columns):
+        """Builds the topology of a rectangular puzzle with a line for each
+        of the given rows, top to bottom, and columns, left to right. Cells
+        are numbered row by row.
+
+        Each row or column is given as a regex string, or as a list of regex
+        strings for puzzles with clues on both sides, which all have to
+        match. None leaves the line out.
+
+        """
+        height = len(rows)
+        width = len(columns)
+        lines = []
+        for r, regexes in enumerate(rows):
+            cells = range(r*width, (r+1)*width)
+            lines.extend((regexstr, cells) for regexstr in _clues(regexes))
+        for c, regexes in enumerate(columns):
+            cells = range(c, height*width, width)
+            lines.extend((regexstr, cells) for regexstr in _clues(regexes))
+        return cls(height*width, lines)
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Builds a topology from a JSON-able dict, with a "shape" key saying
+        which builder to use and its arguments:
+
+            {"shape": "hex", "sidelen": 7, "regexes": [...]}
+            {"shape": "rectangular", "rows": [...], "columns": [...]}
+            {"shape": "lines", "ncells": 5, "lines": [[regexstr, [cells]], ...]}
+
+        Raises ValueError if the dict doesn't describe a puzzle.
+
+        """
+        try:
+            shape = spec["shape"]
+            if shape == "hex":
+                return cls.hex(spec["sidelen"], spec["regexes"])
+            if shape == "rectangular":
+                return cls.rectangular(spec["rows"], spec["columns"])
+            if shape == "lines":
+                return cls(spec["ncells"], spec["lines"])
+        except (KeyError, TypeError) as e:
+            raise ValueError("Bad {0!r} topology: {1!r}".format(
+                spec.get("shape") if isinstance(spec, dict) else spec, e))
+        raise ValueError("Unknown shape {0!r}".format(shape))
+
+    def sizes(self):
+        """Returns a (regexstr, length) tuple for each line, as taken by
+        regexcrossword.compile_lines()
+
+        """
+        return [(regexstr, len(cells)) for regexstr, cells in self.lines]
+
+def _clues(regexes):
+    if regexes is None:
+        return []
+    if isinstance(regexes, str):
+        return [regexes]
+    return [regexstr for regexstr in regexes if regexstr is not None]
+
+class Board:
+    """The values of the cells of a puzzle, in a flat list, self.values,
+    indexed like the cells of a Topology. Changes made with set_value() or
+    scatter() can be rolled back.
+
+    """
+    def __init__(self, values):
+        self.values = list(values)
+
+        # Log of (index, old value) pairs for rollback(). None until the
+        # first checkpoint() call.
+        self._trail = None
+
+    def gather(self, cells):
+        """Returns a list of the values of the given cells"""
+        values = self.values
+        return [values[i] for i in cells]
+
+    def scatter(self, cells, newvalues):
+        """Replaces the values of the given cells with newvalues, like
+        calling set_value() on each. Values that don't change aren't logged.
+
+        """
+        values = self.values
+        trail = self._trail
+        for i, value in zip(cells, newvalues):
+            if trail is not None and value != values[i]:
+                trail.append((i, values[i]))
+            values[i] = value
+
+    def set_value(self, index, value):
+        """Replaces the value of the cell at the given index. Use this
+        instead of assigning to self.values directly to be able to roll the
+        change back.
+
+        """
+        if self._trail is not None:
+            self._trail.append((index, self.values[index]))
+        self.values[index] = value
+
+    def checkpoint(self):
+        """Starts logging changes made with set_value() and scatter(), and
+        returns a mark that can be passed to rollback() to undo every change
+        made after this call
+
+        """
+        if self._trail is None:
+            self._trail = []
+        return len(self._trail)
+
+    def rollback(self, mark):
+        """Undoes every change made since the checkpoint() call that returned
+        mark
+
+        """
+        trail = self._trail
+        values = self.values
+        while len(trail) > mark:
+            index, value = trail.pop()
+            values[index] = value
@@ -0,0 +1,740 @@
+#!/bin/env python3
+
+"""
+unrolled.py - Position-unrolled automaton engine.
+
+This is an alternative to the chain engine in nfsm.py. Instead of expanding a
+regex into every chain that could match it, the regex is compiled into a
+Thompson NFA, and that NFA is unrolled over the fixed line length into a
+layered DAG of (position, state) nodes. Memory and time are polynomial in the
+line length times the number of states, so patterns like .*H.*H.* don't blow
+up the way they do when enumerated as chains.
+
+Backreferences are compiled into equalities between slots. The DAG is split
+into branches, one for each set of (slot i == slot j) equalities the paths
+through it must meet, and each branch has its equal slots narrowed to the
+characters they have in common whenever it is pruned.
+"""
+
+import regexparse
+from nfsm import NFSM, Charsets
+
+def _tied(node, referenced):
+    """Returns True if there is a backreference or a group in referenced
+    anywhere in the given node
+
+    """
+    if isinstance(node, regexparse.Backref):
+        return True
+    if isinstance(node, regexparse.Group) and node.index in referenced:
+        return True
+    children = ()
+    if isinstance(node, regexparse.Concat):
+        children = node.items
+    elif isinstance(node, regexparse.Alt):
+        children = node.options
+    elif isinstance(node, (regexparse.Repeat, regexparse.Group)):
+        children = (node.item,)
+    return any(_tied(child, referenced) for child in children)
+
+def _spans(node, referenced, length, memo):
+    """Returns a copy of the given parse tree in which each part that
+    _tied() is False for is replaced by one run of dots for each length up
+    to length it can match. Only the slots the referenced groups and the
+    backreferences match are left to tell matches apart, so the copy
+    matches a string in as many ways as there are sets of equal slots.
+    memo is passed to NFSM._count().
+
+    """
+    if not _tied(node, referenced):
+        counts = NFSM._count(node, length, memo, referenced)
+        dot = regexparse.Chars("")
+        runs = [regexparse.Concat([dot] * n)
+                for n, count in enumerate(counts) if count]
+        # A node that matches nothing that fits becomes one that is too long
+        return regexparse.Alt(runs) if runs else \
+                regexparse.Concat([dot] * (length + 1))
+    if isinstance(node, regexparse.Group):
+        return regexparse.Group(node.index,
+                _spans(node.item, referenced, length, memo))
+    if isinstance(node, regexparse.Concat):
+        # Neighboring items that aren't tied make one run, so that how it
+        # is split between them doesn't count
+        items = []
+        free = []
+        for item in node.items:
+            if _tied(item, referenced):
+                if free:
+                    items.append(_spans(regexparse.Concat(free), referenced,
+                        length, memo))
+                    free = []
+                items.append(_spans(item, referenced, length, memo))
+            else:
+                free.append(item)
+        if free:
+            items.append(_spans(regexparse.Concat(free), referenced, length,
+                memo))
+        return regexparse.Concat(items)
+    if isinstance(node, regexparse.Alt):
+        # Likewise, the options that aren't tied make one run
+        options = [_spans(option, referenced, length, memo)
+                for option in node.options if _tied(option, referenced)]
+        free = [option for option in node.options
+                if not _tied(option, referenced)]
+        if free:
+            options.append(_spans(regexparse.Alt(free), referenced, length,
+                memo))
+        return regexparse.Alt(options)
+    if isinstance(node, regexparse.Repeat):
+        return regexparse.Repeat(_spans(node.item, referenced, length, memo),
+                node.least, node.most)
+    return node
+
+class ThompsonNFA:
+    """A Thompson-style NFA built from a regex, with epsilon transitions
+    already eliminated.
+
+    States are numbered. A "consuming" state is one that matches exactly one
+    character from its label (a slot value, see nfsm.Charsets). Groups that
+    are referenced by a backreference get a marker state where they open and
+    one where they close, and each backreference is a state of its own. These
+    are the "stop" states: each has exactly one transition out, and for each
+    we record which stop states can follow it, and whether the match may end
+    right after it. Without backreferences, every stop state is a consuming
+    state.
+
+    Attributes of interest after construction:
+    * labels: dict mapping each consuming state to its slot value
+    * markers: dict mapping each marker state to an ("open", group number)
+      or ("close", group number) tuple
+    * refs: dict mapping each backreference state to its group number
+    * starts: tuple of the stop states that can come first
+    * successors: dict mapping each stop state to a tuple of the stop states
+      that can come after it
+    * accepting: frozenset of stop states the match may end right after
+    * nullable: True if the regex matches the empty string
+
+    If maxlen is given, the NFA only has to be right for strings of up to
+    that many characters, which lets counted repeats be cut down.
+
+    """
+    def __init__(self, regex, charsets, maxlen=None):
+        self.charsets = charsets
+        self.maxlen = maxlen
+
+        # Raw Thompson construction. _edges holds the epsilon transitions out
+        # of each state. Consuming states have a label and exactly one
+        # transition, stored in _next.
+        self._edges = []
+        self._next = {}
+        self.labels = {}
+        self.markers = {}
+        self.refs = {}
+
+        tree = regexparse.parse(regex, charsets.alphabet)
+        self._referenced = regexparse.referenced_groups(tree)
+        start, end = self._build(tree)
+
+        # Now eliminate the epsilon transitions
+        closures = {}
+        def closure(state):
+            # Returns the stop states reachable from the given state through
+            # epsilon transitions, and whether the end state is reachable.
+            if state not in closures:
+                stops = []
+                accepts = False
+                seen = {state}
+                stack = [state]
+                while stack:
+                    s = stack.pop()
+                    if s in self._next:
+                        stops.append(s)
+                        continue
+                    if s == end:
+                        accepts = True
+                    for t in self._edges[s]:
+                        if t not in seen:
+                            seen.add(t)
+                            stack.append(t)
+                closures[state] = (tuple(sorted(stops)), accepts)
+            return closures[state]
+
+        self.starts, self.nullable = closure(start)
+        self.successors = {}
+        accepting = set()
+        for state, nextstate in self._next.items():
+            self.successors[state], accepts = closure(nextstate)
+            if accepts:
+                accepting.add(state)
+        self.accepting = frozenset(accepting)
+
+        # Not needed any more
+        del self._edges, self._next, self._referenced
+
+    def _new_state(self, label=None):
+        self._edges.append([])
+        state = len(self._edges) - 1
+        if label is not None:
+            self.labels[state] = label
+        return state
+
+    # _build() returns a fragment for a node of the parse tree (see
+    # regexparse): a (start, end) tuple of states. The end state never has
+    # outgoing edges until the fragment is connected to something else. Each
+    # call makes new states, so a node can be built more than once.
+
+    def _build(self, node):
+        if isinstance(node, regexparse.Chars):
+            start = self._new_state(self.charsets.encode(node.chars))
+            end = self._new_state()
+            self._next[start] = end
+            return start, end
+
+        if isinstance(node, regexparse.Group):
+            if node.index not in self._referenced:
+                return self._build(node.item)
+            start = self._new_state()
+            self.markers[start] = ("open", node.index)
+            fstart, fend = self._build(node.item)
+            self._next[start] = fstart
+            close = self._new_state()
+            self.markers[close] = ("close", node.index)
+            self._edges[fend].append(close)
+            end = self._new_state()
+            self._next[close] = end
+            return start, end
+
+        if isinstance(node, regexparse.Backref):
+            start = self._new_state()
+            self.refs[start] = node.index
+            end = self._new_state()
+            self._next[start] = end
+            return start, end
+
+        if isinstance(node, regexparse.Concat):
+            start = end = self._new_state()
+            for item in node.items:
+                fstart, fend = self._build(item)
+                self._edges[end].append(fstart)
+                end = fend
+            return start, end
+
+        if isinstance(node, regexparse.Alt):
+            start = self._new_state()
+            end = self._new_state()
+            for option in node.options:
+                fstart, fend = self._build(option)
+                self._edges[start].append(fstart)
+                self._edges[fend].append(end)
+            return start, end
+
+        if isinstance(node, regexparse.Repeat):
+            # The required repeats one after the other, then either a loop
+            # or the optional repeats, each of which may be skipped. That's
+            # linear in the repeat counts, which are first cut down to what
+            # could fit in maxlen characters.
+            least, most = node.least, node.most
+            if self.maxlen is not None:
+                cap = self.maxlen
+                if node.item.minlen:
+                    cap //= node.item.minlen
+                if least > cap:
+                    if node.item.minlen:
+                        # Can't ever fit. Leave the end unreachable.
+                        return self._new_state(), self._new_state()
+                    # The extra required repeats can only be empty
+                    least = cap
+                if most is not None:
+                    most = min(most, max(least, cap))
+
+            start = end = self._new_state()
+            for _ in range(least):
+                fstart, fend = self._build(node.item)
+                self._edges[end].append(fstart)
+                end = fend
+            if most is None:
+                fstart, fend = self._build(node.item)
+                loopend = self._new_state()
+                self._edges[end].extend((fstart, loopend))
+                self._edges[fend].extend((fstart, loopend))
+                end = loopend
+            else:
+                for _ in range(most - least):
+                    fstart, fend = self._build(node.item)
+                    optend = self._new_state()
+                    self._edges[end].extend((fstart, optend))
+                    self._edges[fend].append(optend)
+                    end = optend
+            return start, end
+
+        raise TypeError("Unknown parse tree node {0!r}".format(node))
+
+class UnrolledNFA:
+    """Matches strings of a fixed length against a regex, like nfsm.NFSM, but
+    represented as a layered DAG instead of a list of chains.
+
+    Layer i holds the NFA states that could match character i of the string,
+    each with its own slot value. A node (i, state) survives only if it lies
+    on a path from a start state at layer 0 to an accepting state at the last
+    layer. Constraining slot i narrows the values of the nodes in layer i and
+    drops the empty ones, which removes their edges. Peeking a slot unions the
+    values of the surviving nodes in that layer.
+
+    A regex with backreferences is unrolled by _unroll_refs() instead, into
+    nodes that each belong to one branch of the DAG. Every path through a
+    branch has the same slots equal to each other because of backreferences,
+    listed in self._equalities, and the layer 0 nodes of the branch map to
+    them in self._pairs. Pruning also narrows the equal slots of each branch
+    to the characters they have in common, which is exact once every slot is
+    down to one character, but may leave extra characters before that.
+
+    The public interface is the same as NFSM, except there is no chains
+    attribute.
+
+    """
+    # Only set for regexes with backreferences. self._equalities is a list
+    # with a (pairs, members) tuple for each branch with equal slots: pairs
+    # is a tuple of (i, j) tuples of slots that are equal, and members is a
+    # list with the nodes of the branch in each layer. self._pairs maps each
+    # layer 0 node of those branches to its pairs.
+    _equalities = ()
+    _pairs = {}
+
+    def __init__(self, regex, length, alphabet, bitmask=False):
+        self.length = length
+        self.charsets = Charsets(alphabet, bitmask)
+        self.alphabet = self.charsets.alphabet
+
+        nfa = ThompsonNFA(regex, self.charsets, length)
+        self._trail = None
+        self._dirty = True
+        if nfa.markers or nfa.refs:
+            self._unroll_refs(nfa)
+            self._prune()
+            return
+
+        self._successors = nfa.successors
+        self._accepting = nfa.accepting
+        self._nullable = nfa.nullable
+
+        # self.layers is a list with one dict per slot, mapping each surviving
+        # state in that layer to its slot value. Start with every state in
+        # every layer and let _prune() drop the unreachable ones.
+        self.layers = []
+        if length:
+            self.layers.append({s: nfa.labels[s] for s in nfa.starts})
+        for _ in range(length-1):
+            self.layers.append(dict(nfa.labels))
+        self._prune()
+
+    @staticmethod
+    def estimate_branches(regex, length, alphabet):
+        """Returns an estimate of the number of branches (see above) the
+        regex unrolls into for a line of the given length, without unrolling
+        anything: 1 for a regex without backreferences, and otherwise the
+        number of ways the referenced groups and the backreferences can be
+        laid out over the line, counted like NFSM.estimate_chains(). Each
+        branch has nodes in every layer, so memory grows with the number of
+        branches times the length.
+
+        """
+        tree = regexparse.parse(regex, alphabet)
+        referenced = regexparse.referenced_groups(tree)
+        if not referenced:
+            return 1
+        memo = {}
+        return NFSM._count(_spans(tree, referenced, length, memo), length,
+                {}, referenced)[length]
+
+    def _unroll_refs(self, nfa):
+        """Unrolls an NFA with backreferences (see ThompsonNFA) into numbered
+        nodes, filling in self.layers and the rest like __init__ does.
+
+        The NFA is first walked forward from the start. A node of the walk is
+        a (state, offset, groups, pairs) tuple at some slot: a consuming
+        state, or a backreference state matching character offset of its
+        group. groups is a tuple of (group number, start, end) tuples with
+        the slots the referenced groups matched so far, end being None while
+        the group is open, and pairs is a tuple of the (slot, earlier slot)
+        equalities met on the way. Then every node is numbered once for each
+        set of equalities it can end the match with, which makes the
+        branches.
+
+        """
+        length = self.length
+        successors = nfa.successors
+        accepting = nfa.accepting
+
+        def advance(pos, states, groups, pairs, nodes, ends, seen=None):
+            # Adds the nodes that can match slot pos after the given stop
+            # states to nodes, following markers and empty references. Adds
+            # pairs to ends if the match can end at pos. seen holds the
+            # (state, groups, pairs) stops already followed at pos, so loops
+            # of markers and empty references end.
+            if seen is None:
+                seen = set()
+            for state in states:
+                if (state, groups, pairs) in seen:
+                    continue
+                seen.add((state, groups, pairs))
+                if state in nfa.labels:
+                    nodes.add((state, 0, groups, pairs))
+                    continue
+                newgroups = dict((g, (start, end)) for g, start, end in groups)
+                if state in nfa.markers:
+                    kind, g = nfa.markers[state]
+                    newgroups[g] = (pos, None) if kind == "open" else \
+                            (newgroups[g][0], pos)
+                    newgroups = tuple(sorted((g, start, end)
+                        for g, (start, end) in newgroups.items()))
+                else:
+                    start, end = newgroups.get(nfa.refs[state], (None, None))
+                    if end is None:
+                        # A reference to a group that didn't take part in
+                        # the match matches nothing
+                        continue
+                    if end > start:
+                        nodes.add((state, 0, groups, pairs + ((pos, start),)))
+                        continue
+                    newgroups = groups
+                if state in accepting:
+                    ends.add(pairs)
+                advance(pos, successors[state], newgroups, pairs, nodes, ends,
+                        seen)
+
+        # walk[i] maps each node at slot i to a tuple of the nodes following
+        # it, and the set of pairs it can end the match with
+        walk = []
+        nodes = set()
+        ends = set()
+        if nfa.nullable:
+            ends.add(())
+        advance(0, nfa.starts, (), (), nodes, ends)
+        self._nullable = not length and bool(ends)
+        for pos in range(length):
+            layer = {}
+            nextnodes = set()
+            for node in nodes:
+                state, offset, groups, pairs = node
+                following = set()
+                nodeends = set()
+                if state in nfa.refs:
+                    _, start, end = next(group for group in groups
+                            if group[0] == nfa.refs[state])
+                    if start + offset + 1 < end:
+                        following.add((state, offset + 1, groups,
+                            pairs + ((pos + 1, start + offset + 1),)))
+                    else:
+                        if state in accepting:
+                            nodeends.add(pairs)
+                        advance(pos + 1, successors[state], groups, pairs,
+                                following, nodeends)
+                else:
+                    if state in accepting:
+                        nodeends.add(pairs)
+                    advance(pos + 1, successors[state], groups, pairs,
+                            following, nodeends)
+                if pos < length - 1:
+                    layer[node] = (tuple(following), ())
+                    nextnodes.update(following)
+                else:
+                    layer[node] = ((), nodeends)
+            walk.append(layer)
+            nodes = nextnodes
+
+        # finals[i] maps each node at slot i to the set of pairs it can end
+        # the match with, going backward
+        finals = [None] * length
+        for pos in range(length-1, -1, -1):
+            finals[pos] = {}
+            for node, (following, nodeends) in walk[pos].items():
+                reached = set(nodeends)
+                for nextnode in following:
+                    reached.update(finals[pos+1].get(nextnode, ()))
+                if reached:
+                    finals[pos][node] = reached
+
+        # Number the nodes of each branch
+        numbers = {}
+        self.layers = [{} for _ in range(length)]
+        self._successors = {}
+        branches = {}
+        for pos in range(length):
+            for node, reached in finals[pos].items():
+                state = node[0]
+                value = nfa.labels[state] if state in nfa.labels else \
+                        self.charsets.full
+                for pairs in reached:
+                    number = numbers[(pos, node, pairs)] = len(numbers)
+                    self.layers[pos][number] = value
+                    if pairs:
+                        members = branches.setdefault(pairs,
+                                [[] for _ in range(length)])
+                        members[pos].append(number)
+        for pos in range(length):
+            for node, reached in finals[pos].items():
+                following = walk[pos][node][0]
+                for pairs in reached:
+                    self._successors[numbers[(pos, node, pairs)]] = tuple(
+                            numbers[(pos+1, nextnode, pairs)]
+                            for nextnode in following
+                            if pairs in finals[pos+1].get(nextnode, ()))
+        self._accepting = frozenset(self.layers[-1]) if length else frozenset()
+
+        # The equalities only ever name slots matched in the same branch, so
+        # the pairs can be sorted and deduplicated
+        self._equalities = []
+        self._pairs = {}
+        for pairs, members in branches.items():
+            unique = tuple(sorted(set(pairs)))
+            self._equalities.append((unique, members))
+            for number in members[0]:
+                self._pairs[number] = unique
+
+    def _prune(self):
+        """Drops every node that isn't on a path from the first layer to an
+        accepting state in the last layer, and narrows the equal slots of
+        each branch, until neither changes anything
+
+        """
+        while self._dirty:
+            self._dirty = False
+            self._prune_paths()
+            if self._equalities:
+                self._equalize()
+
+    def _prune_paths(self):
+        """Drops every node that isn't on a path from the first layer to an
+        accepting state in the last layer, with one forward and one backward
+        pass over the layers
+
+        """
+        layers = self.layers
+        successors = self._successors
+
+        # Forward pass. Layer 0 only ever holds start states.
+        for i in range(1, len(layers)):
+            reachable = set()
+            for state in layers[i-1]:
+                reachable.update(successors[state])
+            for state in [s for s in layers[i] if s not in reachable]:
+                self._remove(i, state)
+
+        # Backward pass
+        if layers:
+            for state in [s for s in layers[-1] if s not in self._accepting]:
+                self._remove(len(layers)-1, state)
+        for i in range(len(layers)-2, -1, -1):
+            nextlayer = layers[i+1]
+            for state in [s for s in layers[i]
+                    if not any(t in nextlayer for t in successors[s])]:
+                self._remove(i, state)
+
+    def _equalize(self):
+        """Narrows the nodes of each branch in slots that must be equal to
+        the characters the slots have in common in that branch. Sets
+        self._dirty if a node was dropped.
+
+        """
+        layers = self.layers
+        trail = self._trail
+        empty = self.charsets.empty
+        for pairs, members in self._equalities:
+            changed = True
+            while changed:
+                changed = False
+                for i, j in pairs:
+                    common = [empty, empty]
+                    for k, index in enumerate((i, j)):
+                        layer = layers[index]
+                        for state in members[index]:
+                            if state in layer:
+                                common[k] |= layer[state]
+                    common = common[0] & common[1]
+                    for index in (i, j):
+                        layer = layers[index]
+                        for state in members[index]:
+                            if state not in layer:
+                                continue
+                            value = layer[state]
+                            newvalue = value & common
+                            if newvalue == value:
+                                continue
+                            changed = True
+                            if trail is not None:
+                                trail.append((index, state, value))
+                            if newvalue:
+                                layer[state] = newvalue
+                            else:
+                                del layer[state]
+                                self._dirty = True
+
+    def _remove(self, index, state):
+        if self._trail is not None:
+            self._trail.append((index, state, self.layers[index][state]))
+        del self.layers[index][state]
+
+    def encode(self, chars):
+        """Returns the slot value for the given collection of characters"""
+        return self.charsets.encode(chars)
+
+    def decode(self, value):
+        """Returns the set of characters for the given slot value"""
+        return self.charsets.decode(value)
+
+    def constrain_slot(self, index, charset):
+        """Narrows the given slot to the given set of characters. See
+        NFSM.constrain_slot()
+
+        """
+        charset = self.charsets.encode(charset)
+        layer = self.layers[index]
+        trail = self._trail
+        for state, value in list(layer.items()):
+            newvalue = value & charset
+            if newvalue == value:
+                continue
+            if trail is not None:
+                trail.append((index, state, value))
+            if newvalue:
+                layer[state] = newvalue
+                if self._equalities:
+                    # Other slots may be equal to this one
+                    self._dirty = True
+            else:
+                del layer[state]
+                self._dirty = True
+
+    def checkpoint(self):
+        """Starts logging changes, and returns a mark that can be passed to
+        rollback() to undo every change made after this call
+
+        """
+        if self._trail is None:
+            self._trail = []
+        return (len(self._trail), self._dirty)
+
+    def rollback(self, mark):
+        """Undoes every change made since the checkpoint() call that returned
+        mark. Takes time proportional to the number of changes undone.
+
+        """
+        length, self._dirty = mark
+        trail = self._trail
+        while len(trail) > length:
+            index, state, value = trail.pop()
+            self.layers[index][state] = value
+
+    def peek_slot(self, index):
+        """Returns the characters that are still possible in the given slot.
+        See NFSM.peek_slot()
+
+        """
+        self._prune()
+        candidates = 0 if self.charsets.bitmask else set()
+        for value in self.layers[index].values():
+            candidates |= value
+        return candidates
+
+    def match(self, matchstr):
+        """Returns True if the given string matches this regex and the
+        constraints placed on it. Doesn't change any state.
+
+        """
+        if len(matchstr) != self.length:
+            return False
+        if not self.length:
+            return self._nullable
+
+        keys = self.charsets.keys
+        if not all(c in keys for c in matchstr):
+            return False
+
+        contains = self.charsets.contains
+        current = [s for s, value in self.layers[0].items()
+                if contains(value, keys[matchstr[0]])
+                and self._pairs_match(s, matchstr)]
+        for layer, c in zip(self.layers[1:], matchstr[1:]):
+            key = keys[c]
+            nextstates = set()
+            for state in current:
+                for t in self._successors[state]:
+                    if t in layer and contains(layer[t], key):
+                        nextstates.add(t)
+            current = nextstates
+        return any(s in self._accepting for s in current)
+
+    def _pairs_match(self, state, matchstr):
+        """Returns True if the given string has the same character in every
+        pair of equal slots of the branch of the given layer 0 node
+
+        """
+        return all(matchstr[i] == matchstr[j]
+                for i, j in self._pairs.get(state, ()))
+
+    def match_many(self, strings):
+        """Returns an iterator of True or False for each of the given strings,
+        like calling match() on each.
+
+        The set of states allowing each character in each layer is looked up
+        once and shared by the whole batch. Don't constrain this object while
+        iterating.
+
+        """
+        self._prune()
+        if not self.length:
+            for matchstr in strings:
+                yield matchstr == "" and self._nullable
+            return
+
+        members = self.charsets.members
+        tables = []
+        for layer in self.layers:
+            table = {}
+            for state, value in layer.items():
+                for key in members(value):
+                    table.setdefault(key, set()).add(state)
+            tables.append(table)
+
+        keys = self.charsets.keys
+        successors = self._successors
+        empty = frozenset()
+        for matchstr in strings:
+            if len(matchstr) != self.length:
+                yield False
+                continue
+            # Every layer is pruned, so anything reaching the last layer is
+            # accepting
+            current = tables[0].get(keys.get(matchstr[0]), empty)
+            if self._pairs:
+                current = {s for s in current if self._pairs_match(s, matchstr)}
+            for table, c in zip(tables[1:], matchstr[1:]):
+                if not current:
+                    break
+                allowed = table.get(keys.get(c), empty)
+                current = {t for state in current for t in successors[state]
+                        if t in allowed}
+            yield bool(current)
+
+    def copy(self):
+        """Makes a copy of this object, including any constraints already
+        applied
+
+        """
+        newobj = self.__class__.__new__(self.__class__)
+        newobj.__dict__.update(self.__dict__)
+        # Slot values are immutable and the NFA structure is never modified,
+        # so only the layer dicts need copying. The copy starts without a
+        # trail, so it can't roll back past this point.
+        newobj.layers = [dict(layer) for layer in self.layers]
+        newobj._trail = None
+        return newobj
+
+    def __str__(self):
+        """Returns a string showing the possible characters in each slot.
+        Unlike NFSM this is not an exact description of what matches, since
+        slots are not independent of each other.
+
+        """
+        return "".join(self.charsets.format(self.peek_slot(i))
+                for i in range(self.length))